@@ -3,6 +3,6 @@ __version__ = version(__package__)
 
 from .config import Config
 from .manager import JobManager
-from .job import Job
+from .job import Job, JobSummary
 from .models import JobState, ResourceSpec, BackendConfig, JobSpec, Callback
 from .exceptions import AnException, InvalidJobException, SubmitException
@@ -0,0 +1,317 @@
+""" Compaction of finished jobs into archive packs.
+
+    Each pack is a zip file, `prefix/.archive/YYYY-MM-DD.zip`
+    (or `YYYY-MM.zip` for monthly packs), holding the complete
+    directories of all archived jobs whose stamps fall in that period:
+
+        <stamp>/spec.json
+        <stamp>/status.csv (binary status logs are stored as csv)
+        <stamp>/log/...
+        <stamp>/work/...   (only if the work dir was inside the job)
+
+    The zip's central directory serves as the pack's index,
+    so archived jobs can be listed and read without extracting them.
+"""
+
+from typing import Dict, List, Optional, Tuple, Literal
+import os
+import re
+import shutil
+import zipfile
+from fcntl import flock, LOCK_EX
+import calendar
+from pathlib import Path
+from functools import lru_cache
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+import logging
+_logger = logging.getLogger(__name__)
+
+from .models import JobSpec, JobState
+from .statfile import parse_rows, read_policy, CreateLock
+from .statbin import (
+    BIN_NAME,
+    INFO_NAME,
+    is_binary,
+    read_rows_sync,
+    read_last_status_sync,
+    to_csv,
+)
+from .layout import Layout, scan_all, shard
+
+ARCHIVE_DIR = ".archive"
+
+Period = Literal["day", "month"]
+PERIODS : Tuple[Period, ...] = ("day", "month")
+
+_pack_re = re.compile(r'^([0-9]{4})-([0-9]{2})(?:-([0-9]{2}))?\.zip$')
+
+def pack_name(stamp: str, period: Period) -> str:
+    """ Name of the pack holding stamp.
+    """
+    day = shard(stamp).replace('/', '-')
+    if period == "month":
+        return day[:7] + ".zip"
+    return day + ".zip"
+
+def pack_span(name: str) -> Optional[Tuple[float, float]]:
+    """ The range of times [lo, hi) covered by a pack file name.
+    """
+    m = _pack_re.match(name)
+    if m is None:
+        return None
+    y, mo = int(m[1]), int(m[2])
+    if m[3] is not None:
+        lo = calendar.timegm((y, mo, int(m[3]), 0, 0, 0))
+        return lo, lo + 86400
+    y1, mo1 = (y+1, 1) if mo == 12 else (y, mo+1)
+    return calendar.timegm((y, mo, 1, 0, 0, 0)), \
+           calendar.timegm((y1, mo1, 1, 0, 0, 0))
+
+class Pack:
+    """ Read access to one archive pack.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Pack) and self.path == other.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def _zip(self) -> zipfile.ZipFile:
+        st = os.stat(self.path)
+        return _open_zip(self.path, st.st_mtime_ns, st.st_size)
+
+    def stamps(self) -> List[str]:
+        """ Stamps of all jobs held in this pack.
+        """
+        return [ name[:-len("/status.csv")]
+                 for name in self._zip().namelist()
+                 if name.endswith("/status.csv") and name.count("/") == 1 ]
+
+    def has(self, stamp: str) -> bool:
+        try:
+            self._zip().getinfo(f"{stamp}/status.csv")
+        except KeyError:
+            return False
+        return True
+
+    def read(self, stamp: str, name: str) -> bytes:
+        """ Read the file, `name` (relative to the job's base),
+            of an archived job.
+        """
+        zf = self._zip()
+        with _zip_lock:
+            return zf.read(f"{stamp}/{name}")
+
+    def read_text(self, stamp: str, name: str) -> str:
+        return self.read(stamp, name).decode('utf-8')
+
+    def rows(self, stamp: str, maxcol=4) -> List[List[str]]:
+        """ The rows of an archived job's status.csv.
+        """
+        return parse_rows(self.read_text(stamp, 'status.csv').splitlines(),
+                          maxcol)
+
+    def mtime_ns(self) -> int:
+        return os.stat(self.path).st_mtime_ns
+
+# ZipFile-s are kept open, so that each pack's central directory
+# is only parsed once (until the pack changes).
+_zip_lock = Lock()
+
+@lru_cache(maxsize=32)
+def _open_zip(path: Path, mtime_ns: int, size: int) -> zipfile.ZipFile:
+    return zipfile.ZipFile(path, 'r')
+
+def packs(prefix: Path,
+          since: Optional[float] = None,
+          until: Optional[float] = None) -> List[Pack]:
+    """ All packs of prefix covering times in [since, until).
+    """
+    ans = []
+    try:
+        names = sorted(os.listdir(prefix / ARCHIVE_DIR))
+    except FileNotFoundError:
+        return []
+    for name in names:
+        span = pack_span(name)
+        if span is None:
+            continue
+        if (since is not None and span[1] <= since) or \
+           (until is not None and span[0] >= until):
+            continue
+        ans.append( Pack(prefix / ARCHIVE_DIR / name) )
+    return ans
+
+def catalog(prefix: Path,
+            since: Optional[float] = None,
+            until: Optional[float] = None
+           ) -> Dict[str, Pack]:
+    """ Map from stamp to pack for all archived jobs
+        in packs covering [since, until).
+    """
+    ans : Dict[str, Pack] = {}
+    for pack in packs(prefix, since, until):
+        for stamp in pack.stamps():
+            ans[stamp] = pack
+    return ans
+
+def find_pack(prefix: Path, stamp: str) -> Optional[Pack]:
+    """ The pack holding the job, stamp, if it has been archived.
+    """
+    try:
+        names = [ pack_name(stamp, p) for p in PERIODS ]
+    except ValueError: # not a stamp
+        return None
+    for name in names:
+        path = prefix / ARCHIVE_DIR / name
+        if path.is_file():
+            pack = Pack(path)
+            if pack.has(stamp):
+                return pack
+    return None
+
+def _work_inside(jobdir: Path) -> bool:
+    """ Is the job's work directory inside jobdir?
+    """
+    try:
+        spec = JobSpec.model_validate_json(
+                    (jobdir/'spec.json').read_text(encoding='utf-8'))
+    except Exception:
+        return False
+    if spec.directory is None:
+        return False
+    rel = os.path.relpath(spec.directory, jobdir)
+    return not rel.startswith(os.pardir)
+
+def _pack_jobs(path: Path, jobdirs: List[Path]) -> List[Path]:
+    """ Add jobdirs to the pack at path.
+
+        The pack is rewritten -- its old members plus the new
+        jobs -- to a temporary file, which is synced and then
+        renamed over the pack, so a crash never leaves a damaged
+        pack behind.  An flock on `.archive/.<pack>.lock`
+        serializes concurrent writers of the same pack
+        (or, in "append" status mode, a CreateLock
+        of `.archive/.<pack>.held`).
+
+        Returns the list of jobs the new pack holds.
+    """
+    path.parent.mkdir(exist_ok=True)
+    if read_policy(path.parent.parent).mode == "append":
+        with CreateLock(path.parent / f".{path.name}.held"):
+            return _replace_pack(path, jobdirs)
+    with open(path.parent / f".{path.name}.lock", "a") as lockf:
+        flock(lockf.fileno(), LOCK_EX)
+        return _replace_pack(path, jobdirs)
+
+def _replace_pack(path: Path, jobdirs: List[Path]) -> List[Path]:
+    """ Rewrite the pack at path, adding jobdirs (with its lock held).
+    """
+    tmp = path.parent / f".{path.name}.{os.getpid()}.tmp"
+    try:
+        done = _write_pack(path, tmp, jobdirs)
+        with zipfile.ZipFile(tmp, 'r') as zf:
+            names = set(zf.namelist())
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    dfd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
+
+    return [ jobdir for jobdir in done
+             if f"{jobdir.name}/status.csv" in names
+                 and f"{jobdir.name}/spec.json" in names ]
+
+def _write_pack(path: Path, tmp: Path, jobdirs: List[Path]) -> List[Path]:
+    """ Write the members of the pack at path (if any),
+        followed by jobdirs, into a new zip file, tmp.
+    """
+    policy = read_policy(path.parent.parent) # (prefix/.archive/name)
+    done = []
+    with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        present = set()
+        if path.exists():
+            with zipfile.ZipFile(path, 'r') as old:
+                for info in old.infolist():
+                    with old.open(info) as src, zf.open(info, 'w') as dst:
+                        shutil.copyfileobj(src, dst)
+                    present.add(info.filename)
+        for jobdir in jobdirs:
+            stamp = jobdir.name
+            if f"{stamp}/status.csv" in present:
+                _logger.warning("%s is already archived in %s.", stamp, path)
+                continue
+            if not (jobdir/'spec.json').is_file(): # archived meanwhile
+                continue
+            skip_work = not _work_inside(jobdir)
+            skip = set()
+            if is_binary(jobdir):
+                zf.writestr(f"{stamp}/status.csv",
+                            to_csv(read_rows_sync(jobdir, policy)))
+                skip = {BIN_NAME, INFO_NAME, "status.csv"}
+            for root, dirs, files in os.walk(jobdir):
+                rel = os.path.relpath(root, jobdir)
+                if rel == '.' and skip_work and 'work' in dirs:
+                    dirs.remove('work')
+                for fname in sorted(files):
+                    if rel == '.' and fname in skip:
+                        continue
+                    fpath = os.path.join(root, fname)
+                    if os.path.islink(fpath) or not os.path.isfile(fpath):
+                        continue
+                    arc = os.path.normpath(os.path.join(stamp, rel, fname))
+                    zf.write(fpath, arcname=arc)
+            done.append(jobdir)
+    return done
+
+def archive(prefix: Path, layout: Layout, older_than: float,
+            period: Period = "day", workers: int = 8) -> List[str]:
+    """ Move all jobs in a final state created before the time,
+        older_than, into archive packs.  Each pack is written
+        by one of up to `workers` threads.
+
+        Job directories are removed only after their pack
+        has been written, synced and moved into place.
+
+        Returns the list of archived stamps.
+    """
+    policy = read_policy(prefix)
+    groups : Dict[str, List[Path]] = {}
+    for jobdir in scan_all(prefix):
+        stamp = jobdir.name
+        if float(stamp) >= older_than:
+            continue
+        try:
+            step = read_last_status_sync(jobdir, policy)
+            if not JobState(step[2]).is_final():
+                continue
+        except Exception:
+            continue
+        groups.setdefault(pack_name(stamp, period), []).append(jobdir)
+
+    archived : List[str] = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = { name: pool.submit(_pack_jobs,
+                                      prefix/ARCHIVE_DIR/name, jobdirs)
+                    for name, jobdirs in groups.items() }
+        for name, fut in futures.items():
+            try:
+                done = fut.result()
+            except Exception as e:
+                _logger.error("Unable to write pack %s: %s", name, e)
+                continue
+            for jobdir in done:
+                shutil.rmtree(jobdir)
+                archived.append(jobdir.name)
+    archived.sort(key=float)
+    return archived
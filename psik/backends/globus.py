@@ -20,6 +20,7 @@ from ..models import (
     Transition,
 )
 from ..console import runcmd
+from ..statfile import parse_rows
 from ..zipstr import dir_to_str, str_to_dir
 
 def send_prefix(backend: BackendConfig) -> str:
@@ -58,6 +59,7 @@ def remote_submit(cfg: str,
     import asyncio
     import os
     import psik
+    from psik.layout import find_job
     from psik.logs import logfile
 
     config = psik.Config.model_validate_json(cfg)
@@ -69,7 +71,8 @@ def remote_submit(cfg: str,
     spec = psik.JobSpec.model_validate_json(jobspec)
 
     async def submit_job():
-        job = psik.Job(config.prefix / stamp)
+        # (in whichever layout the remote prefix uses)
+        job = psik.Job(find_job(config.prefix, stamp, config.layout))
         await job.base.mkdir(exist_ok=True, parents=True)
         # Ensure working directory exists.
         if spec.directory is None: # should always be True
@@ -90,26 +93,34 @@ def remote_submit(cfg: str,
 
     return asyncio.run(submit_job())
 
-def remote_cancel(rprefix: str, stamp: str):
+def remote_job(cfg: str, stamp: str):
+    """ Look up a job in the remote prefix (run on the remote side).
+    """
+    import asyncio
+    import psik
+
+    config = psik.Config.model_validate_json(cfg)
+    config.prefix = remote_prefix(str(config.prefix))
+    mgr = psik.JobManager(config)
+    return asyncio.run( mgr.job(stamp) )
+
+def remote_cancel(cfg: str, stamp: str):
     import asyncio
-    from psik import Job
     from psik.logs import logfile
 
-    prefix = remote_prefix(rprefix)
-    job = Job(prefix / stamp)
+    job = remote_job(cfg, stamp)
     with logfile(str(job.base/'log'/'console'), v=True, vv=False):
         asyncio.run( job.cancel() )
 
-def remote_poll(rprefix: str, stamp: str) -> Tuple[str,str,str]:
-    import asyncio
+def remote_poll(cfg: str, stamp: str) -> Tuple[str,str,str]:
+    from psik.statfile import csv_line
     from psik.zipstr import dir_to_str
 
-    prefix = remote_prefix(rprefix)
-    base = prefix/stamp
-    #job = asyncio.run( Job(prefix / stamp) )
-    hist = (base/"status.csv").read_text()
-    logs = dir_to_str(str(base/"log"))
-    data = dir_to_str(str(base/"work"))
+    # (read through Job, whatever the remote status log's format)
+    job = remote_job(cfg, stamp)
+    hist = "".join(csv_line(trs.fields()) for trs in job.history)
+    logs = dir_to_str(str(job.base/"log"))
+    data = dir_to_str(str(job.base/"work"))
 
     return hist, logs, data
 
@@ -168,13 +179,13 @@ async def cancel(job: Job) -> None:
         await job.read_info()
 
     backend = job.info.backend
-    rprefix = send_prefix(backend)
+    cfg = send_config(job.spec.backend, backend).model_dump_json()
     try:
         gclient = Client()
         with Executor( endpoint_id = backend.queue_name
                      , client = gclient
                      ) as gce:
-            future = gce.submit(remote_cancel, rprefix, job.stamp)
+            future = gce.submit(remote_cancel, cfg, job.stamp)
             _logger.info("Canceling %s", job.stamp)
             result = future.result()
     except Exception as err:
@@ -197,14 +208,13 @@ async def poll(job: Job) -> None:
 
     _logger.debug("Polling globus job.")
     backend = job.info.backend
-    rprefix = send_prefix(backend)
+    cfg = send_config(job.spec.backend, backend).model_dump_json()
     try:
-        # TODO: read job.spec to create remote_config
         gclient = Client()
         with Executor( endpoint_id = backend.queue_name
                      , client = gclient
                      ) as gce:
-            future = gce.submit(remote_poll, rprefix, job.stamp)
+            future = gce.submit(remote_poll, cfg, job.stamp)
             _logger.info("Canceling")
             hist, logs, data = future.result()
     except Exception as err:
@@ -213,16 +223,10 @@ async def poll(job: Job) -> None:
     str_to_dir(data, job.spec.directory)
     local_dir = Path(job.base)
 
-    updated = False
-    for line in hist.split("\n"):
-        step = line.strip().split(',', 3)
-        if len(step) <= 1:
-            continue
+    new : List[Transition] = []
+    for step in parse_rows(hist.split("\n")):
         try:
-            trs = Transition(time=float(step[0]),
-                             jobndx=int(step[1]),
-                             state=JobState(step[2]),
-                             info=str(step[3]))
+            trs = Transition.from_fields(step)
         except Exception as e:
             print("Invalid row in status.csv: %s"%step)
             continue
@@ -230,13 +234,12 @@ async def poll(job: Job) -> None:
         if key in events: # we already know about this transition
             print(f"x {trs}")
             continue
-        updated = True
         print(f"- {trs}")
         events.add(key)
-        await job.reached(trs.jobndx, trs.state, trs.info,
-                          backdate=trs.time)
+        new.append(trs)
+    await job.reached_many(new)
 
-    if not updated:
+    if len(new) == 0:
         _logger.info("No state updates. Skipping file refresh.")
         return
     # FIXME: rename remote console to console.1 locally
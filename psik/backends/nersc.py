@@ -20,6 +20,9 @@ from ..models import (
     Transition,
 )
 from ..console import runcmd
+from ..statfile import parse_rows
+from ..statbin import CSV_NAME
+from ..layout import LAYOUTS, job_path
 from ..zipstr import dir_to_str
 
 from .slurm import mk_args
@@ -74,6 +77,16 @@ exec "%(venv)s/bin/psik" hot-start --config %(venv)s/etc/psik.json %(stamp)s %(j
 def quote(s: str) -> str:
     return s
 
+def mk_remote_config(job: Job) -> Config:
+    """ The psik config used on the remote side.
+    """
+    # TODO: gather settings from job.info.backend.attributes
+    remote_prefix = "$SCRATCH/psik"
+    return Config(prefix=Path(remote_prefix),
+                  backends={
+                      job.spec.backend: BackendConfig()
+                  })
+
 async def submit(job: Job, jobndx: int) -> Optional[str]:
     """
     Create a templated run-script and send it
@@ -89,12 +102,7 @@ async def submit(job: Job, jobndx: int) -> Optional[str]:
     else:
         slurm_opts = ""
 
-    # TODO: gather settings from job.info.backend.attributes
-    remote_prefix = "$SCRATCH/psik"
-    remote_config = Config(prefix=Path(remote_prefix),
-                           backends={
-                               job.spec.backend: BackendConfig()
-                           })
+    remote_config = mk_remote_config(job)
     machine_id = Machine["perlmutter"]
     remote_venv = "$HOME/venv"
 
@@ -242,14 +250,20 @@ async def poll(job: Job) -> None:
         # TODO: allow job.info.backend to customize psik_prefix
 
         local_dir = Path(job.base)
-        remote_dir = psik_prefix / job.stamp
-
         machine: AsyncCompute = await client.compute(machine_id)
 
-        try:
-            status_l = await machine.ls(str(remote_dir/"status.csv"))
-        except SfApiError:
-            status_l = []
+        # Find the job in the remote prefix, trying its configured
+        # layout first (as psik.layout.find_job does locally).
+        # Its config sets the (default) csv status format.
+        layout = mk_remote_config(job).layout
+        status_l = []
+        for lay in (layout,) + tuple(l for l in LAYOUTS if l != layout):
+            remote_dir = job_path(psik_prefix, job.stamp, lay)
+            try:
+                status_l = await machine.ls(str(remote_dir/CSV_NAME))
+            except SfApiError:
+                continue
+            break
 
         if not (len(status_l) == 1 and await status_l[0].is_file()):
             _logger.warning("Job has not been created on remote.")
@@ -259,22 +273,16 @@ async def poll(job: Job) -> None:
                 _logger.error("Job failed to start:\n%s", console)
             return None
 
-        history = [ line.strip().split(',', 3) for line in (
-                        await readlines(status_l[0])
-                    )
-                  ]
+        history = parse_rows(await readlines(status_l[0]))
         # filter events we have seen
         events: Set[Tuple[int,JobState]] = set()
         for trs in job.history:
             events.add( (trs.jobndx, trs.state) )
 
-        updated = False
+        new : List[Transition] = []
         for step in history:
             try:
-                trs = Transition(time=float(step[0]),
-                                 jobndx=int(step[1]),
-                                 state=JobState(step[2]),
-                                 info=str(step[3]))
+                trs = Transition.from_fields(step)
             except Exception as e:
                 print("Invalid row in status.csv: %s"%step)
                 continue
@@ -282,13 +290,12 @@ async def poll(job: Job) -> None:
             if key in events: # we already know about this transition
                 print(f"x {trs}")
                 continue
-            updated = True
             print(f"- {trs}")
             events.add(key)
-            await job.reached(trs.jobndx, trs.state, trs.info,
-                              backdate=trs.time)
+            new.append(trs)
+        await job.reached_many(new)
 
-        if not updated:
+        if len(new) == 0:
             _logger.info("No state updates. Skipping file refresh.")
             return
         await mirror_dir(machine, remote_dir/"log", local_dir/"log",
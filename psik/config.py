@@ -1,12 +1,15 @@
-from typing import Union, Dict
+from typing import Union, Dict, Optional
 from functools import cache
 import os
 import sys
 from pathlib import Path
 
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_validator
 
 from .models import BackendConfig
+from .layout import Layout
+from .statfile import StatusMode, StatusPolicy
+from .statbin import StatusFormat
 
 class Config(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -16,6 +19,28 @@ class Config(BaseModel):
                                  default = {"default":BackendConfig()},
                                  title = "backend configurations"
                                )
+    index        : bool = Field(default=False,
+                                title="maintain a job index under the prefix")
+    layout       : Layout = Field(default="flat",
+                                  title="placement of job directories: flat (prefix/stamp) or date (prefix/YYYY/MM/DD/stamp)")
+    lock_timeout : Optional[float] = Field(default=None,
+                                  title="seconds to wait for a status file lock (default: no limit)")
+    status_writes : StatusMode = Field(default="flock",
+                                  title="flock: lock status files, append: write checksummed records with O_APPEND and no locks")
+    status_format : StatusFormat = Field(default="csv",
+                                  title="status log format for new jobs: csv (status.csv) or binary (status.bin + status.info)")
+    callback_outbox : bool = Field(default=False,
+                                  title="queue callbacks under prefix/.outbox for background delivery")
+
+    @model_validator(mode="after")
+    def _check_status(self) -> "Config":
+        if self.status_format == "binary" and self.status_writes == "append":
+            raise ValueError("status_format binary needs status_writes flock")
+        return self
+
+    @property
+    def status_policy(self) -> StatusPolicy:
+        return StatusPolicy(self.status_writes, self.lock_timeout)
 
 def load_config(path1 : Union[str, Path, None]) -> Config:
     cfg_name = "psik.json"
@@ -1,7 +1,7 @@
 # Functionality to help deal with the system / process
 # interface.
 
-from typing import Optional, Dict, List, Union, Tuple
+from typing import Optional, Dict, List, Union, Tuple, Set
 import asyncio
 import os
 import sys
@@ -194,6 +194,152 @@ def run_shebang(
 
     return return_code
 
+# Processes started by run_shebang_async, to receive
+# signals caught by the event loop.
+_running : Set[asyncio.subprocess.Process] = set()
+
+async def _stop_group(proc: asyncio.subprocess.Process,
+                      sig: int = signal.SIGTERM,
+                      grace: float = 5.0) -> None:
+    """ Send sig to the process group of proc, then SIGKILL
+        if it has not exited after grace seconds.
+    """
+    try:
+        os.killpg(proc.pid, sig)
+        try:
+            await asyncio.wait_for(proc.wait(), grace)
+        except asyncio.TimeoutError:
+            _logger.error("Child PID %d failed to terminate, sending SIGKILL.", proc.pid)
+            os.killpg(proc.pid, signal.SIGKILL)
+            await proc.wait()
+    except ProcessLookupError:
+        # Process already exited, which is fine
+        pass
+
+async def _propagate(sig: int) -> None:
+    """ Async counterpart of signal_handler: stop every running
+        script's process group, then exit.
+    """
+    procs = [ p for p in _running if p.returncode is None ]
+    for proc in procs:
+        _logger.warning("\nParent Python process caught signal %d. Propagating to child process (PID: %d)...", sig, proc.pid)
+    await asyncio.gather(*[ _stop_group(p, sig) for p in procs ])
+    os._exit(128+sig)
+
+# The task propagating a caught signal (which exits when done).
+_exiting : Optional[asyncio.Future] = None
+
+def _on_signal(sig: int) -> None:
+    global _exiting
+    if _exiting is None:
+        _exiting = asyncio.ensure_future(_propagate(sig))
+
+def _set_handlers(install: bool) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            if install:
+                loop.add_signal_handler(sig, _on_signal, sig)
+            else:
+                loop.remove_signal_handler(sig)
+        except (ValueError, RuntimeError, NotImplementedError) as e:
+            # e.g. not running in the main thread
+            _logger.debug("Unable to handle signal %d: %s", sig, e)
+
+async def run_shebang_async(
+    script_content: str,
+    stdout_file_path: str,
+    stderr_file_path: str,
+    timeout: Optional[int] = None,
+    env: Optional[Dict[str, str]] = None,
+    cwd: Union[Path, str, None] = None
+) -> int:
+    """
+    Executes a shell script string, as run_shebang does,
+    but inside an asyncio subprocess -- so the event loop keeps
+    running other tasks while the script runs.
+
+    The script runs in its own process group, which is sent
+    SIGTERM (then SIGKILL after 5 seconds) if the timeout
+    expires or the calling task is cancelled.
+    SIGTERM and SIGINT received by the event loop are propagated
+    to the process groups of all running scripts,
+    before exiting with 128+signal.
+
+    Args:
+        script_content: The content of the shell script to execute.
+        stdout_file_path: Path to the file for standard output redirection.
+        stderr_file_path: Path to the file for standard error redirection.
+        timeout: Optional maximum time in minutes to wait for the script to finish.
+        env: Optional dictionary of environment variables to set for the process.
+        cwd: Optional working directory for the process.
+
+    Returns:
+        The exit code of the script, or 9 if it times out or an error occurs.
+    """
+    seconds = None if timeout is None else 60*timeout
+
+    interpreter = parse_shebang(script_content)
+    if not interpreter:
+        _logger.debug("Script does not contain a shebang pattern. Defaulting to /bin/bash")
+        interpreter = ["/bin/bash"]
+
+    def set_new_pgrp():
+        os.setpgid(0, 0)
+
+    try:
+        with open(stdout_file_path, 'wb') as stdout_f, \
+             open(stderr_file_path, 'wb') as stderr_f:
+            proc = await asyncio.create_subprocess_exec(
+                interpreter[0], *interpreter[1:],
+                stdin=asyncio.subprocess.PIPE,
+                stdout=stdout_f,
+                stderr=stderr_f,
+                preexec_fn=set_new_pgrp, # Set up the process group
+                env=env,
+                cwd=cwd
+            )
+    except FileNotFoundError as e:
+        _logger.error("Error: One of the specified output file paths is invalid: %s", e)
+        return 9
+    except Exception as e:
+        _logger.error("An unexpected error occurred: %s", e)
+        return 9
+
+    if not _running:
+        _set_handlers(True)
+    _running.add(proc)
+    try:
+        assert proc.stdin is not None
+        try:
+            proc.stdin.write(script_content.encode(_default_encoding))
+            await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass # the interpreter exited without reading it all
+
+        try:
+            ret = await asyncio.wait_for(proc.wait(), seconds)
+            if _exiting is not None: # don't return before exiting
+                await asyncio.shield(_exiting)
+            return ret
+        except asyncio.TimeoutError:
+            _logger.warning("Script execution timed out after %g minutes. Killing process group.", timeout)
+            await _stop_group(proc)
+            return 9
+        except asyncio.CancelledError:
+            _logger.warning("Script execution cancelled. Killing process group.")
+            await _stop_group(proc)
+            raise
+    except Exception as e:
+        _logger.error("An error occurred while waiting for the process: %s", e)
+        await _stop_group(proc)
+        return 9
+    finally:
+        _running.discard(proc)
+        if not _running:
+            _set_handlers(False)
+
 async def runcmd(prog : Union[Path,str], *args : str,
                  cwd : Union[Path,str,None] = None,
                  expect_ok : Optional[bool] = True,
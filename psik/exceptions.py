@@ -11,3 +11,6 @@ class SubmitException(AnException):
 
 class CallbackException(AnException):
     pass
+
+class LockTimeoutException(AnException):
+    pass
@@ -0,0 +1,181 @@
+""" Compact storage for a job's status history.
+
+    Jobs restarted many times accumulate long histories.
+    Rather than one pydantic Transition per row, History keeps
+    each field in its own array and only builds Transition
+    objects when they are accessed.
+
+    The summaries needed to submit and cancel jobs
+    (next jobndx, jobndx-s by state, live native job ids)
+    are maintained as rows are appended, so they cost O(1)
+    to look up, however long the history is.
+"""
+
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    Union,
+    overload,
+)
+from collections.abc import Sequence
+from array import array
+
+from .models import JobState, Transition
+
+# One transition as (time, jobndx, state, info).
+Row = Tuple[float, int, JobState, str]
+
+_states = list(JobState)
+_state_code = dict( (s, i) for i, s in enumerate(_states) )
+_done = (JobState.canceled, JobState.failed, JobState.completed)
+
+class History(Sequence):
+    """ A list-like sequence of Transition-s, stored by column.
+    """
+    __slots__ = ("_time", "_jobndx", "_state", "_info",
+                 "_next", "_reached", "_status", "_live")
+
+    def __init__(self, transitions: Iterable[Transition] = ()) -> None:
+        self.clear()
+        self.extend(transitions)
+
+    def clear(self) -> None:
+        self._time = array('d')
+        self._jobndx = array('q')
+        self._state = array('B')
+        self._info : List[str] = []
+
+        self._next = 1 # largest jobndx seen plus 1
+        # every jobndx that has reached each state
+        self._reached : Dict[JobState, Set[int]] = \
+                dict( (s, set()) for s in _states )
+        # jobndx-s whose latest state is each state (see summarize)
+        self._status : Dict[JobState, Set[int]] = \
+                dict( (s, set()) for s in _states if s != JobState.new )
+        # native job id of each queued jobndx until it finishes
+        self._live : Dict[int, str] = {}
+
+    def append(self, trs: Transition) -> None:
+        self.append_row(trs.time, trs.jobndx, trs.state, trs.info)
+
+    def append_row(self, time: float, ndx: int,
+                   state: JobState, info: str) -> None:
+        """ Append one transition given as its fields,
+            without building a Transition.
+        """
+        self._time.append(time)
+        self._jobndx.append(ndx)
+        self._state.append(_state_code[state])
+        self._info.append(info)
+
+        if ndx >= self._next:
+            self._next = ndx+1
+        self._reached[state].add(ndx)
+
+        status = self._status
+        if state == JobState.queued:
+            self._live[ndx] = info
+            if not (ndx in self._reached[JobState.active]
+                    or any(ndx in self._reached[s] for s in _done)):
+                status[state].add(ndx)
+        elif state == JobState.active:
+            if not any(ndx in self._reached[s] for s in _done):
+                status[state].add(ndx)
+            status[JobState.queued].discard(ndx)
+        elif state in _done:
+            status[state].add(ndx)
+            status[JobState.queued].discard(ndx)
+            status[JobState.active].discard(ndx)
+            if state != JobState.canceled:
+                self._live.pop(ndx, None)
+
+    def extend(self, transitions: Iterable[Transition]) -> None:
+        for trs in transitions:
+            self.append(trs)
+
+    def extend_rows(self, rows: Iterable[Row]) -> None:
+        for row in rows:
+            self.append_row(*row)
+
+    def rows(self, start: int = 0) -> List[Row]:
+        """ Transitions from index start onward, as Row-s.
+        """
+        return [ (self._time[i], self._jobndx[i],
+                  _states[self._state[i]], self._info[i])
+                 for i in range(start, len(self)) ]
+
+    def truncate(self, n: int) -> None:
+        """ Remove all transitions after the first n.
+        """
+        if n >= len(self):
+            return
+        keep = self.rows()[:n]
+        self.clear()
+        self.extend_rows(keep)
+
+    def __len__(self) -> int:
+        return len(self._info)
+
+    def _get(self, i: int) -> Transition:
+        return Transition(time=self._time[i],
+                          jobndx=self._jobndx[i],
+                          state=_states[self._state[i]],
+                          info=self._info[i])
+
+    @overload
+    def __getitem__(self, i: int) -> Transition: ...
+    @overload
+    def __getitem__(self, i: slice) -> List[Transition]: ...
+    def __getitem__(self, i: Union[int, slice]
+                   ) -> Union[Transition, List[Transition]]:
+        if isinstance(i, slice):
+            return [ self._get(j) for j in range(*i.indices(len(self))) ]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("History index out of range")
+        return self._get(i)
+
+    def __iter__(self) -> Iterator[Transition]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def __repr__(self) -> str:
+        return f"History({list(self)!r})"
+
+    def summarize(self) -> Tuple[int, Dict[JobState, Set[int]]]:
+        """ Sort jobndx values by JobState.
+
+            returns (next available jobndx, mapping from state to jobndx)
+
+            The sets are shared with this History,
+            and must not be modified.
+        """
+        return self._next, dict(self._status)
+
+    def live(self) -> Dict[int, str]:
+        """ The native job id of each jobndx that was queued
+            but has not completed or failed.
+        """
+        return dict(self._live)
+
+    def live_ids(self, skip_canceled: bool = False) -> List[str]:
+        """ Native job ids of jobndx-s that were queued
+            but have not completed or failed.
+
+            If skip_canceled is True, jobndx-s that were
+            themselves recorded as canceled (as Job.cancel does
+            once the backend has canceled them) are left out.
+            (Canceling jobndx 0 -- the whole job -- is recorded
+            before the backend is asked to cancel anything,
+            so it does not count.)
+        """
+        if not skip_canceled:
+            return list(self._live.values())
+        canceled = self._reached[JobState.canceled]
+        return [ native_id for ndx, native_id in self._live.items()
+                 if ndx not in canceled ]
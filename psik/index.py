@@ -0,0 +1,263 @@
+""" A persistent index of the jobs inside a prefix.
+
+    The index is a single sqlite database (`prefix/.index.sqlite`)
+    holding one row per job: its stamp, name, backend,
+    and the last line written to its status.csv.
+
+    It is only a cache.  The job directories remain the
+    source of truth, and `JobIndex.rebuild` (`psik reindex`)
+    re-creates the index from them whenever it drifts.
+"""
+
+from typing import Optional, List, Iterable, Iterator, Tuple, Union, Any
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import Path as aPath
+from anyio import to_thread
+
+from .models import JobSpec, JobState, Transition, JobFilter
+from .statfile import StatusPolicy, DEFAULT_POLICY, read_policy
+from .statbin import read_last_status_sync
+from .layout import prefix_of
+from .archive import Pack
+
+INDEX_NAME = ".index.sqlite"
+
+# How long a single job's status update waits for a busy index
+# before giving up (see JobIndex.update).  Updates come from
+# every node running a job, so they must not queue up behind
+# one another on a shared filesystem.
+UPDATE_TIMEOUT = 0.5
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    stamp   TEXT PRIMARY KEY,
+    ts      REAL NOT NULL,
+    name    TEXT,
+    backend TEXT,
+    time    REAL,
+    jobndx  INTEGER,
+    state   TEXT,
+    info    TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ts ON jobs(ts);
+"""
+
+# (stamp, name, backend, last transition)
+IndexRow = Tuple[str, Optional[str], str, Transition]
+
+def stamp_value(stamp: str) -> float:
+    """ Numerical value of a job stamp (used for sorting).
+        Raises ValueError if the stamp is not a number.
+    """
+    return float(stamp)
+
+class JobIndex:
+    """ Sqlite-backed index of the jobs in a prefix.
+
+        All public methods are async and run their
+        database operations in a worker thread.
+    """
+    def __init__(self, path: Union[str, Path, aPath]) -> None:
+        self.path = Path(path)
+
+    @classmethod
+    async def find(cls, base: Union[str, Path, aPath]) -> Optional['JobIndex']:
+        """ Return the index serving the job directory, `base`,
+            or None if its prefix is not indexed.
+        """
+        path = aPath(prefix_of(base)) / INDEX_NAME
+        if await path.is_file():
+            return cls(path)
+        return None
+
+    @contextmanager
+    def _connect(self, timeout: float = 30.0
+                ) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(str(self.path), timeout=timeout)
+        try:
+            with con: # commit or rollback
+                yield con
+        finally:
+            con.close()
+
+    def create_sync(self) -> None:
+        with self._connect() as con:
+            con.executescript(_schema)
+
+    def _put(self, con: sqlite3.Connection, stamp: str,
+             name: Optional[str], backend: str, trs: Transition) -> None:
+        con.execute("INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?,?,?,?)",
+                    (stamp, stamp_value(stamp), name, backend,
+                     trs.time, trs.jobndx, trs.state.value, trs.info))
+
+    def _add(self, stamp: str, spec: JobSpec, trs: Transition) -> None:
+        with self._connect() as con:
+            self._put(con, stamp, spec.name, spec.backend, trs)
+
+    def _add_many(self, jobs: List[Tuple[str, JobSpec, Transition]]) -> None:
+        with self._connect() as con:
+            for stamp, spec, trs in jobs:
+                self._put(con, stamp, spec.name, spec.backend, trs)
+
+    def _update(self, stamp: str, trs: Transition,
+                timeout: float = 30.0) -> None:
+        with self._connect(timeout) as con:
+            con.execute("UPDATE jobs SET time=?, jobndx=?, state=?, info=?"
+                        " WHERE stamp=?",
+                        (trs.time, trs.jobndx, trs.state.value, trs.info,
+                         stamp))
+
+    def _update_many(self, updates: List[Tuple[str, Transition]]) -> None:
+        with self._connect() as con:
+            con.executemany("UPDATE jobs SET time=?, jobndx=?, state=?, info=?"
+                            " WHERE stamp=?",
+                            [(trs.time, trs.jobndx, trs.state.value, trs.info,
+                              stamp) for stamp, trs in updates])
+
+    def _remove(self, stamps: List[str]) -> None:
+        with self._connect() as con:
+            con.executemany("DELETE FROM jobs WHERE stamp=?",
+                            [(s,) for s in stamps])
+
+    def _rows(self, filt: Optional[JobFilter],
+              after: Optional[float], limit: Optional[int],
+              reverse: bool) -> List[IndexRow]:
+        where, args = _where(filt)
+        if after is not None:
+            where += " AND" if where else " WHERE"
+            where += " ts < ?" if reverse else " ts > ?"
+            args.append(after)
+        order = " ORDER BY ts DESC" if reverse else " ORDER BY ts"
+        if limit is not None:
+            order += " LIMIT ?"
+            args.append(limit)
+        with self._connect() as con:
+            cur = con.execute("SELECT stamp, name, backend,"
+                              " time, jobndx, state, info"
+                              f" FROM jobs{where}{order}", args)
+            return [ (row[0], row[1], row[2],
+                      Transition(time=row[3], jobndx=row[4],
+                                 state=JobState(row[5]), info=row[6]))
+                     for row in cur ]
+
+    def rebuild_sync(self, jobdirs: Iterable[Path],
+                     archived: Iterable[Pack] = ()) -> int:
+        """ Replace the index contents with the jobs
+            found in `jobdirs` and in the `archived` packs.
+            Returns the number of jobs indexed.
+
+            Directories that do not hold a readable job are skipped.
+        """
+        n = 0
+        policy = read_policy(self.path.parent) # (the prefix)
+        with self._connect() as con:
+            con.executescript(_schema)
+            con.execute("DELETE FROM jobs")
+            for jobdir in jobdirs:
+                try:
+                    spec = JobSpec.model_validate_json(
+                              (jobdir/'spec.json').read_text(encoding='utf-8'))
+                    trs = last_transition(jobdir, policy)
+                    self._put(con, jobdir.name, spec.name, spec.backend, trs)
+                except Exception as e:
+                    _logger.info("Unable to index %s", jobdir, exc_info=e)
+                    continue
+                n += 1
+            for pack in archived:
+                for stamp in pack.stamps():
+                    try:
+                        spec = JobSpec.model_validate_json(
+                                    pack.read_text(stamp, 'spec.json'))
+                        trs = Transition.from_fields(pack.rows(stamp)[-1])
+                        self._put(con, stamp, spec.name, spec.backend, trs)
+                    except Exception as e:
+                        _logger.info("Unable to index %s in %s",
+                                     stamp, pack.path, exc_info=e)
+                        continue
+                    n += 1
+        return n
+
+    async def create(self) -> None:
+        await to_thread.run_sync(self.create_sync)
+
+    async def add(self, stamp: str, spec: JobSpec, trs: Transition) -> None:
+        """ Add (or replace) the entry for a newly created job.
+        """
+        await to_thread.run_sync(self._add, stamp, spec, trs)
+
+    async def add_many(self,
+                       jobs: List[Tuple[str, JobSpec, Transition]]) -> None:
+        """ Add many (stamp, spec, transition) entries at once.
+        """
+        await to_thread.run_sync(self._add_many, jobs)
+
+    async def update(self, stamp: str, trs: Transition,
+                     timeout: float = 30.0) -> None:
+        """ Record `trs` as the latest line in the job's status.csv.
+
+            Raises sqlite3.OperationalError if the index stays
+            locked for `timeout` seconds.
+        """
+        await to_thread.run_sync(self._update, stamp, trs, timeout)
+
+    async def update_many(self, updates: List[Tuple[str, Transition]]) -> None:
+        """ Record the latest transitions of many jobs
+            in one transaction.
+        """
+        await to_thread.run_sync(self._update_many, updates)
+
+    async def remove(self, stamps: List[str]) -> None:
+        await to_thread.run_sync(self._remove, stamps)
+
+    async def rows(self, filt: Optional[JobFilter] = None,
+                   after: Optional[float] = None,
+                   limit: Optional[int] = None,
+                   reverse: bool = False) -> List[IndexRow]:
+        """ Index entries matching `filt`, sorted by stamp.
+
+            after, limit and reverse page through the results
+            as described in `JobManager.ls`.
+        """
+        return await to_thread.run_sync(self._rows, filt,
+                                        after, limit, reverse)
+
+    async def rebuild(self, jobdirs: Iterable[Path],
+                      archived: Iterable[Pack] = ()) -> int:
+        return await to_thread.run_sync(self.rebuild_sync, jobdirs, archived)
+
+def _where(filt: Optional[JobFilter]) -> Tuple[str, List[Any]]:
+    """ Translate a JobFilter into an SQL WHERE clause.
+    """
+    if filt is None:
+        return "", []
+    terms : List[str] = []
+    args : List[Any] = []
+    if filt.since is not None:
+        terms.append("ts >= ?")
+        args.append(filt.since)
+    if filt.until is not None:
+        terms.append("ts < ?")
+        args.append(filt.until)
+    if filt.state is not None:
+        terms.append("state IN (%s)" % ",".join("?"*len(filt.state)))
+        args.extend(s.value for s in filt.state)
+    if filt.backend is not None:
+        terms.append("backend = ?")
+        args.append(filt.backend)
+    if filt.name is not None:
+        terms.append("ifnull(name, '') GLOB ?")
+        args.append(filt.name)
+    if len(terms) == 0:
+        return "", []
+    return " WHERE " + " AND ".join(terms), args
+
+def last_transition(jobdir: Path,
+                    policy: StatusPolicy = DEFAULT_POLICY) -> Transition:
+    """ Parse the last line of a job's status log.
+    """
+    return Transition.from_fields(read_last_status_sync(jobdir, policy))
@@ -1,7 +1,9 @@
-from typing import Union, Dict, Tuple, List, Optional, Set
+from typing import Union, Dict, Tuple, List, Optional, Set, Any, Iterable
 from io import StringIO
 import os
+import json
 import sys
+import sqlite3
 import logging
 _logger = logging.getLogger(__name__)
 
@@ -10,6 +12,8 @@ from pathlib import Path
 from time import time as timestamp
 
 from anyio import Path as aPath
+from anyio import to_thread
+from pydantic import BaseModel
 
 from .models import (
     JobSpec,
@@ -19,19 +23,52 @@ from .models import (
     BackendConfig,
     ExtraInfo,
 )
-from .statfile import read_csv, append_csv, WriteLock, open_file
+from .statfile import (
+    read_csv_from_async,
+    append_csv,
+    append_csv_many,
+    csv_line,
+    open_file,
+    WriteLock,
+    CreateLock,
+    StatusPolicy,
+    DEFAULT_POLICY,
+    read_policy,
+)
+from .index import JobIndex, UPDATE_TIMEOUT
+from .history import History, Row
+from .statbin import (
+    BIN_NAME,
+    INFO_NAME,
+    append_bin,
+    read_bin_from_async,
+    read_last_status,
+    write_records,
+)
+from .layout import prefix_of
+from .watch import changes
+from .archive import Pack, find_pack
 from .exceptions import InvalidJobException, SubmitException, CallbackException
-from .web import post_json
-from .console import run_shebang, runcmd
+from .web import post_json, sign_message
+from .outbox import Outbox
+from .sinks import is_local, send_local
+from .console import run_shebang_async, runcmd
 from .backend import submit_at, cancel_at, poll_at
 
+# Held while submitting in "append" mode.
+SUBMIT_LOCK = ".submit.lock"
+
 class Job:
     info: ExtraInfo
 
-    def __init__(self, base : Union[str, Path, aPath]):
+    def __init__(self, base : Union[str, Path, aPath],
+                 index : Optional[JobIndex] = None):
         """ Construct a job from the information
             in its base directory (filesystem path).
 
+            If the job's prefix is indexed, `index` may be
+            passed to save looking it up on the first status update.
+
             Note: This class is not fully initialized
                   with actual job metadata until it is `await`-ed.
                   This allows for all I/O to be asynchronous.
@@ -39,37 +76,124 @@ class Job:
         base = aPath(base)
         self.base = base
         self.stamp = str(base.name)
+        self.index = index
 
         self.valid = False
         self.spec = JobSpec(script="")
-        self.history : List[Transition] = []
+        self.history = History()
+
+        # Track what has been read from the filesystem
+        # so that refresh() can read only what changed.
+        self._nread = 0    # history entries read from status.csv
+        self._status_pos = 0 # byte offset read up to
+        self._status_ino : Optional[int] = None
+        self._spec_mtime : Optional[int] = None
+        self._binary : Optional[bool] = None # status.bin vs. status.csv
+        self._outbox : Union[Outbox, bool, None] = None # (False if none)
+        self._policy : Optional[StatusPolicy] = None # (see read_policy)
 
     # Await this class to read metadata from the filesystem.
     def __await__(self):
         return self.read_info().__await__()
 
-    async def read_info(self) -> 'Job':
+    async def read_info(self, spec: Optional[str] = None) -> 'Job':
         """ Asynchronously read all job metadata from the filesystem.
+
+            If the contents of spec.json have already been read,
+            they can be passed as `spec` to avoid reading it twice.
         """
-        base = self.base
-        spec = await (base/'spec.json').read_text(encoding='utf-8')
-        self.spec = JobSpec.model_validate_json(spec)
-        history = await read_csv(base / 'status.csv')
-        self.history = self.history[:0]
-        for step in history: # parse history
-            try:
-                self.history.append(Transition(time=float(step[0]),
-                                               jobndx=int(step[1]),
-                                               state=JobState(step[2]),
-                                               info=step[3],
-                                   ))
-            except Exception as e:
-                _logger.error("%s: Invalid row in status.csv: %s",
-                              self.stamp, step)
+        await self._read_spec(spec)
+        self.history.clear()
+        self._nread = 0
+        self._status_pos = 0
+        self._status_ino = None
+        self._binary = None
+        await self._read_status()
         self.info = ExtraInfo.model_validate_json(self.history[0].info)
         self.valid = True
         return self
 
+    async def refresh(self) -> 'Job':
+        """ Bring the job metadata up to date, reading only
+            the status.csv rows appended since the last read,
+            and re-reading spec.json only if it was modified.
+
+            Falls back to read_info() if the job was never read,
+            or if status.csv has been replaced or truncated.
+        """
+        if not self.valid or self._status_ino is None:
+            return await self.read_info()
+        st = await (self.base/'spec.json').stat()
+        if st.st_mtime_ns != self._spec_mtime:
+            await self._read_spec()
+        if await self._read_status():
+            self.info = ExtraInfo.model_validate_json(self.history[0].info)
+        return self
+
+    async def _read_spec(self, spec: Optional[str] = None) -> None:
+        path = self.base/'spec.json'
+        if spec is None:
+            spec = await path.read_text(encoding='utf-8')
+        self._spec_mtime = (await path.stat()).st_mtime_ns
+        self.spec = JobSpec.model_validate_json(spec)
+
+    async def _is_binary(self) -> bool:
+        """ Does this job keep a binary status log (see psik.statbin)?
+        """
+        if self._binary is None:
+            self._binary = await (self.base/BIN_NAME).is_file()
+        return self._binary
+
+    async def _status_policy(self) -> StatusPolicy:
+        """ How the status log is accessed (as recorded in the prefix
+            by JobManager -- see psik.statfile.read_policy).
+        """
+        if self._policy is None:
+            self._policy = await to_thread.run_sync(
+                                    read_policy, prefix_of(self.base))
+        return self._policy
+
+    async def _read_status(self) -> bool:
+        """ Read new rows from the status log into the history.
+
+            Transitions that this object appended itself are
+            replaced by the file's rows (in file order).
+
+            Returns True if the file was re-read from the start.
+        """
+        new : List[Row] = []
+        if await self._is_binary():
+            new, start, end, ino = await read_bin_from_async(
+                            self.base, self._status_pos, self._status_ino,
+                            await self._status_policy())
+        else:
+            rows, start, end, ino = await read_csv_from_async(
+                            self.base/'status.csv',
+                            self._status_pos, self._status_ino, 4,
+                            await self._status_policy())
+            for step in rows: # parse history
+                try:
+                    new.append( (float(step[0]), int(step[1]),
+                                 JobState(step[2]), step[3]) )
+                except Exception as e:
+                    _logger.error("%s: Invalid row in status.csv: %s",
+                                  self.stamp, step)
+        reset = start < self._status_pos or self._status_ino is None
+        if reset:
+            self._nread = 0
+        # Usually, our own appends are the first new rows.
+        # Keep them, rather than rebuilding the history.
+        local = self.history.rows(self._nread)
+        if new[:len(local)] == local:
+            new = new[len(local):]
+        else:
+            self.history.truncate(self._nread)
+        self.history.extend_rows(new)
+        self._nread = len(self.history)
+        self._status_pos = end
+        self._status_ino = ino
+        return reset
+
     async def reached(self, jobndx: int, state: JobState,
                       info: str = "", backdate: Optional[float] = None) -> bool:
         """ Mark job as having reached the given jobndx,state.
@@ -94,7 +218,8 @@ class Job:
         #        if trs.jobndx == jobndx and trs.state == state:
         #            return False
         self.history.append( data )
-        await append_csv(self.base / 'status.csv', *data.fields())
+        await self._append([data])
+        await self.update_index(data)
         if backdate is not None:
             return True
 
@@ -102,29 +227,122 @@ class Job:
             spec = await (self.base/'spec.json').read_text(
                                                     encoding='utf-8')
             self.spec = JobSpec.model_validate_json(spec)
-        return await self.send_callback(jobndx, state, info)
+        return await self.send_callback(jobndx, state, info, t)
+
+    async def reached_many(self, transitions: List[Transition],
+                           update_index: bool = True) -> None:
+        """ Record many transitions at once (e.g. copied
+            from a remote status.csv), with their original times.
+
+            All rows are appended under one open and one lock
+            of the status log.  As with `reached(..., backdate=t)`,
+            no callbacks are sent.
+
+            Set update_index=False if the caller updates the
+            job index itself (e.g. for many jobs with
+            JobIndex.update_many).
+        """
+        if len(transitions) == 0:
+            return
+        self.history.extend(transitions)
+        await self._append(transitions)
+        if update_index:
+            await self.update_index(transitions[-1])
+
+    async def _append(self, transitions: List[Transition]) -> None:
+        """ Append transitions to the job's status log.
+        """
+        policy = await self._status_policy()
+        if await self._is_binary():
+            await append_bin(self.base, transitions, policy)
+        elif len(transitions) == 1:
+            await append_csv(self.base / 'status.csv',
+                             *transitions[0].fields(), policy=policy)
+        else:
+            await append_csv_many(self.base / 'status.csv',
+                                  [trs.fields() for trs in transitions],
+                                  policy)
+
+    async def update_index(self, trs: Transition) -> None:
+        """ Copy the latest status.csv line into the prefix's
+            job index (if there is one).
+
+            Errors are only logged, since `psik reindex`
+            can always recover the index from status.csv.
+            If the index is busy, the update is skipped after
+            a short wait (UPDATE_TIMEOUT), rather than holding up
+            the job (whose next update will catch the index up).
+        """
+        try:
+            if self.index is None:
+                self.index = await JobIndex.find(self.base)
+            if self.index is not None:
+                await self.index.update(self.stamp, trs, UPDATE_TIMEOUT)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                _logger.warning("%s: Unable to update job index: %s",
+                                self.stamp, e)
+            else:
+                _logger.info("%s: Job index busy, update skipped.",
+                             self.stamp)
+        except Exception as e:
+            _logger.warning("%s: Unable to update job index: %s",
+                            self.stamp, e)
 
     async def send_callback(self,
                             jobndx: int,
                             state: JobState,
-                            info: str) -> bool:
-        token = None
-        if self.spec.cb_secret:
-            token = self.spec.cb_secret.get_secret_value()
+                            info: str,
+                            time: Optional[float] = None) -> bool:
+        """ Send a Callback for this transition to spec.callback.
+            `time` is when it was recorded (sent along, so the
+            receiver can record the same time).
+
+            If the prefix has an outbox (see psik.outbox), the signed
+            callback is queued there for background delivery,
+            and this returns without waiting for it to be sent.
+            There, if spec.cb_batch is set, it may be sent in a batch
+            with other jobs' callbacks.
+
+            Callbacks to local sinks (unix:// and py://,
+            see psik.sinks) are always delivered directly.
+        """
         if self.spec.callback is not None:
             cb = Callback(jobid = self.stamp,
                           jobndx = jobndx,
                           state = state,
-                          info = info)
+                          info = info,
+                          time = time)
             token = None
             if self.spec.cb_secret:
                 token = self.spec.cb_secret.get_secret_value()
             try:
+                if is_local(self.spec.callback):
+                    body = cb.model_dump_json()
+                    headers = dict(self.spec.cb_headers)
+                    if token:
+                        headers["x-hub-signature-256"] = \
+                                sign_message(body, token)
+                    return await send_local(self.spec.callback, cb,
+                                            body, headers)
+                if self._outbox is None:
+                    self._outbox = await Outbox.find(self.base) or False
+                if isinstance(self._outbox, Outbox):
+                    body = cb.model_dump_json()
+                    headers = dict(self.spec.cb_headers)
+                    if token:
+                        headers["x-hub-signature-256"] = \
+                                sign_message(body, token)
+                    await self._outbox.put(self.stamp, self.spec.callback,
+                                           body, headers, token,
+                                           self.spec.cb_batch)
+                    return True
                 return await post_json(self.spec.callback,
                                        cb.model_dump_json(),
-                                       token) is not None
+                                       token,
+                                       self.spec.cb_headers) is not None
             except Exception as e:
-                msg = f"{cb} POST to {self.spec.callback}"
+                msg = f"{cb} sent to {self.spec.callback}"
                 raise CallbackException(msg) from e
         return True
 
@@ -132,27 +350,13 @@ class Job:
         """ Sort jobndx values by JobState.
             
             returns (next available jobndx, mapping from state to jobndx)
-        """
-        jobndx = 1 # largest jobndx seen plus 1
-
-        status : Dict[JobState, Set[int]] = \
-                 dict( (s, set()) for s in JobState )
-        del status[JobState.new]
-        for t in self.history:
-            ndx = t.jobndx
-            if ndx >= jobndx:
-                jobndx = ndx+1
-            if t.state in status:
-                status[t.state].add(ndx)
 
+            The sets are maintained as the history grows,
+            and must not be modified.
+        """
         # TODO: sanity checks to ensure jobs passed through queued
         # before reaching other states, cancelled/failed/completed
-        done = status[JobState.canceled] \
-             | status[JobState.failed]    \
-             | status[JobState.completed]
-        status[JobState.queued] -= status[JobState.active] | done
-        status[JobState.active] -= done
-        return jobndx, status
+        return self.history.summarize()
 
     async def submit(self) -> Tuple[int,str]:
         """ Run the job's submit script.
@@ -164,9 +368,17 @@ class Job:
         jobndx, _ = self.summarize()
         # inline some of self.reached so that we can
         # submit with the file lock held.
-        async with await open_file(self.base/'status.csv', 'a',
-                                   encoding='utf-8') as f:
-            async with WriteLock(f):
+        # (Binary logs are opened here only to hold the lock.)
+        # In "append" mode, submits are serialized by a lock file
+        # instead (see CreateLock).
+        binary = await self._is_binary()
+        policy = await self._status_policy()
+        async with await open_file(self.base/(BIN_NAME if binary
+                                              else 'status.csv'),
+                                   'a', encoding='utf-8') as f:
+            async with (CreateLock(self.base/SUBMIT_LOCK, policy.lock_timeout)
+                        if policy.mode == "append"
+                        else WriteLock(f, timeout=policy.lock_timeout)):
                 t0 = timestamp()
                 native_job_id = await submit_at(self.info.backend.type, self, jobndx)
                 if native_job_id is None:
@@ -175,10 +387,16 @@ class Job:
                                  jobndx=jobndx,
                                  state=JobState.queued,
                                  info=native_job_id)
-                await f.write(','.join(map(str, trs.fields())) + '\n')
+                if binary:
+                    await to_thread.run_sync(write_records, f.wrapped.fileno(),
+                                             self.base/INFO_NAME, [trs])
+                else:
+                    await f.write(csv_line(trs.fields(), policy.mode))
         self.history.append(trs)
+        await self.update_index(trs)
         try:
-            await self.send_callback(jobndx, JobState.queued, native_job_id)
+            await self.send_callback(jobndx, JobState.queued, native_job_id,
+                                     t0)
         except CallbackException as e:
             _logger.error("%s: Error sending callback: %s",
                               self.stamp, e)
@@ -197,19 +415,21 @@ class Job:
 
             It records the script return code as success
             or failure.
+
+            The script runs in an asyncio subprocess
+            (see console.run_shebang_async), so other tasks
+            in the event loop keep running alongside it.
         """
         try:
             await self.reached(jobndx, JobState.active)
         except CallbackException as e:
             _logger.error("%s: Error sending callback: %s", self.stamp, e)
 
-        cwd = Path()
         try:
             if not self.valid:
                 await self.read_info()
 
             # TODO: expand vars like $SLURM_JOB_NUM_NODES
-            os.chdir(str(self.spec.directory))
             if self.spec.inherit_environment:
                 env = dict(os.environ)
             else:
@@ -222,17 +442,17 @@ class Job:
             stdout_path = self.base/"log"/f"stdout.{jobndx}"
             stderr_path = self.base/"log"/f"stderr.{jobndx}"
 
-            retcode = run_shebang(self.spec.script,
+            retcode = await run_shebang_async(
+                                  self.spec.script,
                                   str(stdout_path),
                                   str(stderr_path),
                                   timeout=self.spec.resources.duration,
-                                  env=env)
+                                  env=env,
+                                  cwd=self.spec.directory)
             ret = str(retcode)
         except Exception as e:
             retcode = 7
             ret = f"psik.hot_start error: {e}"
-        finally:
-            os.chdir(str(cwd))
 
         try:
             if retcode == 0:
@@ -253,24 +473,244 @@ class Job:
         if not self.valid:
             await self.read_info()
 
-        native_ids: Dict[int,str] = {}
-        for t in self.history:
-            ndx = t.jobndx
-            state = t.state
-            if state == JobState.queued:
-                native_ids[ndx] = t.info
-            elif state == JobState.completed:
-                del native_ids[ndx]
-            elif state == JobState.failed:
-                del native_ids[ndx]
+        return self.history.live_ids()
 
-        return [job_id for ndx, job_id in native_ids.items()]
+    async def live(self) -> Dict[int, str]:
+        """ The native job id of each live jobndx
+            (see History.live).
+        """
+        if not self.valid:
+            await self.read_info()
+        return self.history.live()
+
+    async def wait(self, states: Optional[Iterable[JobState]] = None,
+                   timeout: Optional[float] = None,
+                   interval: float = 5.0) -> Transition:
+        """ Wait until the job's latest transition is to one of
+            `states` (by default, any final state), and return it.
+
+            The job is re-read (incrementally) only when its status
+            log changes -- as reported by inotify, or by polling
+            at most every `interval` seconds (see psik.watch.changes).
+
+            Raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        want = set(states) if states is not None else \
+               set(s for s in JobState if s.is_final())
+        if self.valid and self.history[-1].state in want:
+            return self.history[-1]
+
+        async def run() -> Transition:
+            gen = changes(set([Path(self.base)]), interval)
+            try:
+                async for _ in gen:
+                    await self.refresh()
+                    if self.history[-1].state in want:
+                        return self.history[-1]
+            finally:
+                await gen.aclose()
+            raise InvalidJobException(f"Stopped watching {self.stamp}.")
+        return await asyncio.wait_for(run(), timeout)
 
     async def cancel(self) -> None:
         # Prevent a race condition by recording this first.
         await self.reached(0, JobState.canceled)
         #if not ok:
         #    raise InvalidJobException("Unable to update job status.")
-        ids = await self.live_ids()
-        if len(ids) > 0:
+        live = await self.live()
+        if len(live) > 0:
             await cancel_at(self.info.backend.type, self)
+            # The backend has now canceled each live jobndx.
+            t = timestamp()
+            await self.reached_many([ Transition(time=t, jobndx=ndx,
+                                                 state=JobState.canceled,
+                                                 info=native_id)
+                                      for ndx, native_id in live.items() ])
+
+class ArchivedJob(Job):
+    """ A job whose directory has been moved into an archive pack
+        (see psik.archive).  Its metadata is read directly
+        from the pack.  Archived jobs are read-only.
+    """
+    def __init__(self, base : Union[str, Path, aPath], pack : Pack,
+                 index : Optional[JobIndex] = None):
+        super().__init__(base, index)
+        self.pack = pack
+
+    async def refresh(self) -> 'Job':
+        if not self.valid or \
+                await to_thread.run_sync(self.pack.mtime_ns) \
+                        != self._spec_mtime:
+            return await self.read_info()
+        return self
+
+    async def _read_spec(self, spec: Optional[str] = None) -> None:
+        if spec is None:
+            spec = await to_thread.run_sync(self.pack.read_text,
+                                            self.stamp, 'spec.json')
+        self._spec_mtime = await to_thread.run_sync(self.pack.mtime_ns)
+        self.spec = JobSpec.model_validate_json(spec)
+
+    async def _read_status(self) -> bool:
+        rows = await to_thread.run_sync(self.pack.rows, self.stamp)
+        self.history.clear()
+        for step in rows:
+            try:
+                self.history.append(Transition.from_fields(step))
+            except Exception as e:
+                _logger.error("%s: Invalid row in status.csv: %s",
+                              self.stamp, step)
+        self._nread = len(self.history)
+        self._status_ino = 0
+        return True
+
+    async def reached(self, jobndx: int, state: JobState,
+                      info: str = "", backdate: Optional[float] = None) -> bool:
+        raise InvalidJobException(f"{self.stamp} is archived (read-only).")
+
+    async def reached_many(self, transitions: List[Transition],
+                           update_index: bool = True) -> None:
+        raise InvalidJobException(f"{self.stamp} is archived (read-only).")
+
+    async def submit(self) -> Tuple[int,str]:
+        raise InvalidJobException(f"{self.stamp} is archived (read-only).")
+
+class _SpecHead(BaseModel):
+    """ The fields of spec.json shown in listings
+        (validated without building the rest of the spec).
+    """
+    name    : Optional[str] = None
+    backend : str = "default"
+
+class JobSummary:
+    """ A lightweight view of a job for listings.
+
+        It holds the job's location, the last line of its
+        status.csv, and the job's name and backend (read from
+        spec.json, or from the job index).  The full spec is
+        read and validated when `spec` (or `raw`) is first
+        accessed -- or, without blocking, by `await load_spec()`.
+
+        Summaries of archived jobs carry the `pack` holding them.
+
+        Await a JobSummary to load the complete Job.
+    """
+    __slots__ = ("base", "stamp", "last", "index", "pack",
+                 "_name", "_backend", "_raw", "_spec")
+
+    def __init__(self, base : Union[str, Path, aPath],
+                 last : Transition,
+                 name : Optional[str] = None,
+                 backend : Optional[str] = None,
+                 index : Optional[JobIndex] = None,
+                 pack : Optional[Pack] = None):
+        self.base = aPath(base)
+        self.stamp = str(self.base.name)
+        self.last = last
+        self.index = index
+        self.pack = pack
+        self._name = name
+        self._backend = backend or "default"
+        self._raw : Optional[Dict[str, Any]] = None # all of spec.json
+        self._spec : Optional[JobSpec] = None
+
+    @classmethod
+    async def load(cls, base : Union[str, Path, aPath],
+                   policy : StatusPolicy = DEFAULT_POLICY) -> 'JobSummary':
+        """ Summarize the job at base, reading only the last
+            line of its status.csv, and the name and backend
+            from its spec.json.
+        """
+        step = await read_last_status(base, policy)
+        ans = cls(base, Transition.from_fields(step))
+        await ans._read_head()
+        return ans
+
+    @classmethod
+    async def load_archived(cls, base : Union[str, Path, aPath],
+                            pack : Pack) -> 'JobSummary':
+        """ Summarize the job at base, which is held in pack.
+        """
+        rows = await to_thread.run_sync(pack.rows, aPath(base).name)
+        ans = cls(base, Transition.from_fields(rows[-1]), pack=pack)
+        await ans._read_head()
+        return ans
+
+    async def _read_head(self) -> None:
+        text = await to_thread.run_sync(self._spec_text)
+        head = _SpecHead.model_validate_json(text)
+        self._name, self._backend = head.name, head.backend
+
+    def _spec_text(self) -> str:
+        if self.pack is None:
+            try:
+                return Path(self.base / 'spec.json').read_text(
+                                                        encoding='utf-8')
+            except FileNotFoundError:
+                # listed from an index, but since archived?
+                self.pack = find_pack(prefix_of(self.base), self.stamp)
+                if self.pack is None:
+                    raise
+        return self.pack.read_text(self.stamp, 'spec.json')
+
+    def _read_raw(self) -> Dict[str, Any]:
+        if self._raw is None:
+            self._raw = json.loads(self._spec_text())
+        return self._raw
+
+    async def load_raw(self) -> Dict[str, Any]:
+        """ Read (if needed) and return the unvalidated
+            contents of spec.json.
+        """
+        if self._raw is None:
+            await to_thread.run_sync(self._read_raw)
+        return self.raw
+
+    async def load_spec(self) -> JobSpec:
+        """ Read (if needed) and return the job's JobSpec.
+        """
+        await self.load_raw()
+        return self.spec
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        """ The unvalidated contents of spec.json
+            (read on first access).
+        """
+        return self._read_raw()
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._name
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    @property
+    def state(self) -> JobState:
+        return self.last.state
+
+    @property
+    def spec(self) -> JobSpec:
+        """ The job's JobSpec, read and validated on first access.
+        """
+        if self._spec is None:
+            self._spec = JobSpec.model_validate(self.raw)
+        return self._spec
+
+    def __await__(self):
+        return self._load().__await__()
+
+    async def _load(self) -> Job:
+        if self.pack is None and not await self.base.is_dir():
+            # archived since this summary was made?
+            self.pack = await to_thread.run_sync(find_pack,
+                                    prefix_of(self.base), self.stamp)
+        if self.pack is not None:
+            return await ArchivedJob(self.base, self.pack,
+                                     self.index).read_info()
+        return await Job(self.base, self.index).read_info()
+
+    def __repr__(self) -> str:
+        return f"JobSummary({str(self.base)!r}, {self.last!r})"
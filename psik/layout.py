@@ -0,0 +1,248 @@
+""" Placement of job directories inside a prefix.
+
+    Two layouts are supported:
+      - flat -- prefix/<stamp>
+      - date -- prefix/YYYY/MM/DD/<stamp>, using the (UTC) date
+                encoded by the stamp.
+
+    The date layout keeps individual directories small
+    when a prefix holds very many jobs.
+"""
+
+from typing import List, Tuple, Optional, Iterator, Union, Literal
+import os
+import re
+import time
+import calendar
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import Path as aPath
+
+from .models import JobSpec
+from .statfile import read_policy
+from .statbin import has_status, read_last_status_sync
+
+Layout = Literal["flat", "date"]
+LAYOUTS : Tuple[Layout, ...] = ("flat", "date")
+
+_stamp_re = re.compile(r'^[0-9]+(\.[0-9]+)?$')
+_shard_re = [ re.compile(r'^[0-9]{4}$'),
+              re.compile(r'^[0-9]{2}$'),
+              re.compile(r'^[0-9]{2}$') ]
+
+def is_stamp(name: str) -> bool:
+    """ Is name a valid job directory name?
+    """
+    return _stamp_re.match(name) is not None
+
+def is_shard(name: str, level: int) -> bool:
+    """ Is name a valid name for a date layout directory
+        at the given level (0 = YYYY, 1 = MM, 2 = DD)?
+    """
+    return _shard_re[level].match(name) is not None
+
+def job_depth(layout: Layout) -> int:
+    """ Number of path components from the prefix to a job directory.
+    """
+    return 4 if layout == "date" else 1
+
+def shard(stamp: str) -> str:
+    """ The YYYY/MM/DD shard holding a job stamp.
+    """
+    return time.strftime("%Y/%m/%d", time.gmtime(float(stamp)))
+
+def job_path(prefix: Path, stamp: str, layout: Layout) -> Path:
+    """ Location of the job, `stamp`, inside prefix.
+    """
+    if layout == "date":
+        return prefix / shard(stamp) / stamp
+    return prefix / stamp
+
+def find_job(prefix: Path, stamp: str, layout: Layout) -> Path:
+    """ Like job_path, but falls back to the other layout when
+        the job is only present there (e.g. before migration).
+    """
+    paths = []
+    for lay in (layout,) + tuple(l for l in LAYOUTS if l != layout):
+        try:
+            paths.append( job_path(prefix, stamp, lay) )
+        except ValueError: # stamp is not a number
+            pass
+    for path in paths:
+        if path.is_dir():
+            return path
+    return paths[0]
+
+def prefix_of(base: Union[str, Path, aPath]) -> Path:
+    """ The prefix holding the job directory, base.
+        Determined from directory names alone.
+    """
+    base = Path(base)
+    parents = base.parents
+    if len(parents) > 3 and all(r.match(p.name) for r, p in
+                                zip(_shard_re, (parents[2],
+                                                parents[1],
+                                                parents[0]))):
+        return parents[3]
+    return base.parent
+
+def is_flat_job(name: str) -> bool:
+    """ Is name (inside a prefix) a job directory of the flat layout,
+        rather than a YYYY shard of the date layout?
+    """
+    return is_stamp(name) and not is_shard(name, 0)
+
+def scan_stamps(prefix: Path, root: bool = False) -> List[Tuple[float, str]]:
+    """ List the (unsorted) job directories in prefix
+        as (numerical value, stamp) pairs.
+
+        Entries whose names are not stamps are skipped
+        (as are YYYY shards, if prefix is the `root` of a prefix).
+        Only the file types reported by the directory listing
+        are used, so this does not stat every entry.
+    """
+    stamps = []
+    with os.scandir(prefix) as it:
+        for entry in it:
+            if _stamp_re.match(entry.name) and entry.is_dir() \
+                    and not (root and is_shard(entry.name, 0)):
+                stamps.append( (float(entry.name), entry.name) )
+    return stamps
+
+def _subdirs(path: Path, pattern: re.Pattern) -> List[str]:
+    try:
+        with os.scandir(path) as it:
+            return sorted(entry.name for entry in it
+                          if pattern.match(entry.name) and entry.is_dir())
+    except FileNotFoundError:
+        return []
+
+def shards(prefix: Path,
+           since: Optional[float] = None,
+           until: Optional[float] = None,
+           reverse: bool = False) -> Iterator[Path]:
+    """ Iterate over the YYYY/MM/DD shard directories of prefix
+        in date order, skipping shards entirely outside
+        the time range since <= t < until.
+    """
+    def overlaps(lo: float, hi: float) -> bool:
+        return (since is None or hi > since) and \
+               (until is None or lo < until)
+
+    def span(y: int, m: int = 0, d: int = 0) -> Tuple[float, float]:
+        if m == 0:
+            return calendar.timegm((y, 1, 1, 0, 0, 0)), \
+                   calendar.timegm((y+1, 1, 1, 0, 0, 0))
+        if d == 0:
+            y1, m1 = (y+1, 1) if m == 12 else (y, m+1)
+            return calendar.timegm((y, m, 1, 0, 0, 0)), \
+                   calendar.timegm((y1, m1, 1, 0, 0, 0))
+        lo = calendar.timegm((y, m, d, 0, 0, 0))
+        return lo, lo + 86400
+
+    def order(names: List[str]) -> List[str]:
+        return names[::-1] if reverse else names
+
+    for year in order(_subdirs(prefix, _shard_re[0])):
+        y = int(year)
+        if not overlaps(*span(y)):
+            continue
+        for month in order(_subdirs(prefix/year, _shard_re[1])):
+            m = int(month)
+            if not 1 <= m <= 12 or not overlaps(*span(y, m)):
+                continue
+            for day in order(_subdirs(prefix/year/month, _shard_re[2])):
+                if not overlaps(*span(y, m, int(day))):
+                    continue
+                yield prefix/year/month/day
+
+def scan(prefix: Path, layout: Layout) -> List[Path]:
+    """ All job directories of prefix stored in the given layout,
+        sorted by stamp.
+    """
+    if layout == "flat":
+        return [ prefix/stamp for t, stamp in
+                    sorted(scan_stamps(prefix, True)) ]
+    jobs : List[Path] = []
+    for d in shards(prefix):
+        jobs.extend( d/stamp for t, stamp in sorted(scan_stamps(d)) )
+    return jobs
+
+def scan_all(prefix: Path) -> List[Path]:
+    """ All job directories of prefix in either layout,
+        sorted by stamp.
+
+        Queued and active jobs are left in place by `migrate`,
+        so a prefix may hold jobs in both layouts
+        (whichever one is configured).
+    """
+    jobs = scan(prefix, "flat") + scan(prefix, "date")
+    jobs.sort(key=lambda path: float(path.name))
+    return jobs
+
+def _move_job(prefix: Path, src: Path, layout: Layout) -> bool:
+    """ Move one job directory to its place in `layout`.
+
+        Since the job's spec.directory holds an absolute
+        path, it is rewritten if it pointed inside the job.
+    """
+    dst = job_path(prefix, src.name, layout)
+    if dst == src or not has_status(src):
+        return False
+    step = read_last_status_sync(src, read_policy(prefix))
+    if step[2] in ("queued", "active"):
+        _logger.warning("Not moving %s: job is %s.", src.name, step[2])
+        return False
+    if dst.exists():
+        _logger.error("Not moving %s: %s exists.", src.name, dst)
+        return False
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.rename(src, dst)
+
+    spec_file = dst/'spec.json'
+    spec = JobSpec.model_validate_json(spec_file.read_text(encoding='utf-8'))
+    if spec.directory is not None:
+        rel = os.path.relpath(spec.directory, src)
+        if not rel.startswith(os.pardir):
+            spec.directory = str(dst/rel)
+            tmp = dst/'spec.json.tmp'
+            tmp.write_text(spec.model_dump_json(indent=4)+'\n',
+                           encoding='utf-8')
+            tmp.chmod(0o644)
+            os.replace(tmp, spec_file)
+    return True
+
+def migrate(prefix: Path, layout: Layout, workers: int = 16) -> int:
+    """ Move all jobs in prefix into the given layout,
+        using up to `workers` threads.
+
+        Jobs that are queued or active are left in place,
+        since their running scripts refer to the job's path.
+
+        Returns the number of jobs moved.
+    """
+    srcs = [ src for other in LAYOUTS if other != layout
+                 for src in scan(prefix, other) ]
+    moved = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [ pool.submit(_move_job, prefix, src, layout)
+                    for src in srcs ]
+        for src, fut in zip(srcs, futures):
+            try:
+                if fut.result():
+                    moved += 1
+            except Exception as e:
+                _logger.error("Unable to move %s: %s", src, e)
+
+    if layout == "flat": # clean up emptied shards
+        for d in list(shards(prefix)):
+            for p in (d, d.parent, d.parent.parent):
+                try:
+                    p.rmdir()
+                except OSError: # not empty
+                    break
+    return moved
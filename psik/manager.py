@@ -1,21 +1,81 @@
-from typing import Union, Dict, Tuple, List, Any, Optional
-from collections.abc import AsyncIterator
+from typing import (
+    Union,
+    Dict,
+    Tuple,
+    List,
+    Any,
+    Optional,
+    Set,
+    Iterable,
+    Callable,
+    Awaitable,
+    TypeVar,
+)
+from collections.abc import AsyncIterator, AsyncGenerator
+from collections import deque
 import logging
 _logger = logging.getLogger(__name__)
 
 import os
+import json
+import shutil
 from pathlib import Path
-from asyncio import sleep
+from functools import partial
+import asyncio
 from time import time as timestamp
 
 from anyio import Path as aPath
+from anyio import to_thread
 
-from .models import JobSpec, JobState, ExtraInfo
-from .statfile import append_csv, create_file
-from .job import Job
+from .models import JobSpec, JobState, ExtraInfo, Transition, JobFilter
+from .statfile import (
+    append_csv,
+    create_file,
+    read_last_csv,
+    StatusPolicy,
+    DEFAULT_POLICY,
+    write_policy,
+)
+from .job import Job, ArchivedJob, JobSummary
+from .index import JobIndex, INDEX_NAME
+from .layout import job_path, find_job, scan_all, scan_stamps, shards, shard
+from .archive import Pack, Period, archive, find_pack, pack_span, packs
+from .statbin import StatusFormat, append_bin, read_last_status
+from .watch import Watcher, changes
+from .outbox import OUTBOX_NAME
 from .config import Config
+from .exceptions import InvalidJobException
 import psik.backend as backend
 
+T = TypeVar("T")
+R = TypeVar("R")
+
+async def ordered_map(func: Callable[[T], Awaitable[R]],
+                      items: Iterable[T],
+                      limit: int) -> AsyncGenerator[R, None]:
+    """ Run func(item) for all items, at most `limit` at a time,
+        and yield the results in the order of `items`.
+
+        Work runs ahead of the consumer by up to `limit` items.
+    """
+    assert limit >= 1, "ordered_map: limit must be positive"
+    it = iter(items)
+    pending : deque[asyncio.Task] = deque()
+    try:
+        for item in it:
+            pending.append(asyncio.ensure_future(func(item)))
+            if len(pending) >= limit:
+                break
+        while pending:
+            ans = await pending.popleft()
+            for item in it:
+                pending.append(asyncio.ensure_future(func(item)))
+                break
+            yield ans
+    finally:
+        for task in pending:
+            task.cancel()
+
 class JobManager:
     """ The JobManager class manages all job (directories) listed
         inside its prefix.  It can allocate new directory names,
@@ -28,6 +88,14 @@ class JobManager:
 
         If set, default job attributes are filled in for
         all jobs that do not have those attributes set already.
+
+        If the prefix holds a job index (or config.index is set),
+        the index is kept up to date and used to list jobs.
+        Likewise, config.callback_outbox creates an outbox
+        for delivering callbacks (see psik.outbox).
+
+        Job directories are placed inside the prefix according
+        to config.layout (see psik.layout).
     """
     def __init__(self, config: Config) -> None:
         assert Path(config.prefix).is_dir(), "JobManager: prefix is not a dir"
@@ -40,30 +108,93 @@ class JobManager:
 
         self.prefix = aPath(pre)
         self.config = config
+        # Recorded in the prefix, so every Job there (including
+        # those of `psik reached`) writes its status the same way.
+        self.policy = config.status_policy
+        write_policy(pre, self.policy)
+        self._last_ms = 0 # last stamp allocated (in ms)
 
-    async def _alloc(self, jobspec : JobSpec) -> aPath:
-        """Allocate a new path where a job can be created.
+        if config.callback_outbox:
+            (pre / OUTBOX_NAME).mkdir(exist_ok=True)
 
-           Set jobspec.directory if None.
+        self.index : Optional[JobIndex] = None
+        index = pre / INDEX_NAME
+        if index.is_file():
+            self.index = JobIndex(index)
+        elif config.index:
+            _logger.info("Creating job index %s", index)
+            self.index = JobIndex(index)
+            self.index.rebuild_sync(self._jobdirs(), packs(pre))
+
+    def _jobdirs(self) -> List[Path]:
+        """ Sorted list of all job directories in the prefix.
+        """
+        return scan_all(Path(self.prefix))
+
+    def path(self, stamp: str) -> aPath:
+        """ Location of the job directory for stamp.
+        """
+        return aPath(job_path(Path(self.prefix), stamp, self.config.layout))
+
+    async def job(self, stamp: str) -> Job:
+        """ Load the job with the given stamp -- from its
+            directory, or from the pack holding it if archived.
+        """
+        pre = Path(self.prefix)
+        base = await to_thread.run_sync(find_job, pre, stamp,
+                                        self.config.layout)
+        if await aPath(base).is_dir():
+            return await Job(base, self.index)
+        pack = await to_thread.run_sync(find_pack, pre, stamp)
+        if pack is None:
+            raise InvalidJobException(f"Job {stamp} not found.")
+        return await ArchivedJob(self.path(stamp), pack, self.index)
+
+    def _next_stamp(self) -> str:
+        """ A new stamp (the time in ms), later than any
+            stamp previously returned by this manager.
+        """
+        ms = max(int(round(timestamp()*1000)), self._last_ms + 1)
+        self._last_ms = ms
+        return "%d.%03d" % divmod(ms, 1000)
+
+    async def _mkbase(self) -> aPath:
+        """ Create a new, empty job directory.
+
+            If another process has taken a stamp, the next
+            millisecond is tried instead, so allocation never sleeps.
         """
         while True:
-            # Note: This naming convention limits jobs to 1000/second
-            # which is probably too many actually.
-            base = self.prefix / ("%.3f"%round(timestamp(), 3))
+            base = self.path(self._next_stamp())
             try:
-                await base.mkdir()
-                break
+                await base.mkdir(parents=True)
+                return base
             except FileExistsError:
-                await sleep(0.001)
+                continue
 
-        # Ensure working directory exists.
-        if jobspec.directory is None:
-            workdir = base / 'work'
-            await workdir.mkdir()
-            jobspec.directory = str(workdir)
+    async def _alloc(self, jobspec : JobSpec) -> aPath:
+        """Allocate a new path where a job can be created.
 
+           Set jobspec.directory if None.
+        """
+        base = await self._mkbase()
+        await _mkworkdir(base, jobspec)
         return base
 
+    def _prepare(self, jobspec: JobSpec) -> str:
+        """ Merge backend.attributes into jobspec.attributes
+            and return the job's ExtraInfo (as json).
+        """
+        backend = self.config.backends[jobspec.backend]
+
+        # override any specifically set jobspec.attributes
+        attr = dict(backend.attributes)
+        attr.update(jobspec.attributes)
+        jobspec.attributes = attr
+
+        return ExtraInfo(backend=backend) \
+             . model_dump_json(exclude_defaults=True)
+
     async def create(self, jobspec: JobSpec,
                            base: Optional[aPath] = None) -> Job:
         """Create a new job from the given JobSpec
@@ -79,45 +210,492 @@ class JobManager:
             base = await self._alloc(jobspec)
         else:
             await base.mkdir(exist_ok=True)
-        backend = self.config.backends[jobspec.backend]
+        info = self._prepare(jobspec)
+        return await create_job(base, jobspec, info, self.index,
+                                self.config.status_format)
 
-        # override any specifically set jobspec.attributes
-        attr = dict(backend.attributes)
-        attr.update(jobspec.attributes)
-        jobspec.attributes = attr
+    async def create_many(self, jobspecs: List[JobSpec],
+                          concurrency: int = 32) -> List[Job]:
+        """ Create a new job for each JobSpec.
 
-        info = ExtraInfo(backend=backend) \
-             . model_dump_json(exclude_defaults=True)
-        return await create_job(base, jobspec, info)
-
-    async def ls(self) -> AsyncIterator[Job]:
-        """ Async generator of Job entries.
-        """
-        jobs = []
-        async for jobdir in self.prefix.iterdir():
-            jobs.append(jobdir)
-        jobs.sort()
-        for jobdir in jobs:
-            if await (jobdir / 'spec.json').is_file():
-                try:
-                    yield await Job(jobdir)
-                except Exception as e:
-                    _logger.info("Unable to load %s", jobdir, exc_info=e)
+            Stamps are allocated in bulk (in the order of jobspecs)
+            and up to `concurrency` jobs are written at once.
+            The index (if any) is updated in a single transaction.
+
+            Returns the new Job-s (in the order of jobspecs).
+        """
+        infos = [ self._prepare(spec) for spec in jobspecs ]
+        bases = [ base async for base in
+                  ordered_map(lambda _: self._mkbase(),
+                              range(len(jobspecs)), concurrency) ]
+
+        async def write(args: Tuple[aPath, JobSpec, str]) -> Job:
+            base, spec, info = args
+            await _mkworkdir(base, spec)
+            return await _write_job(base, spec, info, self.index,
+                                    self.config.status_format,
+                                    self.policy)
+
+        jobs = [ job async for job in
+                 ordered_map(write, zip(bases, jobspecs, infos),
+                             concurrency) ]
+        if self.index is not None:
+            try:
+                await self.index.add_many([ (job.stamp, job.spec,
+                                             job.history[0])
+                                            for job in jobs ])
+            except Exception as e:
+                _logger.warning("Unable to add jobs to index: %s", e)
+        return jobs
+
+    async def ls(self, concurrency: int = 32,
+                 state: Union[JobState, List[JobState], None] = None,
+                 backend: Optional[str] = None,
+                 name: Optional[str] = None,
+                 since: Optional[float] = None,
+                 until: Optional[float] = None,
+                 after: Optional[str] = None,
+                 limit: Optional[int] = None,
+                 reverse: bool = False) -> AsyncIterator[JobSummary]:
+        """ Async generator of JobSummary entries, in stamp order
+            (newest first if reverse is True).
+
+            Summaries read only the last line of each job's
+            status.csv, so listing cost does not grow with
+            job history.  Await a summary to load its full Job.
+
+            Only jobs matching all the given criteria are listed:
+              - state -- latest state is (one of) state
+              - backend -- spec.backend is backend
+              - name -- spec.name matches the glob pattern, name
+              - since, until -- since <= stamp < until
+
+            Filters are applied cheapest-first.  The stamp range
+            is checked from directory names alone, and the state
+            from the last line of status.csv, so non-matching
+            jobs never have their spec parsed.
+
+            For paging through results, `after` is a cursor --
+            the stamp of the last job from the previous page.
+            Listing starts from the next job (in the listing order),
+            and stops after `limit` jobs.  So, the latest 50 jobs are
+            `ls(limit=50, reverse=True)`.
+
+            Up to `concurrency` job directories are read at once,
+            so that filesystem latency overlaps between jobs.
+
+            When the prefix is indexed, jobs are listed from
+            the index without reading their directories.
+            Archived jobs are listed along with the others
+            (see psik.archive).
+        """
+        if isinstance(state, JobState):
+            state = [state]
+        filt = JobFilter(state=state, backend=backend, name=name,
+                         since=since, until=until)
+        cursor = None if after is None else float(after)
+
+        if self.index is not None:
+            rows = await self.index.rows(filt, cursor, limit, reverse)
+            # (jobs may be in either layout -- see _scan_batches)
+            pre, layout = Path(self.prefix), self.config.layout
+            bases = await to_thread.run_sync(
+                        lambda: [ find_job(pre, row[0], layout)
+                                  for row in rows ])
+            for base, (stamp, jname, jbackend, trs) in zip(bases, rows):
+                yield JobSummary(base, trs, jname, jbackend, self.index)
+            return
+
+        if limit is not None and limit <= 0:
+            return
+        lo, hi = since, until
+        if cursor is not None:
+            if reverse:
+                hi = cursor if hi is None else min(hi, cursor)
+            else:
+                lo = cursor if lo is None else max(lo, cursor)
+
+        count = 0
+        def load(item: Tuple[float, str, Optional[Pack], Optional[Path]]
+                ) -> Awaitable[Optional[JobSummary]]:
+            t, stamp, pack, base = item
+            return _load_summary(aPath(base) if base is not None
+                                 else self.path(stamp), filt, pack,
+                                 self.policy)
+
+        async for stamps in self._scan_batches(lo, hi, reverse):
+            stamps = [ item for item in stamps
+                       if filt.match_time(item[0]) and (cursor is None
+                            or (item[0] < cursor if reverse
+                                                 else item[0] > cursor)) ]
+            stamps.sort(key=lambda item: item[0], reverse=reverse)
+
+            gen = ordered_map(load, stamps, concurrency)
+            try:
+                async for loaded in gen:
+                    if loaded is None:
+                        continue
+                    yield loaded
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+            finally:
+                await gen.aclose()
+
+    async def _scan_batches(self, since: Optional[float],
+                            until: Optional[float],
+                            reverse: bool
+                           ) -> AsyncIterator[List[Tuple[float, str,
+                                                         Optional[Pack],
+                                                         Optional[Path]]]]:
+        """ Yield the (unsorted) stamps in the prefix, in batches
+            ordered by time.  When the prefix has date shards
+            or archive packs, each batch is one day, and days
+            outside [since, until) are skipped.
+
+            Jobs are found in both layouts, whichever is configured,
+            since `migrate` leaves queued and active jobs in place.
+            Each stamp comes with the pack holding it and
+            its directory (one of which is None).
+        """
+        pre = Path(self.prefix)
+        # Packs are only listed here.  Each one's stamps are read
+        # just before the first batch it could contribute to,
+        # so a listing that stops early never opens later packs.
+        unread = await to_thread.run_sync(packs, pre, since, until)
+        flat = await to_thread.run_sync(scan_stamps, pre, True)
+        dirs = await to_thread.run_sync(
+                        lambda: list(shards(pre, since, until, reverse)))
+
+        if len(dirs) == 0 and len(unread) == 0: # only flat jobs
+            yield [ (t, stamp, None, pre/stamp) for t, stamp in flat ]
+            return
+
+        def days(pack: Pack) -> Tuple[str, str]:
+            # first and last day covered by the pack
+            span = pack_span(pack.path.name)
+            assert span is not None # (packs lists valid names only)
+            lo, hi = span
+            return shard(str(lo)), shard(str(hi-1))
+        unread.sort(key=lambda pack: days(pack)[1 if reverse else 0],
+                    reverse=reverse)
+
+        Found = List[Tuple[float, str, Path]]
+        by_day : Dict[str, Tuple[Found, Dict[str, Pack]]] = {}
+        for t, stamp in flat:
+            by_day.setdefault(shard(stamp), ([], {}))[0].append(
+                        (t, stamp, pre/stamp) )
+        found_in = dict( (str(d.relative_to(pre)), d) for d in dirs )
+        for name in found_in:
+            by_day.setdefault(name, ([], {}))
+
+        def read(pack: Pack) -> None:
+            for stamp in pack.stamps():
+                by_day.setdefault(shard(stamp), ([], {}))[1][stamp] = pack
+
+        pick = max if reverse else min
+        while by_day or unread:
+            # the next day, after reading every pack that covers it
+            day : Optional[str] = pick(by_day) if by_day else None
+            while unread and (day is None or
+                        (days(unread[0])[1] >= day if reverse
+                         else days(unread[0])[0] <= day)):
+                await to_thread.run_sync(read, unread.pop(0))
+                day = pick(by_day) if by_day else None
+            if day is None:
+                continue
+            found, held = by_day.pop(day)
+            if day in found_in:
+                d = found_in[day]
+                found = found + [ (t, stamp, d/stamp) for t, stamp in
+                            await to_thread.run_sync(scan_stamps, d) ]
+            ans : List[Tuple[float, str, Optional[Pack], Optional[Path]]] \
+                    = [ (t, stamp, None, base) for t, stamp, base in found ]
+            seen = set(stamp for t, stamp, base in found)
+            ans.extend( (float(stamp), stamp, pack, None)
+                        for stamp, pack in held.items() if stamp not in seen )
+            yield ans
+
+    async def watch(self, interval: float = 1.0,
+                    inotify: Optional[bool] = None
+                   ) -> AsyncIterator[Tuple[str, Transition]]:
+        """ Async generator of (stamp, Transition) for every
+            transition recorded by any job in the prefix
+            after watching starts -- including jobs created
+            while watching.
+
+            On Linux, inotify is used to learn about changes as
+            they happen.  Otherwise (or if inotify=False), all job
+            status logs are checked every `interval` seconds.
+            Set inotify=True to raise an error if it is unavailable.
+
+            The generator never finishes on its own.
+        """
+        watcher = Watcher(Path(self.prefix), self.config.layout,
+                          interval, inotify, self.policy)
+        gen = watcher.events()
+        try:
+            async for event in gen:
+                yield event
+        finally:
+            await gen.aclose()
+
+    async def wait(self, stamps: Iterable[str],
+                   states: Optional[Iterable[JobState]] = None,
+                   timeout: Optional[float] = None,
+                   interval: float = 5.0,
+                   concurrency: int = 32) -> Dict[str, Transition]:
+        """ Wait until each job's latest transition is to one of
+            `states` (by default, any final state).
+
+            Returns a mapping from stamp to that transition.
+            After `timeout` seconds, jobs still waiting are
+            left out of the result.
+
+            Only the last row of a job's status log is read,
+            and only when the log changes (see psik.watch.changes),
+            so waiting on many jobs costs little more than one.
+            Archived jobs are returned immediately, since they
+            can no longer change.
+
+            Raises InvalidJobException if a job does not exist.
+        """
+        want = set(states) if states is not None else \
+               set(s for s in JobState if s.is_final())
+        pre = Path(self.prefix)
+        done : Dict[str, Transition] = {}
+        pending : Set[Path] = set()
+        for stamp in stamps:
+            base = await to_thread.run_sync(find_job, pre, stamp,
+                                            self.config.layout)
+            if await aPath(base).is_dir():
+                pending.add(base)
+                continue
+            pack = await to_thread.run_sync(find_pack, pre, stamp)
+            if pack is None:
+                raise InvalidJobException(f"Job {stamp} not found.")
+            rows = await to_thread.run_sync(pack.rows, stamp)
+            done[stamp] = Transition.from_fields(rows[-1])
+
+        async def last(jobdir: Path) -> Tuple[Path, Optional[Transition]]:
+            try:
+                return jobdir, Transition.from_fields(
+                                        await read_last_status(jobdir,
+                                                               self.policy))
+            except (FileNotFoundError, ValueError):
+                return jobdir, None
+
+        async def run() -> None:
+            gen = changes(pending, interval)
+            try:
+                async for changed in gen:
+                    async for jobdir, trs in ordered_map(last, changed,
+                                                         concurrency):
+                        if trs is not None and trs.state in want:
+                            done[jobdir.name] = trs
+                            pending.discard(jobdir)
+                    if not pending:
+                        break
+            finally:
+                await gen.aclose()
+
+        if pending:
+            try:
+                await asyncio.wait_for(run(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return done
+
+    async def reindex(self) -> int:
+        """ Rebuild the job index from the directory tree
+            (creating it if necessary).
+
+            Returns the number of jobs indexed.
+        """
+        if self.index is None:
+            self.index = JobIndex(Path(self.prefix) / INDEX_NAME)
+        jobs = await to_thread.run_sync(self._jobdirs)
+        held = await to_thread.run_sync(packs, Path(self.prefix))
+        return await self.index.rebuild(jobs, held)
+
+    async def archive(self, older_than: float,
+                      period: Period = "day",
+                      workers: int = 8) -> List[str]:
+        """ Move finished jobs created before the time, older_than,
+            into per-day (or per-month) archive packs,
+            using up to `workers` threads.
+
+            Archived jobs are still listed and can be loaded
+            (read-only) from their packs.
+
+            Returns the list of archived stamps.
+        """
+        return await to_thread.run_sync(archive, Path(self.prefix),
+                                        self.config.layout, older_than,
+                                        period, workers)
+
+    async def gc(self, older_than: Optional[float] = None,
+                 state: Optional[List[JobState]] = None,
+                 keep_last: Optional[int] = None,
+                 dry_run: bool = False,
+                 workers: int = 32) -> List[str]:
+        """ Delete job directories according to a retention policy.
+
+            A job is deleted if all the following hold:
+              - its latest state is one of `state`
+                (default: completed, failed or canceled)
+              - its latest transition is before the time,
+                older_than (if given)
+              - it is not among the `keep_last` newest jobs
+                with the same name (if given)
+              - it has no live native job ids (see Job.live_ids),
+                other than those Job.cancel has canceled
+
+            Up to `workers` job directories are deleted at once.
+            If dry_run is True, nothing is deleted.
+            Archived jobs are not considered.
+
+            Returns the list of stamps deleted (or that would be).
+        """
+        if state is None:
+            state = [s for s in JobState if s.is_final()]
+        # (summaries from the index do not know their pack,
+        #  so archived jobs are also skipped in `unused` below)
+        # Jobs are created before their latest transition,
+        # so `until` only narrows the search.
+        candidates = [ job async for job in self.ls(state=state,
+                                                    until=older_than)
+                       if job.pack is None and (older_than is None
+                                        or job.last.time < older_than) ]
+        if keep_last is not None and len(candidates) > 0:
+            kept : Dict[Optional[str], int] = {}
+            keep = set()
+            async for job in self.ls(reverse=True):
+                n = kept.get(job.name, 0)
+                if n < keep_last:
+                    keep.add(job.stamp)
+                kept[job.name] = n+1
+            candidates = [ job for job in candidates
+                           if job.stamp not in keep ]
+
+        async def unused(summary: JobSummary) -> Optional[aPath]:
+            try:
+                job = await summary
+            except Exception as e:
+                _logger.warning("%s: Unable to read job: %s",
+                                summary.stamp, e)
+                return None
+            if isinstance(job, ArchivedJob):
+                return None
+            ids = job.history.live_ids(skip_canceled=True)
+            if len(ids) > 0:
+                _logger.warning("Not deleting %s: job may still be "
+                                "running as %s.", job.stamp, ", ".join(ids))
+                return None
+            return job.base
+        bases = [ base async for base in
+                  ordered_map(unused, candidates, workers)
+                  if base is not None ]
+        if dry_run:
+            return [ base.name for base in bases ]
+
+        async def delete(base: aPath) -> Optional[str]:
+            try:
+                await to_thread.run_sync(shutil.rmtree, base)
+            except Exception as e:
+                _logger.error("Unable to delete %s: %s", base, e)
+                return None
+            return base.name
+        deleted = [ stamp async for stamp in
+                    ordered_map(delete, bases, workers)
+                    if stamp is not None ]
+        if self.index is not None and len(deleted) > 0:
+            await self.index.remove(deleted)
+        return deleted
+
+async def _load_summary(jobdir: aPath,
+                        filt: Optional[JobFilter] = None,
+                        pack: Optional[Pack] = None,
+                        policy: StatusPolicy = DEFAULT_POLICY
+                       ) -> Optional[JobSummary]:
+    """ Summarize the job at jobdir (or archived in pack),
+        or return None if it does not hold a valid job matching filt.
+    """
+    try:
+        if pack is None:
+            job = await JobSummary.load(jobdir, policy)
+        else:
+            job = await JobSummary.load_archived(jobdir, pack)
+        if filt is not None and not filt.match_state(job.state):
+            return None
+        if filt is not None and not filt.match_spec(job.name, job.backend):
+            return None
+        return job
+    except (FileNotFoundError, NotADirectoryError):
+        pass # not a job directory
+    except Exception as e:
+        _logger.info("Unable to load %s", jobdir, exc_info=e)
+    return None
+
+async def _mkworkdir(base: aPath, jobspec: JobSpec) -> None:
+    """ Ensure working directory exists.
+    """
+    if jobspec.directory is None:
+        workdir = base / 'work'
+        await workdir.mkdir()
+        jobspec.directory = str(workdir)
+
+async def _write_job(base : aPath, jobspec : JobSpec, info: str,
+                     index: Optional[JobIndex],
+                     status_format: StatusFormat = "csv",
+                     policy: Optional[StatusPolicy] = None) -> Job:
+    """ Write the job files into base and return the
+        corresponding Job -- without reading them back.
+
+        If not given, the policy is looked up from the prefix.
+    """
+    job = Job(base, index)
+    job._policy = policy
+    policy = await job._status_policy()
+    await (base/'log').mkdir()
+    await create_file(base/'spec.json', jobspec.model_dump_json(indent=4), 0o644)
+    # log completion of 'new' status
+    trs = Transition(time=timestamp(), jobndx=0,
+                     state=JobState.new, info=info)
+    if status_format == "binary":
+        await append_bin(base, [trs], policy)
+    else:
+        await append_csv(base/'status.csv', *trs.fields(), policy=policy)
+
+    job._binary = status_format == "binary"
+    job.spec = jobspec
+    job.history.append(trs)
+    job.info = ExtraInfo.model_validate_json(info)
+    job.valid = True
+    return job
 
 async def create_job(base : aPath, jobspec : JobSpec,
-                     info: str) -> Job:
+                     info: str, index: Optional[JobIndex] = None,
+                     status_format: StatusFormat = "csv") -> Job:
     """ Create job files from layout info.
 
             Fills out the "base / " subdirectory:
                - spec.json
-               - status.csv
+               - status.csv (or status.bin and status.info)
                - empty work/ and log/ directories
+
+            and adds the job to the prefix's index (if any).
     """
     assert await base.is_dir()
     assert jobspec.directory is not None and \
             await aPath(jobspec.directory).is_dir()
-    await (base/'log').mkdir()
-    await create_file(base/'spec.json', jobspec.model_dump_json(indent=4), 0o644)
-    # log completion of 'new' status
-    await append_csv(base/'status.csv', timestamp(), 0, 'new', info)
-    return await Job(base)
+    if index is None:
+        index = await JobIndex.find(base)
+    job = await _write_job(base, jobspec, info, index, status_format)
+    if index is not None:
+        try:
+            await index.add(job.stamp, jobspec, job.history[0])
+        except Exception as e:
+            _logger.warning("%s: Unable to add job to index: %s",
+                            job.stamp, e)
+    return job
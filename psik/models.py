@@ -1,5 +1,6 @@
 from typing_extensions import Annotated
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, List
+from fnmatch import fnmatchcase
 from enum import Enum
 from pathlib import Path
 
@@ -67,6 +68,7 @@ class JobSpec(BaseModel):
     callback    : Optional[str] = Field(default=None, title="URL to send event notifications.")
     cb_headers  : Dict[str,str] = Field(default={}, title="Headers to include in callback.")
     cb_secret   : Optional[SecretStr] = Field(default=None, title="hmac256 secret to sign updates sent to 'callback'")
+    cb_batch    : bool = Field(default=False, title="Allow callbacks to be sent in batches (as a JSON array) with those of other jobs.")
 
     @field_serializer('cb_secret', when_used='json')
     def dump_secret(self, v):
@@ -86,12 +88,52 @@ class Transition(BaseModel):
     def fields(self) -> Tuple[float,int,str,str]:
         return self.time, self.jobndx, self.state.value, self.info
 
+    @classmethod
+    def from_fields(cls, step: List[str]) -> 'Transition':
+        """ Parse a (split) row of status.csv -- the inverse of fields().
+        """
+        return cls(time=float(step[0]),
+                   jobndx=int(step[1]),
+                   state=JobState(step[2]),
+                   info=step[3])
+
+class JobFilter(BaseModel):
+    """ Criteria for selecting jobs from a listing.
+        Unset fields match every job.
+    """
+    state   : Optional[List[JobState]] = Field(default=None, title="Job's latest state is one of these.")
+    backend : Optional[str]   = Field(default=None, title="Configured backend name")
+    name    : Optional[str]   = Field(default=None, title="Glob pattern matching the job name")
+    since   : Optional[float] = Field(default=None, title="Earliest job stamp (inclusive)")
+    until   : Optional[float] = Field(default=None, title="Latest job stamp (exclusive)")
+
+    def match_time(self, t: float) -> bool:
+        """ Check the numerical value of a job stamp.
+        """
+        if self.since is not None and t < self.since:
+            return False
+        if self.until is not None and t >= self.until:
+            return False
+        return True
+
+    def match_state(self, state: JobState) -> bool:
+        return self.state is None or state in self.state
+
+    def match_spec(self, name: Optional[str], backend: str) -> bool:
+        if self.backend is not None and backend != self.backend:
+            return False
+        if self.name is not None and \
+                not fnmatchcase(name or "", self.name):
+            return False
+        return True
+
 # Data models specific to status routes:
 class Callback(BaseModel):
     jobid   : JobID = Field(..., title="Job ID")
     jobndx  : int   = Field(..., title="Sequential job index.")
     state   : JobState = Field(..., title="State reached by job.")
     info    : str = Field(default="", title="ID/Status code.")
+    time    : Optional[float] = Field(default=None, title="Time the state was reached (if known).")
 
 def load_jobspec(fname):
     data = Path(fname).read_text(encoding="utf-8")
@@ -0,0 +1,399 @@
+""" Durable, asynchronous callback delivery.
+
+    When a prefix holds an outbox directory (prefix/.outbox,
+    created by JobManager if config.callback_outbox is set),
+    Job.send_callback does not POST callbacks itself.
+    Instead, each signed message is written to the outbox
+    as a file, and a background task makes one attempt to
+    deliver the messages this process queued -- so job state
+    changes never wait on a webhook server.
+
+    Messages for the same job are delivered in the order
+    they were queued.  `Outbox.flush` (run by `psik serve`
+    and `psik flush-callbacks`) delivers every queued message,
+    retrying a job's messages with exponential backoff when
+    delivery fails, while other jobs' messages are still delivered.
+
+    Messages are only removed once delivered.  Those still
+    queued when a process exits are left to `psik serve`
+    or `psik flush-callbacks`.
+
+    Jobs with `cb_batch` set queue batchable messages.
+    Those for the same endpoint (URL, secret and headers)
+    are collected for a short window, and then sent together as
+    one JSON array, signed as a whole -- so a sweep of many jobs
+    reporting to one server costs one POST per window,
+    rather than one per transition.
+
+    Each message file is flock-ed while being sent,
+    so several processes can deliver from one outbox
+    without sending a message twice.
+"""
+
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+import os
+import json
+import time
+import random
+import asyncio
+from fcntl import flock, LOCK_EX, LOCK_NB
+from pathlib import Path
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import Path as aPath
+from anyio import to_thread
+
+from .layout import prefix_of
+from .web import post_json
+
+OUTBOX_NAME = ".outbox"
+
+Message = Dict[str, Any]
+
+class Outbox:
+    """ A spool directory of callback messages.
+    """
+    def __init__(self, path: Union[str, Path, aPath]) -> None:
+        self.path = Path(path)
+
+    @classmethod
+    async def find(cls, base: Union[str, Path, aPath]) -> Optional['Outbox']:
+        """ Return the outbox serving the job directory, `base`,
+            or None if its prefix has no outbox.
+        """
+        path = aPath(prefix_of(base)) / OUTBOX_NAME
+        if await path.is_dir():
+            return cls(path)
+        return None
+
+    def put_sync(self, stamp: str, url: str, body: str,
+                 headers: Dict[str, str],
+                 secret: Optional[str] = None,
+                 batch: bool = False) -> Path:
+        """ Queue a message (body, signed as needed in headers)
+            to POST to url.
+
+            If batch is set, the message may be sent as part of
+            a batch -- so the secret is kept with it for signing
+            the batch.
+        """
+        msg : Message = {"url": url, "body": body, "headers": headers}
+        if batch:
+            msg["batch"] = True
+            msg["secret"] = secret
+        name = f"{stamp}_{time.time_ns():020d}_{os.getpid()}.json"
+        tmp = self.path / ("."+name)
+        tmp.write_text(json.dumps(msg), encoding="utf-8")
+        os.replace(tmp, self.path / name)
+        return self.path / name
+
+    async def put(self, stamp: str, url: str, body: str,
+                  headers: Dict[str, str],
+                  secret: Optional[str] = None,
+                  batch: bool = False) -> None:
+        """ Queue a message and try to deliver it in the background.
+        """
+        path = await to_thread.run_sync(self.put_sync, stamp, url, body,
+                                        headers, secret, batch)
+        deliver_in_background(self, path)
+
+    def pending(self) -> Dict[str, List[Path]]:
+        """ Queued messages, by job stamp, in delivery order.
+        """
+        spool : Dict[str, List[Path]] = {}
+        try:
+            names = sorted(os.listdir(self.path))
+        except FileNotFoundError:
+            return spool
+        for name in names:
+            if name.startswith(".") or not name.endswith(".json"):
+                continue
+            stamp = name.split("_", 1)[0]
+            spool.setdefault(stamp, []).append(self.path / name)
+        return spool
+
+    async def _send(self, path: Path) -> str:
+        """ Try to deliver one message.
+
+            Returns "sent", "gone" (already delivered),
+            "busy" (being sent by another process), or "failed".
+        """
+        claim = _claim(path)
+        if isinstance(claim, str):
+            return claim
+        fd, msg = claim
+        try:
+            if not await _post(msg["url"], msg["body"], msg["headers"]):
+                return "failed"
+            os.unlink(path)
+            return "sent"
+        finally:
+            os.close(fd) # (releases the lock)
+
+    async def _send_job(self, paths: List[Path]) -> Tuple[int, str]:
+        """ Send one job's messages in order, stopping at
+            the first that can not be sent now.
+        """
+        n = 0
+        for path in paths:
+            ans = await self._send(path)
+            if ans == "sent":
+                n += 1
+            elif ans != "gone":
+                return n, ans
+        return n, "sent"
+
+    async def _send_batch(self, spool: Dict[str, List[Path]],
+                          key: str, stamps: List[str], max_batch: int
+                         ) -> List[Tuple[str, int, str]]:
+        """ Send the messages of several jobs (all batchable,
+            for the endpoint, key) as one JSON array.
+
+            Each job's messages are taken in order, up to the first
+            that can not be batched.  Returns (stamp, messages sent,
+            status) for each job, where status is "more" if the job
+            has messages left to send now.
+        """
+        claims : List[Tuple[Path, int, Message]] = []
+        status : Dict[str, str] = {}
+        count : Dict[str, int] = {}
+        try:
+            for stamp in stamps:
+                status[stamp] = "sent"
+                count[stamp] = 0
+                for path in spool[stamp]:
+                    if len(claims) >= max_batch:
+                        status[stamp] = "more"
+                        break
+                    claim = _claim(path)
+                    if claim == "gone":
+                        continue
+                    if isinstance(claim, str):
+                        status[stamp] = claim # busy
+                        break
+                    if _msg_key(claim[1]) != key:
+                        # Send it singly (or elsewhere) on the next pass.
+                        os.close(claim[0])
+                        status[stamp] = "more"
+                        break
+                    claims.append( (path, claim[0], claim[1]) )
+                    count[stamp] += 1
+            if len(claims) == 0:
+                return [ (s, 0, status[s]) for s in stamps ]
+
+            msg = claims[0][2]
+            body = "[" + ",".join(str(m["body"]) for _, _, m in claims) + "]"
+            headers = dict(msg["headers"])
+            headers.pop("x-hub-signature-256", None)
+            if not await _post(msg["url"], body, headers, msg["secret"]):
+                return [ (s, 0, "failed" if count[s] else status[s])
+                         for s in stamps ]
+            for path, _, _ in claims:
+                os.unlink(path)
+            return [ (s, count[s], status[s]) for s in stamps ]
+        finally:
+            for _, fd, _ in claims:
+                os.close(fd)
+
+    async def flush(self, timeout: Optional[float] = None,
+                    min_delay: float = 0.5,
+                    max_delay: float = 60.0,
+                    concurrency: int = 32,
+                    window: float = 0.1,
+                    max_batch: int = 1000,
+                    own: Optional[Set[Path]] = None) -> Tuple[int, int]:
+        """ Deliver queued messages until the outbox is empty,
+            or `timeout` seconds have passed.
+
+            Jobs whose delivery failed are retried after
+            min_delay seconds, doubling (up to max_delay)
+            after each further failure.
+
+            Batchable messages to the same endpoint are sent
+            together, up to max_batch at a time, once the oldest
+            has waited `window` seconds for others to join it.
+
+            If `own` is given, only the messages in it are sent
+            (and only when no other message of the same job is
+            queued ahead of them), each is tried once, and
+            it is removed from `own` once tried.
+
+            Returns the number of messages sent and
+            the number still queued.
+        """
+        from .manager import ordered_map
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        sent = 0
+        retry_at : Dict[str, float] = {}
+        delay : Dict[str, float] = {}
+        while True:
+            spool = await to_thread.run_sync(self.pending)
+            if own is not None:
+                spool = _owned(spool, own)
+            if len(spool) == 0:
+                return sent, 0
+            now = time.monotonic()
+            ready = [ stamp for stamp in spool
+                      if retry_at.get(stamp, 0.0) <= now ]
+
+            # Group the ready jobs by endpoint (None to send singly).
+            keys = await to_thread.run_sync(
+                        lambda: [ _batch_key(spool[s][0]) for s in ready ])
+            groups : Dict[str, List[str]] = {}
+            work : List[Tuple[Optional[str], List[str]]] = []
+            for stamp, key in zip(ready, keys):
+                if key is None:
+                    work.append( (None, [stamp]) )
+                else:
+                    groups.setdefault(key, []).append(stamp)
+            for key, group in groups.items():
+                age = max(_age(spool[s][0]) for s in group)
+                if age < window: # wait for more to join
+                    for s in group:
+                        retry_at[s] = now + window - age
+                else:
+                    work.append( (key, group) )
+
+            async def send(item: Tuple[Optional[str], List[str]]
+                          ) -> List[Tuple[str, int, str]]:
+                key, stamps = item
+                if key is None:
+                    n, ans = await self._send_job(spool[stamps[0]])
+                    return [(stamps[0], n, ans)]
+                return await self._send_batch(spool, key, stamps, max_batch)
+            async for results in ordered_map(send, work, concurrency):
+                for stamp, n, ans in results:
+                    sent += n
+                    if own is not None and ans in ("failed", "busy"):
+                        own.difference_update(spool.pop(stamp))
+                        continue
+                    if ans in ("sent", "more"):
+                        retry_at.pop(stamp, None)
+                        delay.pop(stamp, None)
+                        if ans == "sent":
+                            del spool[stamp]
+                        continue
+                    if ans == "failed":
+                        d = delay[stamp] = min(
+                                2*delay.get(stamp, min_delay/2), max_delay)
+                    else: # busy
+                        d = min_delay
+                    retry_at[stamp] = now + d*random.uniform(1.0, 1.25)
+
+            if len(spool) == 0:
+                continue # check for newly queued messages
+            wake = min(retry_at.get(stamp, now) for stamp in spool)
+            if deadline is not None and wake >= deadline:
+                return sent, sum(len(v) for v in spool.values())
+            await asyncio.sleep(max(wake - time.monotonic(), 0.0))
+
+def _owned(spool: Dict[str, List[Path]],
+           own: Set[Path]) -> Dict[str, List[Path]]:
+    """ The leading messages of each job in spool that are in own.
+        (own loses the messages no longer queued.)
+    """
+    queued = set( path for paths in spool.values() for path in paths )
+    own.intersection_update(queued)
+    ans : Dict[str, List[Path]] = {}
+    for stamp, paths in spool.items():
+        n = 0
+        while n < len(paths) and paths[n] in own:
+            n += 1
+        if n > 0:
+            ans[stamp] = paths[:n]
+    return ans
+
+def _claim(path: Path) -> Union[str, Tuple[int, Message]]:
+    """ Open and lock a queued message, returning (fd, message),
+        "gone" (already delivered), or "busy" (locked).
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return "gone"
+    try:
+        flock(fd, LOCK_EX | LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return "busy"
+    if os.fstat(fd).st_nlink == 0: # sent while we waited
+        os.close(fd)
+        return "gone"
+    with os.fdopen(os.dup(fd), encoding="utf-8") as f:
+        return fd, json.load(f)
+
+def _batch_key(path: Path) -> Optional[str]:
+    """ The endpoint (url, secret and headers) of a batchable
+        message, or None if it must be sent on its own.
+    """
+    try:
+        msg = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    return _msg_key(msg)
+
+def _msg_key(msg: Message) -> Optional[str]:
+    if not msg.get("batch"):
+        return None
+    headers = dict(msg["headers"])
+    headers.pop("x-hub-signature-256", None)
+    return json.dumps([msg["url"], msg["secret"], headers], sort_keys=True)
+
+def _age(path: Path) -> float:
+    """ Seconds since the message at path was queued.
+    """
+    t = int(path.name.split("_")[1])
+    return (time.time_ns() - t) * 1e-9
+
+async def _post(url: str, body: str, headers: Dict[str, str],
+                secret: Optional[str] = None) -> bool:
+    try:
+        ok = await post_json(url, body, secret, headers) is not None
+    except Exception as e:
+        _logger.warning("POST to %s failed: %s", url, e)
+        return False
+    if not ok:
+        _logger.warning("POST to %s was not accepted.", url)
+    return ok
+
+# Delivery tasks running in each event loop, by outbox path,
+# and the messages they are to send.
+_tasks : Dict[Tuple[asyncio.AbstractEventLoop, Path], asyncio.Task] = {}
+_own : Dict[Tuple[asyncio.AbstractEventLoop, Path], Set[Path]] = {}
+
+def deliver_in_background(outbox: Outbox, path: Path) -> None:
+    """ Add the message at path to those this event loop is sending
+        from outbox (starting a task to send them if needed).
+        The task tries each message once, and finishes
+        when none are left to try.
+    """
+    key = (asyncio.get_running_loop(), outbox.path)
+    own = _own.setdefault(key, set())
+    own.add(path)
+    task = _tasks.get(key)
+    if task is not None and not task.done():
+        return
+    task = asyncio.ensure_future(outbox.flush(own=own))
+    _tasks[key] = task
+    task.add_done_callback(lambda t: _finished(key, t))
+
+def _finished(key: Tuple[asyncio.AbstractEventLoop, Path],
+              task: asyncio.Task) -> None:
+    if _tasks.get(key) is task:
+        del _tasks[key]
+        if len(_own.get(key, ())) == 0:
+            _own.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        _logger.error("Callback delivery stopped: %s", task.exception())
+
+async def drain(timeout: float) -> None:
+    """ Wait up to `timeout` seconds for this event loop's
+        background deliveries to finish.  Messages not delivered
+        by then stay queued.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = [ t for (l, _), t in list(_tasks.items()) if l is loop ]
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
@@ -1,33 +1,53 @@
 import asyncio
-from typing import Optional, List
+from typing import Optional, List, cast
 from pathlib import Path
 from typing_extensions import Annotated
 import sys
 import os
+import re
 import shutil
+from datetime import datetime
+from time import time as timestamp
 import logging
 _logger = logging.getLogger(__name__)
 
 import typer
 import yaml # type: ignore[import-untyped]
 
-from .config import load_config
-from .job import Job, runcmd
+from .config import load_config, Config
+from .layout import find_job, is_stamp, migrate, scan_all, LAYOUTS, Layout
+from .statbin import convert, read_last_status_sync, StatusFormat
+from .archive import PERIODS, Period
+from .job import Job, ArchivedJob, runcmd
+from .tail import tail_log, STREAMS, Stream
+from .outbox import Outbox, OUTBOX_NAME, drain as drain_callbacks
+from .sinks import close_sinks
 from .zipstr import str_to_dir
 from .manager import JobManager
+from .index import JobIndex, INDEX_NAME
 from .models import (
         JobState,
         JobSpec,
         load_jobspec
 )
-from .exceptions import CallbackException
+from .exceptions import CallbackException, InvalidJobException
 from .logs import setup_log, logfile
 from . import __version__
 
+async def _run_and_drain(f):
+    try:
+        return await f
+    finally:
+        # Give the callbacks this process queued (see psik.outbox)
+        # a moment to be delivered.  Those left are sent by
+        # `psik serve` or `psik flush-callbacks`.
+        await drain_callbacks(0.5)
+        await close_sinks()
+
 def run_async(f):
     #loop = asyncio.get_event_loop()
     #return loop.run_until_complete(f)
-    return asyncio.run(f)
+    return asyncio.run(_run_and_drain(f))
 
 def setup_logging(v, vv):
     setup_log(True, v, vv)
@@ -47,8 +67,54 @@ def version():
     """
     print(f"psik version {__version__}")
 
+_units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7*86400}
+
+def parse_duration(value: str) -> float:
+    """ Parse a duration like 90s, 30m, 12h, 14d or 2w into seconds.
+    """
+    m = re.match(r'^([0-9]*\.?[0-9]+)([smhdw])$', value.strip())
+    if m is None:
+        raise typer.BadParameter(f"Invalid duration: {value}")
+    return float(m[1]) * _units[m[2]]
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """ Parse a point in time given as a timestamp (1760000000.0),
+        an ISO date (2025-10-01 or 2025-10-01T12:00),
+        or an age relative to now (30m, 12h, 7d).
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        pass
+    return timestamp() - parse_duration(value)
+
+StateOpt = Annotated[Optional[List[JobState]], typer.Option("--state",
+                     help="Only jobs whose latest state is this (repeatable).")]
+BackendOpt = Annotated[Optional[str], typer.Option("--backend",
+                       help="Only jobs using this backend.")]
+NameOpt = Annotated[Optional[str], typer.Option("--name",
+                    help="Only jobs whose name matches this glob pattern.")]
+SinceOpt = Annotated[Optional[str], typer.Option("--since",
+                     help="Only jobs created at or after this time (timestamp, ISO date, or age like 7d).")]
+UntilOpt = Annotated[Optional[str], typer.Option("--until",
+                     help="Only jobs created before this time.")]
+
 @app.command()
 def ls(stamps: List[str] = typer.Argument(None),
+       state: StateOpt = None,
+       backend: BackendOpt = None,
+       name: NameOpt = None,
+       since: SinceOpt = None,
+       until: UntilOpt = None,
+       after: Annotated[Optional[str], typer.Option(help="Start listing after this job stamp.")] = None,
+       limit: Annotated[Optional[int], typer.Option("--limit", "-n", help="List at most this many jobs.")] = None,
+       reverse: Annotated[bool, typer.Option("--reverse", "-r", help="List newest jobs first.")] = False,
        v: V1 = False,
        vv: V2 = False,
        cfg: CfgArg = None):
@@ -58,24 +124,46 @@ def ls(stamps: List[str] = typer.Argument(None),
     if stamps:
         return status(stamps, v, vv, cfg)
 
+    if after is not None and not is_stamp(after):
+        raise typer.BadParameter(f"Invalid job stamp: {after}")
+    if limit is not None and limit < 0:
+        raise typer.BadParameter(f"Invalid limit: {limit}")
+
     setup_logging(v, vv)
     config = load_config(cfg)
     mgr = JobManager(config)
+    t0 = parse_time(since)
+    t1 = parse_time(until)
     async def show():
         print(f"{'jobid':<15} {'state':>10} jobndx info name")
-        async for job in mgr.ls():
+        async for job in mgr.ls(state=state or None,
+                                backend=backend,
+                                name=name,
+                                since=t0,
+                                until=t1,
+                                after=after,
+                                limit=limit,
+                                reverse=reverse):
             #line.time, line.jobndx, line.state.value, line.info))
-            h = job.history[-1]
-            #print(f"{job.base} {job.spec.name} {h.time} {h.jobndx} {h.state.value} {h.info}")
-            print(f"{job.stamp:<15} {h.state.value:<10} {h.jobndx:>6} {h.info:>4} {job.spec.name}")
+            h = job.last
+            #print(f"{job.base} {job.name} {h.time} {h.jobndx} {h.state.value} {h.info}")
+            print(f"{job.stamp:<15} {h.state.value:<10} {h.jobndx:>6} {h.info:>4} {job.name}")
     run_async(show())
 
-async def stat(base, stamp):
-    job = await Job(base / stamp)
+def job_base(config: Config, stamp: str) -> Path:
+    """ Resolve a job's stamp to its directory.
+    """
+    return find_job(config.prefix, str(stamp), config.layout)
+
+async def stat(job: Job):
+    if not job.valid:
+        await job.read_info()
     #print(job.spec.dump_model_json(indent=4))
     print(job.spec.name)
-    print("    base: %s"%str(base / stamp))
+    print("    base: %s"%str(job.base))
     print("    work: %s"%str(job.spec.directory))
+    if isinstance(job, ArchivedJob):
+        print("    archived in: %s"%str(job.pack.path))
     print()
     print("    time ndx state info")
     for line in job.history:
@@ -89,11 +177,11 @@ def status(stamps: List[str] = typer.Argument(..., help="Job's timestamp / handl
     """
     setup_logging(v, vv)
     config = load_config(cfg)
-    base = config.prefix
+    mgr = JobManager(config)
 
     async def loop_stat():
         for stamp in stamps:
-            await stat(base, stamp)
+            await stat(await mgr.job(stamp))
 
     run_async(loop_stat())
 
@@ -110,8 +198,9 @@ def rm(stamps : List[str] = typer.Argument(...,
     # job is still there.
 
     err = 0
+    deleted = []
     for stamp in stamps:
-        jobdir = base / str(stamp)
+        jobdir = job_base(config, stamp)
         if not jobdir.is_dir():
             _logger.error("%s not found", jobdir)
             err += 1
@@ -121,10 +210,139 @@ def rm(stamps : List[str] = typer.Argument(...,
             err += 1
             continue
         shutil.rmtree(jobdir)
+        deleted.append(str(stamp))
         print(f"Deleted {stamp}")
 
+    index = base / INDEX_NAME
+    if len(deleted) > 0 and index.is_file():
+        run_async( JobIndex(index).remove(deleted) )
+
     raise typer.Exit(code=err)
 
+@app.command()
+def reindex(v: V1 = False, vv: V2 = False, cfg: CfgArg = None):
+    """
+    Rebuild the job index from the job directories in the prefix.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    mgr = JobManager(config)
+    n = run_async( mgr.reindex() )
+    print(f"Indexed {n} jobs")
+
+@app.command()
+def migrate_layout(to: Annotated[Optional[str], typer.Option(help="Target layout (flat or date) [default: config.layout].")] = None,
+                   workers: Annotated[int, typer.Option(help="Number of jobs to move at once.")] = 16,
+                   v: V1 = False, vv: V2 = False, cfg: CfgArg = None):
+    """
+    Move all job directories into the given layout.
+
+    Queued and active jobs are skipped, since their scripts
+    refer to the job's directory.  Remember to set "layout"
+    in the config file to match.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    layout = to or config.layout
+    if layout not in LAYOUTS:
+        _logger.error("Unknown layout %s (expected one of %s)",
+                      layout, ", ".join(LAYOUTS))
+        raise typer.Exit(code=1)
+    n = migrate(config.prefix, cast(Layout, layout), workers)
+    print(f"Moved {n} jobs")
+    if layout != config.layout:
+        _logger.warning("config.layout is %s, not %s", config.layout, layout)
+
+@app.command()
+def convert_status(stamps: List[str] = typer.Argument(None, help="Jobs to convert [default: all]."),
+                   to: Annotated[str, typer.Option(help="Status log format (csv or binary).")] = "binary",
+                   v: V1 = False, vv: V2 = False, cfg: CfgArg = None):
+    """
+    Rewrite job status logs as csv (status.csv)
+    or binary (status.bin and status.info).
+
+    Queued and active jobs are skipped, since they
+    may still be writing to their status log.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    if to not in ("csv", "binary"):
+        _logger.error("Unknown format %s (expected csv or binary)", to)
+        raise typer.Exit(code=1)
+    if stamps:
+        jobs = [ job_base(config, stamp) for stamp in stamps ]
+    else:
+        jobs = scan_all(config.prefix)
+    n = 0
+    for base in jobs:
+        try:
+            step = read_last_status_sync(base, config.status_policy)
+            if step[2] in ("queued", "active"):
+                _logger.warning("Not converting %s: job is %s.",
+                                base.name, step[2])
+                continue
+            n += convert(base, cast(StatusFormat, to),
+                         config.status_policy)
+        except Exception as e:
+            _logger.error("Unable to convert %s: %s", base.name, e)
+    print(f"Converted {n} jobs")
+
+@app.command()
+def gc(older_than: Annotated[Optional[str], typer.Option(help="Only delete jobs whose last update is older than this (e.g. 14d).")] = None,
+       state: StateOpt = None,
+       keep_last: Annotated[Optional[int], typer.Option(help="Keep this many of the newest jobs with each name.")] = None,
+       dry_run: Annotated[bool, typer.Option("--dry-run", "-n", help="List the jobs that would be deleted.")] = False,
+       workers: Annotated[int, typer.Option(help="Number of jobs to delete at once.")] = 32,
+       v: V1 = False, vv: V2 = False, cfg: CfgArg = None):
+    """
+    Delete finished jobs according to a retention policy.
+
+    By default, all completed, failed, and canceled jobs
+    matching the policy are deleted.  Jobs that may still
+    be running on their backend are never deleted.
+    """
+    setup_logging(v, vv)
+    if older_than is None and keep_last is None:
+        _logger.error("Refusing to delete every job: "
+                      "set --older-than and/or --keep-last.")
+        raise typer.Exit(code=1)
+    config = load_config(cfg)
+    cutoff = None
+    if older_than is not None:
+        cutoff = timestamp() - parse_duration(older_than)
+    mgr = JobManager(config)
+    stamps = run_async( mgr.gc(cutoff, state or None, keep_last,
+                               dry_run, workers) )
+    for stamp in stamps:
+        print(stamp)
+    if dry_run:
+        print(f"Would delete {len(stamps)} jobs")
+    else:
+        print(f"Deleted {len(stamps)} jobs")
+
+@app.command()
+def archive(older_than: Annotated[str, typer.Option(help="Archive finished jobs older than this (e.g. 30d).")],
+            period: Annotated[str, typer.Option(help="Pack jobs by day or by month.")] = "day",
+            workers: Annotated[int, typer.Option(help="Number of packs to write at once.")] = 8,
+            v: V1 = False, vv: V2 = False, cfg: CfgArg = None):
+    """
+    Move finished (completed, failed or canceled) jobs
+    into compressed per-day or per-month archive packs.
+
+    Archived jobs are still listed by ls and readable
+    by status, but cannot be started, polled or canceled.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    if period not in PERIODS:
+        _logger.error("Unknown period %s (expected one of %s)",
+                      period, ", ".join(PERIODS))
+        raise typer.Exit(code=1)
+    cutoff = timestamp() - parse_duration(older_than)
+    mgr = JobManager(config)
+    done = run_async( mgr.archive(cutoff, cast(Period, period), workers) )
+    print(f"Archived {len(done)} jobs")
+
 @app.command()
 def submit(jobspec : str = typer.Argument(..., help="jobspec.json file to run"),
         submit  : Annotated[bool, typer.Option(help="Submit job to queue")] = True,
@@ -187,10 +405,9 @@ def start(stamps : List[str] = typer.Argument(...,
     """
     setup_logging(v, vv)
     config = load_config(cfg)
-    base = config.prefix
 
     for stamp in stamps:
-        job = Job(base / str(stamp))
+        job = Job(job_base(config, stamp))
         with logfile(str(job.base/'log'/'console'), v=v, vv=vv):
             run_async( job.submit() )
             print(f"Started {job.stamp}")
@@ -208,13 +425,12 @@ def poll(stamps : List[str] = typer.Argument(...,
     """
     setup_logging(v, vv)
     config = load_config(cfg)
-    base = config.prefix
 
     for stamp in stamps:
-        job = Job(base / str(stamp))
+        job = Job(job_base(config, stamp))
         with logfile(str(job.base/'log'/'console'), v=v, vv=vv):
             run_async( job.poll() )
-        run_async( stat(base, stamp) )
+        run_async( stat(Job(job.base)) )
 
 @app.command()
 def cancel(stamps : List[str] = typer.Argument(...,
@@ -225,14 +441,144 @@ def cancel(stamps : List[str] = typer.Argument(...,
     """
     setup_logging(v, vv)
     config = load_config(cfg)
-    base = config.prefix
 
     for stamp in stamps:
-        job = Job(base / str(stamp))
+        job = Job(job_base(config, stamp))
         with logfile(str(job.base/'log'/'console'), v=v, vv=vv):
             run_async( job.cancel() )
             print(f"Canceled {job.stamp}")
 
+@app.command()
+def wait(stamps : List[str] = typer.Argument(...,
+                                         help="Job's timestamp / handle."),
+         state: Annotated[Optional[List[JobState]], typer.Option("--state",
+                help="Wait for this state instead of any final state (repeatable).")] = None,
+         timeout: Annotated[Optional[str], typer.Option(help="Give up after this long (e.g. 90s, 2h).")] = None,
+         interval: Annotated[float, typer.Option(help="Longest time between checks when polling (seconds).")] = 5.0,
+         v : V1 = False, vv : V2 = False, cfg : CfgArg = None):
+    """
+    Wait for jobs to finish, printing the state each reached.
+
+    Exits with status 0 if every job completed (or reached --state),
+    1 if any job failed or was canceled, and 2 on timeout.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    limit = None if timeout is None else parse_duration(timeout)
+    mgr = JobManager(config)
+    try:
+        done = run_async( mgr.wait(stamps, state or None, limit, interval) )
+    except InvalidJobException as e:
+        _logger.error("%s", e)
+        raise typer.Exit(code=1)
+
+    ok = set(state) if state else set([JobState.completed])
+    code = 0
+    for stamp in stamps:
+        trs = done.get(stamp)
+        if trs is None:
+            print(f"{stamp} timeout")
+            code = 2
+            continue
+        print(f"{stamp} {trs.state.value}")
+        if trs.state not in ok and code == 0:
+            code = 1
+    if code != 0:
+        raise typer.Exit(code=code)
+
+@app.command()
+def tail(stamp : str = typer.Argument(..., help="Job's timestamp / handle."),
+         follow: Annotated[bool, typer.Option("--follow", "-f", help="Keep printing output until the job finishes.")] = False,
+         stream: Annotated[str, typer.Option(help="Log to show: stdout, stderr or console.")] = "stdout",
+         interval: Annotated[float, typer.Option(help="Longest time between checks when following (seconds).")] = 1.0,
+         v : V1 = False, vv : V2 = False, cfg : CfgArg = None):
+    """
+    Print a job's output from its latest run.
+
+    With -f, follow the output as it is written (including
+    new runs if the job is restarted) until the job finishes.
+    """
+    setup_logging(v, vv)
+    if stream not in STREAMS:
+        raise typer.BadParameter(f"Invalid stream: {stream}")
+    config = load_config(cfg)
+    mgr = JobManager(config)
+
+    async def show():
+        job = await mgr.job(stamp)
+        out = sys.stdout.buffer
+        async for data in tail_log(job, cast(Stream, stream),
+                                   follow, interval):
+            out.write(data)
+            out.flush()
+    try:
+        run_async(show())
+    except InvalidJobException as e:
+        _logger.error("%s", e)
+        raise typer.Exit(code=1)
+
+@app.command()
+def serve(host: Annotated[str, typer.Option(help="Address to listen on.")] = "127.0.0.1",
+          port: Annotated[int, typer.Option(help="Port to listen on.")] = 8000,
+          interval: Annotated[float, typer.Option(help="Seconds between checks for job updates when polling.")] = 1.0,
+          v : V1 = False, vv : V2 = False, cfg : CfgArg = None):
+    """
+    Serve job listings, status and updates over HTTP.
+
+    Endpoints are /jobs, /jobs/{stamp} and /events (Server-Sent Events).
+    Job callbacks are accepted at /callback, as with `psik receive`.
+    Reads are not authenticated, so only listen on trusted interfaces.
+    """
+    from aiohttp import web
+    from .server import make_app
+
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    mgr = JobManager(config)
+    web.run_app(make_app(mgr, interval), host=host, port=port)
+
+@app.command()
+def receive(host: Annotated[str, typer.Option(help="Address to listen on.")] = "127.0.0.1",
+            port: Annotated[int, typer.Option(help="Port to listen on.")] = 8000,
+            allow_unsigned: Annotated[bool, typer.Option(help="Accept unsigned callbacks for jobs without a cb_secret.")] = False,
+            v : V1 = False, vv : V2 = False, cfg : CfgArg = None):
+    """
+    Receive job callbacks over HTTP, recording each job's
+    new states.
+
+    Callbacks are POST-ed to /callback (for jobs in this prefix)
+    or /callback/{stamp}, and must be signed with the job's cb_secret.
+    """
+    from aiohttp import web
+    from .server import make_app
+
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    mgr = JobManager(config)
+    web.run_app(make_app(mgr, api=False, allow_unsigned=allow_unsigned),
+                host=host, port=port)
+
+@app.command()
+def flush_callbacks(timeout: Annotated[Optional[str], typer.Option(help="Give up after this long (e.g. 90s, 2h) [default: when all are sent].")] = None,
+                    max_delay: Annotated[float, typer.Option(help="Longest wait (seconds) before retrying a job's failed callback.")] = 60.0,
+                    v : V1 = False, vv : V2 = False, cfg : CfgArg = None):
+    """
+    Deliver all callbacks queued in the prefix's outbox.
+
+    Exits with status 1 if some could not be sent before the timeout.
+    """
+    setup_logging(v, vv)
+    config = load_config(cfg)
+    path = Path(config.prefix) / OUTBOX_NAME
+    if not path.is_dir():
+        print("No callback outbox (set callback_outbox in the config).")
+        return
+    limit = None if timeout is None else parse_duration(timeout)
+    sent, left = run_async( Outbox(path).flush(limit, max_delay=max_delay) )
+    print(f"Sent {sent} callbacks, {left} still queued")
+    if left > 0:
+        raise typer.Exit(code=1)
+
 @app.command()
 def reached(base : str = typer.Argument(..., help="Job's base directory."),
             jobndx : int = typer.Argument(..., help="Sequential job index."),
@@ -286,7 +632,7 @@ def hot_start(stamp: Annotated[str, typer.Argument(help="Job's timestamp / handl
         raise typer.Exit(code=1)
 
     async def do_hotstart() -> int:
-        job = Job(config.prefix / str(stamp))
+        job = Job(job_base(config, stamp))
         if not await job.base.is_dir() or \
                 not await (job.base/'spec.json').exists():
             await job.base.mkdir(exist_ok=True, parents=True)
@@ -0,0 +1,231 @@
+""" Receiving job callbacks.
+
+    Jobs with a `callback` URL POST a signed Callback
+    (see psik.models) for each state they reach.  A Receiver
+    checks each callback's x-hub-signature-256 header against the
+    receiving job's cb_secret, and records the transition
+    in that job's status log.
+
+    Callbacks posted to /callback are applied to the job
+    whose stamp is Callback.jobid -- as sent by jobs in the
+    same prefix.  Senders whose jobid differs from the local
+    stamp (e.g. copies of a job in a remote prefix) should
+    post to /callback/<stamp> instead.
+
+    A POST may also carry a batch of callbacks, as a JSON array
+    signed as a whole (see psik.outbox).
+
+    Transitions are recorded with the sender's time (when the
+    callback carries one).  A callback for a transition the job's
+    log already holds (the same jobndx, state and info) is not
+    recorded again -- as happens for jobs in the receiver's own
+    prefix, which log their transitions before sending them.
+
+    Transitions are recorded in batches: while one batch is
+    being written, newly received transitions queue up for the
+    next, so each job's status log is appended once per batch,
+    and the job index is updated in a single transaction.
+"""
+
+from typing import Dict, List, Optional, Tuple, Union
+from collections import OrderedDict
+import os
+import asyncio
+import threading
+from pathlib import Path
+from time import time as timestamp
+import logging
+_logger = logging.getLogger(__name__)
+
+from aiohttp import web
+from anyio import to_thread
+
+from .models import JobSpec, Transition
+from .job import Job
+from .manager import JobManager, ordered_map
+from .layout import find_job, is_stamp
+from .web import parse_callbacks, verify_signature
+
+Pending = List[Tuple[List[Transition], asyncio.Future]]
+
+class Receiver:
+    """ Record callbacks sent to the jobs of a JobManager.
+
+        Unsigned callbacks are only accepted for jobs without
+        a cb_secret when allow_unsigned is set.
+
+        The secrets of the `cache_size` most recently
+        seen jobs are kept in memory.
+    """
+    def __init__(self, mgr: JobManager,
+                 allow_unsigned: bool = False,
+                 concurrency: int = 32,
+                 cache_size: int = 4096) -> None:
+        self.mgr = mgr
+        self.allow_unsigned = allow_unsigned
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        # stamp -> (spec.json mtime, cb_secret), least recent first
+        self._secrets : "OrderedDict[str, Tuple[int, Optional[str]]]" \
+                = OrderedDict()
+        self._secrets_lock = threading.Lock() # (_lookup runs in threads)
+        self._pending : Dict[Path, Pending] = {}
+        self._task : Optional[asyncio.Future] = None
+
+    def _lookup(self, stamp: str) -> Tuple[Path, Optional[str]]:
+        """ Locate the job and read its cb_secret
+            (re-reading spec.json only if it changed).
+        """
+        base = find_job(Path(self.mgr.prefix), stamp,
+                        self.mgr.config.layout)
+        try:
+            mtime = os.stat(base/"spec.json").st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            raise web.HTTPNotFound(reason=f"Job {stamp} not found.")
+        with self._secrets_lock:
+            cached = self._secrets.get(stamp)
+            if cached is not None and cached[0] == mtime:
+                self._secrets.move_to_end(stamp)
+                return base, cached[1]
+        spec = JobSpec.model_validate_json(
+                    (base/"spec.json").read_text(encoding="utf-8"))
+        secret = None
+        if spec.cb_secret is not None:
+            secret = spec.cb_secret.get_secret_value()
+        with self._secrets_lock:
+            self._secrets[stamp] = (mtime, secret)
+            self._secrets.move_to_end(stamp)
+            while len(self._secrets) > self.cache_size:
+                self._secrets.popitem(last=False)
+        return base, secret
+
+    async def receive(self, body: str, signature: Optional[str],
+                      stamp: Optional[str] = None
+                     ) -> List[Tuple[str, Transition]]:
+        """ Verify and record a callback, or a batch
+            (JSON array) of callbacks.
+
+            `stamp` is the receiving job, and defaults to each
+            callback's jobid.  Returns the stamp and the
+            transition recorded for each callback
+            (once all have been written).
+
+            A batch is signed as a whole, so every job it names
+            must share the secret it was signed with.
+
+            Raises an aiohttp HTTPException if a callback
+            is invalid or its signature does not match.
+        """
+        cbs = parse_callbacks(body)
+        stamps = [ cb.jobid if stamp is None else stamp for cb in cbs ]
+        for s in stamps:
+            if not is_stamp(s):
+                raise web.HTTPNotFound(reason="Invalid job stamp.")
+
+        found = await to_thread.run_sync(
+                    lambda: { s: self._lookup(s) for s in set(stamps) })
+        for s, (base, secret) in found.items():
+            if secret is None and not self.allow_unsigned:
+                raise web.HTTPForbidden(reason=f"Job {s} has no cb_secret.")
+        for secret in set(secret for _, secret in found.values()):
+            if secret is not None:
+                verify_signature(body, secret, signature)
+
+        t = timestamp()
+        byjob : Dict[str, List[Transition]] = {}
+        ans = []
+        for s, cb in zip(stamps, cbs):
+            trs = Transition(time=t if cb.time is None else cb.time,
+                             jobndx=cb.jobndx,
+                             state=cb.state, info=cb.info)
+            byjob.setdefault(s, []).append(trs)
+            ans.append( (s, trs) )
+        await asyncio.gather(*[ self.record(found[s][0], trs)
+                                for s, trs in byjob.items() ])
+        return ans
+
+    async def record(self, base: Path,
+                     trs: Union[Transition, List[Transition]]) -> None:
+        """ Append trs (one or a list of transitions) to the job
+            at base, along with all other pending transitions.
+            Returns once they are written.
+        """
+        if isinstance(trs, Transition):
+            trs = [trs]
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(base, []).append( (trs, fut) )
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+        await asyncio.shield(fut)
+
+    async def _flush(self) -> None:
+        index = self.mgr.index
+        while self._pending:
+            batch = self._pending
+            self._pending = {}
+
+            async def write(item: Tuple[Path, Pending]
+                           ) -> Tuple[Path, List[Transition],
+                                      Optional[Exception]]:
+                base, pending = item
+                job = Job(base, index)
+                new : List[Transition] = []
+                try:
+                    await job.refresh()
+                    seen = set( (t.jobndx, t.state, t.info)
+                                for t in job.history )
+                    for trs, _ in pending:
+                        for t in trs:
+                            key = (t.jobndx, t.state, t.info)
+                            if key not in seen:
+                                seen.add(key)
+                                new.append(t)
+                    await job.reached_many(new, update_index=False)
+                except Exception as e:
+                    return base, [], e
+                return base, new, None
+
+            results = [ res async for res in ordered_map(
+                                        write, batch.items(),
+                                        self.concurrency) ]
+            updates = [ (base.name, new[-1])
+                        for base, new, err in results if new ]
+            if index is not None and updates:
+                try:
+                    await index.update_many(updates)
+                except Exception as e:
+                    _logger.warning("Unable to update job index: %s", e)
+            for base, new, err in results:
+                if err is not None:
+                    _logger.error("%s: Unable to record callback: %s",
+                                  base.name, err)
+                for trs, fut in batch[base]:
+                    if err is not None:
+                        fut.set_exception(err)
+                    else:
+                        fut.set_result(None)
+
+receiver_key = web.AppKey("receiver", Receiver)
+
+async def post_callback(request: web.Request) -> web.Response:
+    """ POST /callback or /callback/{stamp}
+
+        Responds with the stamp and time recorded -- or, for a batch,
+        a list of them.
+    """
+    body = await request.text()
+    recorded = await request.app[receiver_key].receive(
+                        body,
+                        request.headers.get("x-hub-signature-256"),
+                        request.match_info.get("stamp"))
+    ans = [ {"stamp": stamp, "time": trs.time} for stamp, trs in recorded ]
+    if body.lstrip().startswith("["):
+        return web.json_response(ans)
+    return web.json_response(ans[0])
+
+def add_routes(app: web.Application, receiver: Receiver) -> None:
+    """ Serve callbacks for receiver on app.
+    """
+    app[receiver_key] = receiver
+    app.router.add_post("/callback", post_callback)
+    app.router.add_post("/callback/{stamp}", post_callback)
@@ -0,0 +1,312 @@
+""" A local HTTP API for a prefix (`psik serve`).
+
+    The server keeps a JobManager -- and a Watcher following
+    every job's status log -- resident, and provides:
+
+      GET /jobs          -- list jobs (filters as in `psik ls`)
+      GET /jobs/{stamp}  -- one job's spec and history
+      GET /events        -- Server-Sent Events stream of transitions
+      POST /callback[/{stamp}] -- record a job callback
+                                  (see psik.receiver)
+
+    If the prefix has a callback outbox, queued callbacks
+    are also delivered while serving (see psik.outbox).
+
+    Responses from /jobs and /jobs/{stamp} carry an ETag.
+    For a single job, it is built from the inode and size of
+    its status log (and the modification time of spec.json),
+    so it can be checked with a stat, without reading the job.
+    For listings, it is the Watcher's version, which changes
+    whenever any job's status does (listings sent before the
+    Watcher has started have no ETag).  Requests sending a
+    matching If-None-Match header receive "304 Not Modified".
+
+    Each event on /events is a JSON object with the job's stamp
+    and the transition (time, jobndx, state, info).
+    Clients that fall too far behind are disconnected,
+    and should reconnect (and re-list) to catch up.
+"""
+
+from typing import Any, Dict, Optional, Set
+import os
+import json
+import math
+import time
+import asyncio
+from pathlib import Path
+import logging
+_logger = logging.getLogger(__name__)
+
+from aiohttp import web
+from anyio import to_thread
+
+from .models import JobState, Transition
+from .job import ArchivedJob, JobSummary
+from .manager import JobManager
+from .watch import Watcher, Event
+from .statbin import BIN_NAME, CSV_NAME
+from .layout import is_stamp
+from .receiver import Receiver, add_routes
+from .outbox import Outbox, OUTBOX_NAME
+from .exceptions import InvalidJobException
+
+class Hub:
+    """ Fan out watcher events to the connected SSE clients.
+    """
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.subs : Set[asyncio.Queue] = set()
+        self.count = 0 # events published
+
+    def subscribe(self) -> asyncio.Queue:
+        q : asyncio.Queue = asyncio.Queue(self.maxsize)
+        self.subs.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self.subs.discard(q)
+
+    def publish(self, event: Event) -> None:
+        self.count += 1
+        item = (self.count, event)
+        for q in list(self.subs):
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                # Drop the slow client -- None ends its stream.
+                self.subs.discard(q)
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait(None)
+
+manager_key = web.AppKey("manager", JobManager)
+watcher_key = web.AppKey("watcher", Watcher)
+hub_key = web.AppKey("hub", Hub)
+epoch_key = web.AppKey("epoch", str)
+
+def _not_modified(request: web.Request, etag: str) -> bool:
+    tags = request.headers.get("If-None-Match")
+    if tags is None:
+        return False
+    return any(t.strip() in (etag, "*", "W/"+etag) for t in tags.split(","))
+
+def _json(data: Any, etag: Optional[str]) -> web.Response:
+    headers = {"Cache-Control": "no-cache"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return web.Response(text=json.dumps(data), content_type="application/json",
+                        headers=headers)
+
+def _transition(trs: Transition) -> Dict[str, Any]:
+    return {"time": trs.time, "jobndx": trs.jobndx,
+            "state": trs.state.value, "info": trs.info}
+
+def _summary(job: JobSummary) -> Dict[str, Any]:
+    ans = {"stamp": job.stamp, "name": job.name, "backend": job.backend}
+    ans.update(_transition(job.last))
+    return ans
+
+def _number(request: web.Request, key: str, kind=float) -> Any:
+    val = request.query.get(key)
+    if val is None:
+        return None
+    try:
+        ans = kind(val)
+    except ValueError:
+        raise web.HTTPBadRequest(reason=f"{key} must be a number")
+    if math.isnan(ans):
+        raise web.HTTPBadRequest(reason=f"{key} must be a number")
+    return ans
+
+async def list_jobs(request: web.Request) -> web.Response:
+    """ GET /jobs?state=...&backend=...&name=...&since=...&until=...
+                 &after=...&limit=...&reverse=1
+    """
+    watcher = request.app[watcher_key]
+    # Read the version first, so changes during listing
+    # invalidate the response.
+    etag = None
+    if watcher.started:
+        etag = f'"{request.app[epoch_key]}-{watcher.version}"'
+        if _not_modified(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+
+    try:
+        state = [JobState(s) for s in request.query.getall("state", [])]
+    except ValueError as e:
+        raise web.HTTPBadRequest(reason=str(e))
+    after = request.query.get("after")
+    if after is not None and not is_stamp(after):
+        raise web.HTTPBadRequest(reason="after must be a job stamp")
+    limit = _number(request, "limit", int)
+    if limit is not None and limit < 0:
+        raise web.HTTPBadRequest(reason="limit must not be negative")
+    since = _number(request, "since")
+    until = _number(request, "until")
+    mgr = request.app[manager_key]
+    jobs = [ job async for job in mgr.ls(
+                state=state or None,
+                backend=request.query.get("backend"),
+                name=request.query.get("name"),
+                since=since,
+                until=until,
+                after=after,
+                limit=limit,
+                reverse=request.query.get("reverse", "0")
+                            not in ("0", "false", ""))
+           ]
+    return _json([_summary(j) for j in jobs], etag)
+
+def _job_etag(base: Path) -> Optional[str]:
+    """ ETag of a job directory, from a stat of its files.
+    """
+    try:
+        spec = os.stat(base/"spec.json")
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    for name in (BIN_NAME, CSV_NAME):
+        try:
+            st = os.stat(base/name)
+        except FileNotFoundError:
+            continue
+        return f'"{st.st_ino:x}-{st.st_size:x}-{spec.st_mtime_ns:x}"'
+    return None
+
+async def job_status(request: web.Request) -> web.Response:
+    """ GET /jobs/{stamp}
+    """
+    stamp = request.match_info["stamp"]
+    mgr = request.app[manager_key]
+    try:
+        base = Path(mgr.path(stamp))
+    except ValueError: # not a stamp
+        raise web.HTTPNotFound(reason=f"Job {stamp} not found.")
+    # Stat before reading, so that the ETag is never
+    # newer than the response.
+    etag = await to_thread.run_sync(_job_etag, base)
+    if etag is not None and _not_modified(request, etag):
+        return web.Response(status=304, headers={"ETag": etag})
+    try:
+        job = await mgr.job(stamp)
+    except InvalidJobException:
+        raise web.HTTPNotFound(reason=f"Job {stamp} not found.")
+    if isinstance(job, ArchivedJob):
+        mtime = await to_thread.run_sync(job.pack.mtime_ns)
+        etag = f'"{job.pack.path.name}-{mtime:x}"'
+        if _not_modified(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+    elif etag is None:
+        etag = '""'
+    data = {
+        "stamp": job.stamp,
+        "archived": isinstance(job, ArchivedJob),
+        "spec": job.spec.model_dump(mode="json",
+                                    exclude={"cb_secret", "cb_headers"}),
+        "history": [ _transition(trs) for trs in job.history ],
+    }
+    return _json(data, etag)
+
+async def events(request: web.Request) -> web.StreamResponse:
+    """ GET /events?stamp=...
+
+        Server-Sent Events stream of transitions
+        (optionally, only those of the given jobs).
+    """
+    stamps = set(request.query.getall("stamp", []))
+    hub = request.app[hub_key]
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                       "Cache-Control": "no-cache"})
+    await resp.prepare(request)
+    q = hub.subscribe()
+    try:
+        await resp.write(b": connected\n\n")
+        while True:
+            try:
+                item = await asyncio.wait_for(q.get(), 15.0)
+            except asyncio.TimeoutError:
+                await resp.write(b": keep-alive\n\n")
+                continue
+            if item is None:
+                break
+            n, (stamp, trs) = item
+            if stamps and stamp not in stamps:
+                continue
+            data = json.dumps(dict(stamp=stamp, **_transition(trs)))
+            await resp.write(f"id: {n}\nevent: transition\n"
+                             f"data: {data}\n\n".encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        hub.unsubscribe(q)
+    return resp
+
+async def _run_watcher(app: web.Application):
+    watcher = app[watcher_key]
+    hub = app[hub_key]
+
+    async def run() -> None:
+        try:
+            async for event in watcher.events():
+                hub.publish(event)
+        except Exception:
+            _logger.exception("Watcher stopped.")
+    task = asyncio.ensure_future(run())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+async def _run_outbox(app: web.Application):
+    """ Deliver queued callbacks (see psik.outbox) while serving.
+    """
+    path = app[manager_key].prefix / OUTBOX_NAME
+    outbox = Outbox(path) if await path.is_dir() else None
+
+    async def run() -> None:
+        assert outbox is not None
+        while True:
+            try:
+                await outbox.flush()
+            except Exception:
+                _logger.exception("Callback delivery failed.")
+            await asyncio.sleep(5.0)
+    task = None
+    if outbox is not None:
+        task = asyncio.ensure_future(run())
+    yield
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def make_app(mgr: JobManager, interval: float = 1.0,
+             inotify: Optional[bool] = None,
+             api: bool = True,
+             receive: bool = True,
+             allow_unsigned: bool = False) -> web.Application:
+    """ Create the aiohttp application serving mgr's prefix.
+
+        interval and inotify configure the Watcher
+        (see psik.watch).  Set api=False to serve only callbacks,
+        or receive=False to serve only the job API.
+        allow_unsigned is passed to the Receiver.
+    """
+    app = web.Application()
+    app[manager_key] = mgr
+    if api:
+        app[watcher_key] = Watcher(Path(mgr.prefix), mgr.config.layout,
+                                   interval, inotify, mgr.policy)
+        app[hub_key] = Hub()
+        app[epoch_key] = f"{time.time_ns():x}"
+        app.cleanup_ctx.append(_run_watcher)
+        app.router.add_get("/jobs", list_jobs)
+        app.router.add_get("/jobs/{stamp}", job_status)
+        app.router.add_get("/events", events)
+    if receive:
+        add_routes(app, Receiver(mgr, allow_unsigned))
+    app.cleanup_ctx.append(_run_outbox)
+    return app
@@ -0,0 +1,113 @@
+""" Callback sinks on the local host.
+
+    Besides http(s) URLs, JobSpec.callback may name:
+
+      unix:///path/to.sock -- a Unix socket, sent one JSON object
+                              per line:
+                              {"body": <Callback JSON, as a string>,
+                               "headers": {cb_headers, and
+                                           x-hub-signature-256 if signed}}
+      py://module:function -- a Python function, called in-process
+                              with the Callback (if it returns
+                              an awaitable, that is awaited)
+
+    These are dispatched directly by Job.send_callback
+    (never through the outbox), so local orchestrators are
+    notified without an HTTP round-trip.
+
+    Socket connections are kept open for reuse,
+    one per socket path and event loop.  The body is passed as
+    a string so that its signature can be checked on the exact
+    bytes signed (e.g. with psik.web.verify_callbacks).
+"""
+
+from typing import Any, Callable, Dict, Tuple
+from functools import lru_cache
+import json
+import asyncio
+import inspect
+import weakref
+import importlib
+import logging
+_logger = logging.getLogger(__name__)
+
+from .models import Callback
+
+SCHEMES = ("unix://", "py://")
+
+def is_local(url: str) -> bool:
+    """ True if url names a local sink (rather than an HTTP server).
+    """
+    return url.startswith(SCHEMES)
+
+@lru_cache(maxsize=64)
+def load_function(target: str) -> Callable[[Callback], Any]:
+    """ Import "module:function" (the function may be a dotted
+        attribute path within the module).
+    """
+    modname, sep, attr = target.partition(":")
+    if not sep or not modname or not attr:
+        raise ValueError(f"Expected py://module:function, got py://{target}")
+    fn : Any = importlib.import_module(modname)
+    for name in attr.split("."):
+        fn = getattr(fn, name)
+    if not callable(fn):
+        raise ValueError(f"py://{target} is not callable")
+    return fn
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+_conns : "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Connection]]" \
+        = weakref.WeakKeyDictionary()
+
+async def _connect(path: str) -> asyncio.StreamWriter:
+    loop = asyncio.get_running_loop()
+    conns = _conns.setdefault(loop, {})
+    conn = conns.get(path)
+    if conn is None or conn[1].is_closing() or conn[0].at_eof():
+        conn = await asyncio.open_unix_connection(path)
+        conns[path] = conn
+    return conn[1]
+
+async def _send_unix(path: str, line: bytes) -> None:
+    for attempt in (0, 1):
+        writer = await _connect(path)
+        try:
+            writer.write(line)
+            await writer.drain()
+            return
+        except (ConnectionError, BrokenPipeError):
+            # The server may have closed a kept-open connection.
+            _conns[asyncio.get_running_loop()].pop(path, None)
+            writer.close()
+            if attempt:
+                raise
+
+async def close_sinks() -> None:
+    """ Close the socket connections of the running event loop.
+    """
+    conns = _conns.pop(asyncio.get_running_loop(), {})
+    for _, writer in conns.values():
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def send_local(url: str, cb: Callback, body: str,
+                     headers: Dict[str, str]) -> bool:
+    """ Deliver cb (serialized as body, with signature
+        and other headers) to a local sink.
+
+        Returns False if a py:// function returned False.
+    """
+    if url.startswith("py://"):
+        ans = load_function(url[len("py://"):])(cb)
+        if inspect.isawaitable(ans):
+            ans = await ans
+        return ans is not False
+
+    assert url.startswith("unix://")
+    line = json.dumps({"body": body, "headers": headers}) + "\n"
+    await _send_unix(url[len("unix://"):], line.encode())
+    return True
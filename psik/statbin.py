@@ -0,0 +1,281 @@
+""" Binary job status log.
+
+    As an alternative to status.csv, a job's history can be kept
+    in two files:
+
+      - status.bin  -- fixed-size records (see RECORD) holding
+                       time, jobndx, state, and the location
+                       of the transition's info string
+      - status.info -- the info strings, concatenated
+
+    Reading needs no text parsing: the last record is found
+    from the file size, and bulk reads unpack all records at once.
+    Jobs use the binary log if status.bin is present.
+    `convert` switches a job between the two formats.
+
+    Status records are always written under an flock
+    of status.bin, and info strings are written before the
+    records pointing to them.  So binary logs cannot be written
+    in "append" mode (see psik.statfile.StatusPolicy), though
+    they can be read without locks.
+"""
+
+from typing import List, Optional, Tuple, Union, Literal
+import os
+import mmap
+import struct
+from pathlib import Path
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import Path as aPath
+from anyio import to_thread
+
+from .models import JobState, Transition
+from .history import Row
+from .statfile import (
+    WriteLock,
+    StatusPolicy,
+    StatusMode,
+    DEFAULT_POLICY,
+    status_lock,
+    read_locked,
+    csv_line,
+    read_csv_from,
+    read_last_csv,
+    read_last_csv_sync,
+)
+
+BIN_NAME = "status.bin"
+INFO_NAME = "status.info"
+CSV_NAME = "status.csv"
+
+StatusFormat = Literal["csv", "binary"]
+
+# time, jobndx, info offset, info length, state
+RECORD = struct.Struct("<dqQIB3x")
+
+_states = list(JobState)
+_state_code = dict( (s, i) for i, s in enumerate(_states) )
+
+PathLike = Union[str, Path, aPath]
+
+def is_binary(base: PathLike) -> bool:
+    """ Does the job at base keep a binary status log?
+    """
+    return os.path.isfile(Path(base) / BIN_NAME)
+
+def write_records(fd: int, info_path: PathLike,
+                  transitions: List[Transition]) -> None:
+    """ Append transitions to a binary log, given `fd` -- status.bin,
+        opened for appending and locked -- and the path to status.info.
+    """
+    info = os.open(info_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        pos = os.fstat(info).st_size
+        text = b""
+        recs = []
+        for trs in transitions:
+            data = trs.info.encode('utf-8')
+            recs.append(RECORD.pack(trs.time, trs.jobndx,
+                                    pos + len(text), len(data),
+                                    _state_code[trs.state]))
+            text += data
+        if len(text) > 0:
+            os.write(info, text)
+    finally:
+        os.close(info)
+    os.write(fd, b"".join(recs))
+
+def append_bin_sync(base: PathLike, transitions: List[Transition],
+                    policy: StatusPolicy = DEFAULT_POLICY) -> None:
+    if policy.mode == "append":
+        raise ValueError("Binary status logs need status_writes = flock.")
+    fd = os.open(Path(base) / BIN_NAME,
+                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        with WriteLock(fd, timeout=policy.lock_timeout):
+            write_records(fd, Path(base) / INFO_NAME, transitions)
+    finally:
+        os.close(fd)
+
+async def append_bin(base: PathLike, transitions: List[Transition],
+                     policy: StatusPolicy = DEFAULT_POLICY) -> None:
+    """ Append transitions to the binary log of the job at base.
+
+        The lock is waited for on the event loop,
+        and only the writes run in a worker thread.
+    """
+    if policy.mode == "append":
+        raise ValueError("Binary status logs need status_writes = flock.")
+    fd = await to_thread.run_sync(os.open, Path(base) / BIN_NAME,
+                                  os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                  0o644)
+    try:
+        async with WriteLock(fd, timeout=policy.lock_timeout):
+            await to_thread.run_sync(write_records, fd,
+                                     Path(base) / INFO_NAME, transitions)
+    finally:
+        os.close(fd)
+
+def _map(fd) -> Optional[mmap.mmap]:
+    try:
+        return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError: # empty file
+        return None
+
+BinChunk = Tuple[List[Row], int, int, int]
+
+def _bin_from(fd, base: Path, offset: int, ino: Optional[int]) -> BinChunk:
+    st = os.fstat(fd.fileno())
+    if (ino is not None and st.st_ino != ino) or st.st_size < offset:
+        offset = 0
+    end = st.st_size - (st.st_size - offset) % RECORD.size
+    if end == offset:
+        return [], offset, end, st.st_ino
+    m = _map(fd)
+    assert m is not None
+    with m:
+        recs = list(RECORD.iter_unpack(m[offset:end]))
+    with open(base / INFO_NAME, 'rb') as fi:
+        info = _map(fi)
+        try:
+            rows = [ (t, ndx,
+                      _states[code],
+                      info[pos:pos+n].decode('utf-8')
+                            if n > 0 and info is not None else "")
+                     for t, ndx, pos, n, code in recs ]
+        finally:
+            if info is not None:
+                info.close()
+    return rows, offset, end, st.st_ino
+
+def read_bin_from(base: PathLike, offset: int = 0,
+                  ino: Optional[int] = None,
+                  policy: StatusPolicy = DEFAULT_POLICY) -> BinChunk:
+    """ Read the complete records of status.bin starting from
+        byte `offset` (with the same conventions as read_csv_from).
+
+        Returns (rows, start, end, ino).
+    """
+    base = Path(base)
+    with open(base / BIN_NAME, 'rb') as fd:
+        with status_lock(fd, False, policy):
+            return _bin_from(fd, base, offset, ino)
+
+async def read_bin_from_async(base: PathLike, offset: int = 0,
+                              ino: Optional[int] = None,
+                              policy: StatusPolicy = DEFAULT_POLICY
+                             ) -> BinChunk:
+    """ read_bin_from, waiting for the lock on the event loop.
+    """
+    base = Path(base)
+    return await read_locked(base / BIN_NAME, policy,
+                             _bin_from, base, offset, ino)
+
+def _last_bin(fd, base: Path) -> Row:
+    size = os.fstat(fd.fileno()).st_size
+    end = size - size % RECORD.size
+    if end == 0:
+        raise ValueError(f"{base/BIN_NAME} is empty")
+    fd.seek(end - RECORD.size)
+    t, ndx, pos, n, code = RECORD.unpack(fd.read(RECORD.size))
+    text = ""
+    if n > 0:
+        with open(base / INFO_NAME, 'rb') as fi:
+            fi.seek(pos)
+            text = fi.read(n).decode('utf-8')
+    return t, ndx, _states[code], text
+
+def read_last_bin_sync(base: PathLike,
+                       policy: StatusPolicy = DEFAULT_POLICY) -> Row:
+    """ Read only the last record of status.bin.
+    """
+    base = Path(base)
+    with open(base / BIN_NAME, 'rb') as fd:
+        with status_lock(fd, False, policy):
+            return _last_bin(fd, base)
+
+def read_rows_sync(base: PathLike,
+                   policy: StatusPolicy = DEFAULT_POLICY) -> List[Row]:
+    """ All transitions of the job at base (in either format).
+    """
+    if is_binary(base):
+        return read_bin_from(base, policy=policy)[0]
+    rows, _, _, _ = read_csv_from(Path(base) / CSV_NAME, policy=policy)
+    return [ (float(step[0]), int(step[1]), JobState(step[2]), step[3])
+             for step in rows ]
+
+def read_last_status_sync(base: PathLike,
+                          policy: StatusPolicy = DEFAULT_POLICY
+                         ) -> List[str]:
+    """ The last row of the job's status log (in either format),
+        split into fields as from status.csv.
+    """
+    if is_binary(base):
+        t, ndx, state, info = read_last_bin_sync(base, policy)
+        return [repr(t), str(ndx), state.value, info]
+    return read_last_csv_sync(Path(base) / CSV_NAME, policy=policy)
+
+async def read_last_status(base: PathLike,
+                           policy: StatusPolicy = DEFAULT_POLICY
+                          ) -> List[str]:
+    """ read_last_status_sync, waiting for the lock on the event loop.
+    """
+    base = Path(base)
+    if await aPath(base / BIN_NAME).is_file():
+        t, ndx, state, info = await read_locked(base / BIN_NAME, policy,
+                                                _last_bin, base)
+        return [repr(t), str(ndx), state.value, info]
+    return await read_last_csv(base / CSV_NAME, policy=policy)
+
+def has_status(base: PathLike) -> bool:
+    """ Does base hold a job status log (in either format)?
+    """
+    base = Path(base)
+    return (base / CSV_NAME).is_file() or (base / BIN_NAME).is_file()
+
+def to_csv(rows: List[Row], mode: StatusMode = "flock") -> str:
+    """ Format rows as the contents of status.csv.
+    """
+    return ''.join( csv_line((t, ndx, state.value, info), mode)
+                    for t, ndx, state, info in rows )
+
+def convert(base: PathLike, fmt: StatusFormat,
+            policy: StatusPolicy = DEFAULT_POLICY) -> bool:
+    """ Rewrite the job's status log in the format, fmt.
+
+        The new log is written before the old one is removed.
+        Returns False if it was already in that format.
+
+        The job must not be running, since concurrent
+        writers would still append to the old log.
+    """
+    base = Path(base)
+    binary = is_binary(base)
+    if binary == (fmt == "binary"):
+        return False
+    if fmt == "binary" and policy.mode == "append":
+        raise ValueError("Binary status logs need status_writes = flock.")
+    rows = read_rows_sync(base, policy)
+    if fmt == "binary":
+        trs = [ Transition(time=t, jobndx=ndx, state=state, info=info)
+                for t, ndx, state, info in rows ]
+        for name in (BIN_NAME, INFO_NAME):
+            (base / (name+".tmp")).unlink(missing_ok=True)
+        fd = os.open(base / (BIN_NAME+".tmp"),
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            write_records(fd, base / (INFO_NAME+".tmp"), trs)
+        finally:
+            os.close(fd)
+        os.replace(base / (INFO_NAME+".tmp"), base / INFO_NAME)
+        os.replace(base / (BIN_NAME+".tmp"), base / BIN_NAME)
+        (base / CSV_NAME).unlink()
+    else:
+        tmp = base / (CSV_NAME+".tmp")
+        tmp.write_text(to_csv(rows, policy.mode), encoding='utf-8')
+        os.replace(tmp, base / CSV_NAME)
+        (base / BIN_NAME).unlink()
+        (base / INFO_NAME).unlink(missing_ok=True)
+    return True
@@ -1,50 +1,155 @@
 from typing import (
-    Union,
-    TypeVar,
-    Callable,
     Any,
-    Awaitable,
+    Callable,
+    Union,
     Optional,
     List,
-    cast
+    Tuple,
+    Dict,
+    Iterable,
+    Sequence,
+    Literal,
+    NamedTuple,
+    TypeVar,
 )
-from functools import wraps, partial
+import os
+import json
+import time
+import zlib
 from pathlib import Path
+from functools import lru_cache
 from fcntl import flock, LOCK_UN, LOCK_SH, LOCK_EX, LOCK_NB
 import asyncio
 
 from anyio import Path as aPath
 from anyio import open_file, AsyncFile
+from anyio import to_thread
 
-# from https://github.com/kumaraditya303/aioshutil/blob/master/aioshutil/__init__.py
-T = TypeVar("T", bound=Callable[..., Any])
-def sync_to_async(func: T) -> Awaitable[T]:
-    @wraps(func)
-    async def run_in_executor(*args, **kwargs):
-        loop = asyncio.get_event_loop()
-        pfunc = partial(func, *args, **kwargs)
-        return await loop.run_in_executor(None, pfunc)
+from .exceptions import LockTimeoutException
 
-    return cast(Awaitable[T], run_in_executor)
+# How status files are written:
+#   flock  -- each append (and read) holds an flock
+#   append -- no locks; each record is checksummed and written with
+#             a single O_APPEND write(), so readers can skip torn lines
+StatusMode = Literal["flock", "append"]
 
-aflock = sync_to_async(flock)
+class StatusPolicy(NamedTuple):
+    """ How the status files of a prefix are accessed
+        (from Config.status_writes and Config.lock_timeout).
+
+        lock_timeout is the number of seconds to wait for a lock
+        before raising LockTimeoutException (None waits forever).
+    """
+    mode : StatusMode = "flock"
+    lock_timeout : Optional[float] = None
+
+DEFAULT_POLICY = StatusPolicy()
+
+# Every process writing to a prefix must use the same policy,
+# so JobManager records it in the prefix (unless it is the default),
+# where Job-s (e.g. from `psik reached`) look it up.
+POLICY_NAME = ".status_policy.json"
+
+def write_policy(prefix: Path, policy: StatusPolicy) -> None:
+    """ Record the policy for prefix (if it changed).
+    """
+    path = Path(prefix) / POLICY_NAME
+    if read_policy(prefix) == policy:
+        return
+    if policy == DEFAULT_POLICY:
+        path.unlink(missing_ok=True)
+        return
+    tmp = path.with_name(f"{POLICY_NAME}.{os.getpid()}")
+    tmp.write_text(json.dumps(policy._asdict()), encoding='utf-8')
+    os.replace(tmp, path)
+
+def read_policy(prefix: Path) -> StatusPolicy:
+    """ The policy recorded for prefix (or DEFAULT_POLICY).
+    """
+    path = Path(prefix) / POLICY_NAME
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return DEFAULT_POLICY
+    return _load_policy(path, mtime)
+
+@lru_cache(maxsize=32)
+def _load_policy(path: Path, mtime_ns: int) -> StatusPolicy:
+    try:
+        return StatusPolicy(**json.loads(path.read_text(encoding='utf-8')))
+    except (FileNotFoundError, ValueError, TypeError):
+        return DEFAULT_POLICY
+
+# backoff between attempts to take a contended lock (seconds)
+_backoff_min = 0.001
+_backoff_max = 0.05
+
+def _try_flock(fd, op) -> bool:
+    try:
+        flock(fd, op | LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
 
 class FLock:
     """ flock context manager that works
         in both regular (with Flock(): ...)
         and async mode (async with Flock(): ...)
+
+        Locks are taken with LOCK_NB.  While a lock is contended,
+        attempts are retried with exponential backoff
+        (up to 50 ms apart), sleeping asynchronously in async mode,
+        so waiting for a lock never holds a thread.  (Async readers
+        run only their reads in threads -- see read_locked.)
+
+        If the lock is not acquired within `timeout` seconds
+        (if given), LockTimeoutException is raised.
     """
-    def __init__(self, fd, flags):
+    def __init__(self, fd, flags, timeout: Optional[float] = None):
         self.fd, self.op = fd, flags
+        self.timeout = timeout
+
+    def _deadline(self) -> Optional[float]:
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+    def _wait(self, deadline: Optional[float], delay: float) -> float:
+        """ Time to sleep before the next attempt
+            (raises LockTimeoutException if time is up).
+        """
+        if deadline is None:
+            return delay
+        left = deadline - time.monotonic()
+        if left <= 0:
+            name = getattr(self.fd, 'name', self.fd)
+            raise LockTimeoutException(
+                    f"Timed out after {self.timeout} s waiting to lock {name}")
+        return min(delay, left)
+
     async def __aenter__(self):
-        await aflock(self.fd, self.op)
+        if self.op & LOCK_NB:
+            flock(self.fd, self.op)
+            return self
+        deadline = self._deadline()
+        delay = _backoff_min
+        while not _try_flock(self.fd, self.op):
+            await asyncio.sleep(self._wait(deadline, delay))
+            delay = min(2*delay, _backoff_max)
         return self
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await aflock(self.fd, LOCK_UN)
+        flock(self.fd, LOCK_UN)
         return False
 
     def __enter__(self):
-        flock(self.fd, self.op)
+        if self.op & LOCK_NB:
+            flock(self.fd, self.op)
+            return self
+        deadline = self._deadline()
+        delay = _backoff_min
+        while not _try_flock(self.fd, self.op):
+            time.sleep(self._wait(deadline, delay))
+            delay = min(2*delay, _backoff_max)
         return self
     def __exit__(self, exc_type, exc_value, traceback):
         flock(self.fd, LOCK_UN)
@@ -77,13 +182,19 @@ class ReadLock(FLock):
              pass
          except BlockingIOError:
            pass
+
+         try:
+           async with ReadLock(f, timeout=5.0):
+             pass
+         except LockTimeoutException:
+           pass
     """
 
-    def __init__(self, fd, blocking=True):
+    def __init__(self, fd, blocking=True, timeout=None):
         flags = LOCK_SH
         if not blocking:
             flags |= LOCK_NB
-        super().__init__(fd, flags)
+        super().__init__(fd, flags, timeout)
 
 class WriteLock(FLock):
     """WriteLock context manager based on
@@ -92,30 +203,357 @@ class WriteLock(FLock):
        See ReadLock for usage examples.
     """
 
-    def __init__(self, fd, blocking=True):
+    def __init__(self, fd, blocking=True, timeout=None):
         flags = LOCK_EX
         if not blocking:
             flags |= LOCK_NB
-        super().__init__(fd, flags)
+        super().__init__(fd, flags, timeout)
+
+class NoLock(FLock):
+    """ Stands in for ReadLock/WriteLock in "append" mode,
+        where status files are not locked.
+    """
+    def __init__(self, fd):
+        super().__init__(fd, 0)
+
+    async def __aenter__(self):
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+class CreateLock(FLock):
+    """ An exclusive lock held by creating the file, path
+        (with O_EXCL), for "append" mode, where flock may not work.
+
+        It is taken and retried like FLock.  The file names the
+        holder's host and pid, so that a lock left behind by a
+        process that died on the same host can be broken.
+    """
+    def __init__(self, path: Union[str, Path, aPath],
+                 timeout: Optional[float] = None):
+        super().__init__(str(path), 0, timeout)
+        self.path = Path(path)
+
+    def _try(self) -> bool:
+        me = f"{os.uname().nodename} {os.getpid()}"
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                         0o644)
+        except FileExistsError:
+            self._break_stale(me.split()[0])
+            return False
+        try:
+            os.write(fd, me.encode())
+        finally:
+            os.close(fd)
+        return True
+
+    def _break_stale(self, host: str) -> None:
+        try:
+            holder = self.path.read_text().split()
+            if len(holder) != 2 or holder[0] != host:
+                return
+            os.kill(int(holder[1]), 0)
+        except ProcessLookupError:
+            self.path.unlink(missing_ok=True)
+        except (OSError, ValueError):
+            pass
+
+    async def __aenter__(self):
+        deadline = self._deadline()
+        delay = _backoff_min
+        while not self._try():
+            await asyncio.sleep(self._wait(deadline, delay))
+            delay = min(2*delay, _backoff_max)
+        return self
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.path.unlink(missing_ok=True)
+        return False
 
-async def append_csv(f : Union[str,Path,aPath,AsyncFile], *vals) -> None:
+    def __enter__(self):
+        deadline = self._deadline()
+        delay = _backoff_min
+        while not self._try():
+            time.sleep(self._wait(deadline, delay))
+            delay = min(2*delay, _backoff_max)
+        return self
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.path.unlink(missing_ok=True)
+        return False
+
+def status_lock(fd, write: bool = False,
+                policy: StatusPolicy = DEFAULT_POLICY) -> FLock:
+    """ The lock to hold while accessing a status file
+        (none in "append" mode).
+    """
+    if policy.mode == "append":
+        return NoLock(fd)
+    if write:
+        return WriteLock(fd, timeout=policy.lock_timeout)
+    return ReadLock(fd, timeout=policy.lock_timeout)
+
+# Largest write guaranteed to be appended atomically.
+PIPE_BUF = 4096
+
+def checksum(line: str) -> str:
+    return "%08x" % zlib.crc32(line.encode('utf-8'))
+
+def csv_line(vals: Sequence, mode: StatusMode = "flock") -> str:
+    """ Format one csv record.  In "append" mode,
+        records are written as `~<crc32>,<record>`.
+    """
+    line = ','.join(map(str, vals))
+    if mode == "append":
+        return f"~{checksum(line)},{line}\n"
+    return line + '\n'
+
+def parse_row(line: str, maxcol=4) -> Optional[List[str]]:
+    """ Split one csv record, verifying its checksum (if any).
+
+        Returns None for empty lines and records that do not
+        match their checksum (e.g. torn by concurrent writes).
+    """
+    line = line.strip()
+    if line.startswith('~'):
+        crc, _, line = line[1:].partition(',')
+        if checksum(line) != crc:
+            return None
+    if len(line) == 0:
+        return None
+    return line.split(',', maxcol-1)
+
+def parse_rows(lines: Iterable[str], maxcol=4) -> List[List[str]]:
+    """ Split csv records, skipping empty and torn lines.
+    """
+    rows = []
+    for line in lines:
+        row = parse_row(line, maxcol)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+class _Batch:
+    def __init__(self) -> None:
+        self.lines : List[str] = []
+        self.done = asyncio.get_running_loop().create_future()
+        self.task : Optional[asyncio.Future] = None
+
+class AppendCoalescer:
+    """ Merge concurrent appends to the same file, so that
+        all lines pending for a file are written with
+        one open, one lock, and one write.
+
+        Appends to a file join its pending batch until that
+        batch's turn to write comes up.  Every caller returns
+        once its lines have been written.  Writes run in their
+        own task, so they complete even if a caller is cancelled.
+    """
+    def __init__(self) -> None:
+        self._pending : Dict[str, _Batch] = {}
+        # per-file write lock and number of batches using it
+        self._locks : Dict[str, Tuple[asyncio.Lock, List[int]]] = {}
+
+    async def append(self, f : Union[str,Path,aPath],
+                     lines : Iterable[str],
+                     policy : StatusPolicy = DEFAULT_POLICY) -> None:
+        key = str(f)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = _Batch()
+            self._pending[key] = batch
+            batch.task = asyncio.ensure_future(
+                                self._flush(f, key, batch, policy))
+        batch.lines.extend(lines)
+        await asyncio.shield(batch.done)
+
+    async def _flush(self, f : Union[str,Path,aPath],
+                     key : str, batch : _Batch,
+                     policy : StatusPolicy) -> None:
+        lock, users = self._locks.setdefault(key, (asyncio.Lock(), [0]))
+        users[0] += 1
+        try:
+            async with lock:
+                # close the batch -- later appends start a new one
+                del self._pending[key]
+                try:
+                    await write_lines(f, batch.lines, policy)
+                except Exception as e:
+                    batch.done.set_exception(e)
+                else:
+                    batch.done.set_result(None)
+        finally:
+            users[0] -= 1
+            if users[0] == 0:
+                del self._locks[key]
+
+_appender : Optional[AppendCoalescer] = None
+_appender_loop : Optional[asyncio.AbstractEventLoop] = None
+
+def appender() -> AppendCoalescer:
+    """ The AppendCoalescer for the running event loop.
+    """
+    global _appender, _appender_loop
+    loop = asyncio.get_running_loop()
+    if _appender is None or _appender_loop is not loop:
+        _appender = AppendCoalescer()
+        _appender_loop = loop
+    return _appender
+
+async def write_lines(f : Union[str,Path,aPath], lines : List[str],
+                      policy : StatusPolicy = DEFAULT_POLICY) -> None:
+    """ Append lines to f with a single (locked) write.
+
+        In "append" mode, no lock is taken, and lines are instead
+        written with as few O_APPEND writes as possible,
+        none crossing a line or larger than PIPE_BUF (if possible).
+    """
+    if policy.mode == "append":
+        return await to_thread.run_sync(append_records, f, lines)
+    async with await open_file(f, 'a', encoding='utf-8') as f2:
+        async with WriteLock(f2, timeout=policy.lock_timeout):
+            await f2.write(''.join(lines))
+
+def append_records(f : Union[str,Path,aPath], lines : List[str]) -> None:
+    fd = os.open(f, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        chunk = b""
+        for line in lines:
+            data = line.encode('utf-8')
+            if len(chunk) + len(data) > PIPE_BUF and len(chunk) > 0:
+                os.write(fd, chunk)
+                chunk = b""
+            chunk += data
+        if len(chunk) > 0:
+            os.write(fd, chunk)
+    finally:
+        os.close(fd)
+
+async def append_csv(f : Union[str,Path,aPath,AsyncFile], *vals,
+                     policy : StatusPolicy = DEFAULT_POLICY) -> None:
     if isinstance(f, AsyncFile):
-        async with WriteLock(f):
-            await f.write(','.join(map(str, vals)) + '\n')
+        async with status_lock(f, True, policy):
+            await f.write(csv_line(vals, policy.mode))
     else:
-        async with await open_file(f, 'a', encoding='utf-8') as f2:
-            async with WriteLock(f2):
-                await f2.write(','.join(map(str, vals)) + '\n')
+        await appender().append(f, [csv_line(vals, policy.mode)], policy)
+
+async def append_csv_many(f : Union[str,Path,aPath],
+                          rows : Iterable[Sequence],
+                          policy : StatusPolicy = DEFAULT_POLICY) -> None:
+    """ Append many rows to the csv file, f,
+        under one open and one lock.
+    """
+    await appender().append(f, [csv_line(vals, policy.mode)
+                                for vals in rows], policy)
 
-async def read_csv(f : Union[str,Path,aPath,AsyncFile], maxcol=4) -> List[str]:
+async def read_csv(f : Union[str,Path,aPath,AsyncFile], maxcol=4,
+                   policy : StatusPolicy = DEFAULT_POLICY) -> List[List[str]]:
     if isinstance(f, AsyncFile):
-        async with ReadLock(f):
+        async with status_lock(f, False, policy):
             lines = await f.readlines()
     else:
         async with await open_file(f, 'r', encoding='utf-8') as f2:
-            async with ReadLock(f2):
+            async with status_lock(f2, False, policy):
                 lines = await f2.readlines()
-    return [ l.strip().split(',', maxcol-1) for l in lines ]
+    return parse_rows(lines, maxcol)
+
+T = TypeVar("T")
+
+async def read_locked(f : Union[str,Path,aPath], policy : StatusPolicy,
+                      fn : Callable[..., T], *args : Any) -> T:
+    """ Call fn(fd, *args) in a worker thread, with f open
+        (as fd, in binary mode) and read-locked.
+
+        The lock is taken from the event loop, so that
+        waiting for it never holds a worker thread.
+    """
+    fd = await to_thread.run_sync(open, f, 'rb')
+    try:
+        async with status_lock(fd, False, policy):
+            return await to_thread.run_sync(fn, fd, *args)
+    finally:
+        fd.close()
+
+CsvChunk = Tuple[List[List[str]], int, int, int]
+
+def _csv_from(fd, offset : int, ino : Optional[int], maxcol) -> CsvChunk:
+    st = os.fstat(fd.fileno())
+    if (ino is not None and st.st_ino != ino) or st.st_size < offset:
+        offset = 0
+    fd.seek(offset)
+    data = fd.read()
+    # Only consume complete lines.
+    n = data.rfind(b'\n') + 1
+    rows = parse_rows(data[:n].decode('utf-8').splitlines(), maxcol)
+    return rows, offset, offset+n, st.st_ino
+
+def read_csv_from(f : Union[str,Path,aPath], offset : int = 0,
+                  ino : Optional[int] = None, maxcol=4,
+                  policy : StatusPolicy = DEFAULT_POLICY) -> CsvChunk:
+    """ Read the complete rows of a csv file starting
+        from byte `offset`.
+
+        If the file is no longer the one with inode number `ino`,
+        or has shrunk below offset, it is read from the start instead.
+
+        Returns (rows, start, end, ino), where rows came from
+        bytes [start, end) and ino is the file's inode number.
+        Pass end and ino back in to continue reading later.
+    """
+    with open(f, 'rb') as fd:
+        with status_lock(fd, False, policy):
+            return _csv_from(fd, offset, ino, maxcol)
+
+async def read_csv_from_async(f : Union[str,Path,aPath], offset : int = 0,
+                              ino : Optional[int] = None, maxcol=4,
+                              policy : StatusPolicy = DEFAULT_POLICY
+                             ) -> CsvChunk:
+    """ read_csv_from, waiting for the lock on the event loop.
+    """
+    return await read_locked(f, policy, _csv_from, offset, ino, maxcol)
+
+def last_line(f, blocksize: int = 4096) -> str:
+    """ Return the last complete line of the binary file, f,
+        by reading backwards from its end.
+    """
+    end = f.seek(0, 2)
+    pos = end
+    data = b""
+    while pos > 0:
+        step = min(blocksize, pos)
+        pos -= step
+        f.seek(pos)
+        data = f.read(step) + data
+        # look for the newline preceding the last line
+        if data.rstrip(b'\n').rfind(b'\n') >= 0:
+            break
+    lines = data.rstrip(b'\n').rsplit(b'\n', 1)
+    return lines[-1].decode('utf-8')
+
+def _last_csv(fd, maxcol) -> List[str]:
+    line = last_line(fd)
+    row = parse_row(line, maxcol)
+    if row is None: # torn -- find the last intact row
+        fd.seek(0)
+        rows = parse_rows(fd.read().decode('utf-8').splitlines(), maxcol)
+        row = rows[-1] if len(rows) > 0 else [line]
+    return row
+
+def read_last_csv_sync(f : Union[str,Path,aPath], maxcol=4,
+                       policy : StatusPolicy = DEFAULT_POLICY) -> List[str]:
+    with open(f, 'rb') as fd:
+        with status_lock(fd, False, policy):
+            return _last_csv(fd, maxcol)
+
+async def read_last_csv(f : Union[str,Path,aPath], maxcol=4,
+                        policy : StatusPolicy = DEFAULT_POLICY) -> List[str]:
+    """ Read only the last row of a csv file.
+    """
+    return await read_locked(f, policy, _last_csv, maxcol)
 
 async def create_file(name : aPath, content : str,
                       perm : Optional[int] = None) -> None:
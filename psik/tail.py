@@ -0,0 +1,156 @@
+""" Reading and following a job's output logs.
+
+    Each run (jobndx) of a job writes log/stdout.<jobndx> and
+    log/stderr.<jobndx>, while psik itself logs to log/console.
+    `tail_log` reads the log of the job's current run,
+    and (if following) keeps reading as it grows --
+    switching to the next run's log when the job is restarted,
+    and stopping once the job reaches a final state.
+
+    Logs are read in fixed-size chunks, so following a job
+    uses bounded memory no matter how much it writes.
+"""
+
+from typing import Optional, Tuple, Literal
+from collections.abc import AsyncGenerator
+import os
+import asyncio
+from pathlib import Path
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import to_thread
+
+from .job import Job, ArchivedJob
+from .watch import Inotify, IN_MODIFY, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO
+
+Stream = Literal["stdout", "stderr", "console"]
+STREAMS : Tuple[Stream, ...] = ("stdout", "stderr", "console")
+
+_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+
+def log_name(stream: Stream, jobndx: int) -> str:
+    """ Path of a log file, relative to the job's base.
+    """
+    if stream == "console":
+        return "log/console"
+    return f"log/{stream}.{jobndx}"
+
+def current_jobndx(job: Job) -> int:
+    """ The jobndx of the job's latest run (0 if it never ran).
+    """
+    n, _ = job.summarize()
+    return n-1
+
+def _read_chunk(path: Path, pos: int, size: int) -> Tuple[bytes, int]:
+    """ Read up to size bytes of path, starting at pos.
+        Returns the data and the new position.
+
+        A file shorter than pos has been truncated,
+        so it is read again from the start.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return b"", pos
+    with f:
+        if os.fstat(f.fileno()).st_size < pos:
+            pos = 0
+        f.seek(pos)
+        data = f.read(size)
+    return data, pos+len(data)
+
+async def tail_log(job: Job,
+                   stream: Stream = "stdout",
+                   follow: bool = False,
+                   interval: float = 1.0,
+                   inotify: Optional[bool] = None,
+                   chunk: int = 65536) -> AsyncGenerator[bytes, None]:
+    """ Yield the contents of the job's log for its current run.
+
+        If follow is set, continue yielding data as it is
+        written, until the job reaches a final state.
+
+        On Linux, inotify is used to learn when the log or status
+        changes.  Files are still re-checked every `interval` seconds,
+        since writes from other hosts (e.g. to a shared filesystem)
+        do not generate inotify events.
+    """
+    if not job.valid:
+        await job.read_info()
+    ndx = current_jobndx(job)
+
+    if isinstance(job, ArchivedJob):
+        try:
+            data = await to_thread.run_sync(job.pack.read, job.stamp,
+                                            log_name(stream, ndx))
+        except KeyError:
+            return
+        for i in range(0, len(data), chunk):
+            yield data[i:i+chunk]
+        return
+
+    base = Path(job.base)
+    pos = 0
+
+    async def drain() -> AsyncGenerator[bytes, None]:
+        nonlocal pos
+        while True:
+            data, pos = await to_thread.run_sync(
+                                _read_chunk, base/log_name(stream, ndx),
+                                pos, chunk)
+            if len(data) == 0:
+                return
+            yield data
+
+    if not follow:
+        async for data in drain():
+            yield data
+        return
+
+    ino = None
+    if inotify is not False:
+        try:
+            ino = Inotify()
+            for d in (base, base/"log"):
+                ino.add_watch(d, _MASK)
+        except Exception as e:
+            if ino is not None:
+                ino.close()
+                ino = None
+            if inotify:
+                raise
+            _logger.info("inotify unavailable (%s), polling instead", e)
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    if ino is not None:
+        loop.add_reader(ino.fd, ready.set)
+    try:
+        while True:
+            # Refresh before reading, so all output written
+            # before a final state is recorded gets read.
+            await job.refresh()
+            final = job.history[-1].state.is_final()
+            new = current_jobndx(job)
+            async for data in drain():
+                yield data
+            if new != ndx and stream != "console":
+                _logger.info("%s: following run %d", job.stamp, new)
+                ndx, pos = new, 0
+                continue
+            if final:
+                return
+            if ino is None:
+                await asyncio.sleep(interval)
+                continue
+            try:
+                await asyncio.wait_for(ready.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
+            ino.read()
+    finally:
+        if ino is not None:
+            loop.remove_reader(ino.fd)
+            ino.close()
@@ -0,0 +1,516 @@
+""" Streaming job state changes from a prefix.
+
+    A Watcher follows the status log of every job in a prefix,
+    remembering how far each has been read, and reports
+    transitions as they are appended.  Jobs created while
+    watching are reported from their first transition.
+
+    On Linux, inotify tells the watcher which status logs
+    changed (and when job directories appear), and the logs
+    are also re-checked once per polling interval.  Elsewhere,
+    or if inotify is unavailable, every status log is checked
+    for growth once per polling interval.
+
+    `changes` reports which of a given set of jobs changed
+    (without reading their logs), for callers waiting on them.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from collections.abc import AsyncGenerator
+import os
+import sys
+import errno
+import struct
+import asyncio
+import ctypes
+import ctypes.util
+from pathlib import Path
+import logging
+_logger = logging.getLogger(__name__)
+
+from anyio import to_thread
+
+from .models import Transition
+from .statfile import StatusPolicy, read_csv_from, read_policy
+from .statbin import BIN_NAME, CSV_NAME, RECORD, read_bin_from
+from .layout import (
+    Layout,
+    scan_all,
+    is_stamp,
+    is_shard,
+    is_flat_job,
+    job_depth,
+)
+
+Event = Tuple[str, Transition]
+
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+
+_DIR_MASK = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+_JOB_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO
+
+_event = struct.Struct("iIII") # wd, mask, cookie, len
+
+class Inotify:
+    """ Minimal ctypes binding to Linux inotify.
+    """
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify requires Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.fd = fd
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._add(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """ Return all pending (wd, mask, name) events.
+        """
+        events : List[Tuple[int, int, str]] = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, n = _event.unpack_from(data, pos)
+                pos += _event.size
+                name = data[pos:pos+n].rstrip(b'\0').decode()
+                pos += n
+                events.append( (wd, mask, name) )
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class _Tail:
+    """ Read position in one job's status log.
+    """
+    __slots__ = ("pos", "size", "ino")
+    def __init__(self) -> None:
+        self.pos = 0   # byte offset read up to
+        self.size = -1 # file size when last read
+        self.ino : Optional[int] = None
+
+DATE_DEPTH = job_depth("date")
+
+class Watcher:
+    """ Follow the status logs of all jobs in a prefix.
+
+        Iterate over `events()` to receive (stamp, Transition)
+        pairs for every transition appended after it starts.
+
+        Jobs are followed in both layouts (whichever one is
+        configured), since `migrate` leaves queued and active
+        jobs in place.
+
+        `version` counts the changes seen so far (new rows
+        and removed jobs), so it changes whenever the status
+        of any job in the prefix does -- once `started` is set.
+    """
+    def __init__(self, prefix: Path, layout: Layout,
+                 interval: float = 1.0,
+                 inotify: Optional[bool] = None,
+                 policy: Optional[StatusPolicy] = None) -> None:
+        self.prefix = Path(prefix)
+        self.layout = layout
+        # how status logs are read (default: as recorded in the prefix)
+        self.policy = read_policy(self.prefix) if policy is None \
+                        else policy
+        self.interval = interval
+        self.use_inotify = inotify
+        self.tails : Dict[Path, _Tail] = {}
+        self.version = 0
+        self.started = False # initial scan is complete
+
+    def _read(self, jobdir: Path) -> List[Event]:
+        """ Read the new rows of a job's status log.
+        """
+        tail = self.tails.get(jobdir)
+        if tail is None:
+            tail = self.tails[jobdir] = _Tail()
+        try:
+            if os.path.isfile(jobdir/BIN_NAME):
+                rows, start, end, ino = read_bin_from(jobdir,
+                                                      tail.pos, tail.ino,
+                                                      self.policy)
+                trs = [ Transition(time=t, jobndx=ndx, state=state,
+                                   info=info)
+                        for t, ndx, state, info in rows ]
+                path = jobdir/BIN_NAME
+            else:
+                steps, start, end, ino = read_csv_from(jobdir/CSV_NAME,
+                                                       tail.pos, tail.ino,
+                                                       policy=self.policy)
+                trs = []
+                for step in steps:
+                    try:
+                        trs.append(Transition.from_fields(step))
+                    except Exception:
+                        _logger.error("%s: Invalid row in status.csv: %s",
+                                      jobdir.name, step)
+                path = jobdir/CSV_NAME
+            tail.size = os.stat(path).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        tail.pos, tail.ino = end, ino
+        if trs:
+            self.version += 1
+        return [ (jobdir.name, t) for t in trs ]
+
+    def _skip(self, jobdir: Path) -> None:
+        """ Start following a job from the current end of its log.
+        """
+        tail = self.tails[jobdir] = _Tail()
+        for name in (BIN_NAME, CSV_NAME):
+            try:
+                st = os.stat(jobdir/name)
+            except FileNotFoundError:
+                continue
+            tail.size = st.st_size
+            tail.pos = st.st_size
+            if name == BIN_NAME:
+                tail.pos -= st.st_size % RECORD.size
+            tail.ino = st.st_ino
+            return
+
+    def _changed(self, jobdir: Path, tail: _Tail) -> bool:
+        for name in (BIN_NAME, CSV_NAME):
+            try:
+                st = os.stat(jobdir/name)
+            except FileNotFoundError:
+                continue
+            return st.st_size != tail.size or st.st_ino != tail.ino
+        return False
+
+    def _poll(self, initial: bool = False) -> List[Event]:
+        """ Check every job directory for new rows.
+        """
+        events : List[Event] = []
+        jobdirs = scan_all(self.prefix)
+        for jobdir in jobdirs:
+            tail = self.tails.get(jobdir)
+            if tail is None:
+                if initial:
+                    self._skip(jobdir)
+                else:
+                    events.extend(self._read(jobdir))
+            elif self._changed(jobdir, tail):
+                events.extend(self._read(jobdir))
+        for gone in set(self.tails) - set(jobdirs):
+            del self.tails[gone]
+            self.version += 1
+        return events
+
+    async def events(self) -> AsyncGenerator[Event, None]:
+        """ Yield (stamp, Transition) for each row appended
+            to a job's status log.  This never returns,
+            so break out (or cancel) when done.
+        """
+        ino = None
+        if self.use_inotify is not False:
+            try:
+                ino = Inotify()
+            except Exception as e:
+                if self.use_inotify:
+                    raise
+                _logger.info("inotify unavailable (%s), polling instead", e)
+        if ino is None:
+            await to_thread.run_sync(self._poll, True)
+            self.started = True
+            while True:
+                await asyncio.sleep(self.interval)
+                for ev in await to_thread.run_sync(self._poll):
+                    yield ev
+        else:
+            async for ev in self._notify(ino):
+                yield ev
+
+    async def _notify(self, ino: Inotify) -> AsyncGenerator[Event, None]:
+        wds : Dict[int, Tuple[Path, int]] = {}
+        unwatched : List[Tuple[Path, int]] = [] # (for polling)
+        full = False # out of inotify watches (ENOSPC)
+
+        def add_tree(path: Path, depth: int, initial: bool) -> List[Event]:
+            """ Watch path (at depth below the prefix) and
+                everything inside it.
+
+                Once the inotify watch limit is reached,
+                path and everything inside it are polled instead.
+            """
+            nonlocal full
+            events : List[Event] = []
+            try:
+                if full:
+                    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+                wd = ino.add_watch(path, _JOB_MASK if self._is_job(path, depth)
+                                                   else _DIR_MASK)
+                wds[wd] = (path, depth)
+            except FileNotFoundError:
+                return events
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    _logger.warning("Unable to watch %s (%s), polling it.",
+                                    path, e)
+                elif not full:
+                    full = True
+                    _logger.warning("Out of inotify watches at %s "
+                                    "(see fs.inotify.max_user_watches), "
+                                    "polling the remaining job directories.",
+                                    path)
+                unwatched.append( (path, depth) )
+                # (recheck covers everything inside path)
+                for jobdir in scan_below(path, depth):
+                    if initial:
+                        self._skip(jobdir)
+                    else:
+                        events.extend(self._read(jobdir))
+                return events
+            if self._is_job(path, depth):
+                if initial:
+                    self._skip(path)
+                else:
+                    events.extend(self._read(path))
+                return events
+            try:
+                names = sorted(os.listdir(path))
+            except FileNotFoundError:
+                return events
+            for name in names:
+                if self._valid(name, depth+1) and (path/name).is_dir():
+                    events.extend(add_tree(path/name, depth+1, initial))
+            return events
+
+        def handle(events: List[Tuple[int, int, str]]) -> List[Event]:
+            ans : List[Event] = []
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    ans.extend(self._poll())
+                    continue
+                if wd not in wds:
+                    continue
+                path, depth = wds[wd]
+                if mask & IN_IGNORED: # watched directory was removed
+                    del wds[wd]
+                    if self.tails.pop(path, None) is not None:
+                        self.version += 1
+                elif self._is_job(path, depth):
+                    if name in (CSV_NAME, BIN_NAME):
+                        ans.extend(self._read(path))
+                elif mask & IN_ISDIR and self._valid(name, depth+1):
+                    ans.extend(add_tree(path/name, depth+1, False))
+            return ans
+
+        def recheck() -> List[Event]:
+            """ Check every followed job for new rows (since
+                inotify events can be missed, e.g. for writes from
+                other hosts), and look for jobs in unwatched directories.
+            """
+            ans : List[Event] = []
+            for jobdir, followed in list(self.tails.items()):
+                if self._changed(jobdir, followed):
+                    ans.extend(self._read(jobdir))
+            unwatched[:] = [ (path, depth) for path, depth in unwatched
+                             if path.is_dir() ]
+            for path, depth in unwatched:
+                if self._is_job(path, depth):
+                    tail = self.tails.get(path)
+                    if tail is None or self._changed(path, tail):
+                        ans.extend(self._read(path))
+                else:
+                    for jobdir in scan_below(path, depth):
+                        tail = self.tails.get(jobdir)
+                        if tail is None or self._changed(jobdir, tail):
+                            ans.extend(self._read(jobdir))
+            return ans
+
+        def scan_below(path: Path, depth: int) -> List[Path]:
+            if self._is_job(path, depth):
+                return [path] if path.is_dir() else []
+            found : List[Path] = []
+            try:
+                names = sorted(os.listdir(path))
+            except FileNotFoundError:
+                return found
+            for name in names:
+                if self._valid(name, depth+1):
+                    found.extend(scan_below(path/name, depth+1))
+            return found
+
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(ino.fd, ready.set)
+        try:
+            await to_thread.run_sync(add_tree, self.prefix, 0, True)
+            self.started = True
+            next_check = loop.time() + self.interval
+            while True:
+                try:
+                    await asyncio.wait_for(ready.wait(),
+                                max(next_check - loop.time(), 0.0))
+                except asyncio.TimeoutError:
+                    pass
+                ready.clear()
+                for ev in await to_thread.run_sync(handle, ino.read()):
+                    yield ev
+                if loop.time() >= next_check:
+                    next_check = loop.time() + self.interval
+                    for ev in await to_thread.run_sync(recheck):
+                        yield ev
+        finally:
+            loop.remove_reader(ino.fd)
+            ino.close()
+
+    def _valid(self, name: str, depth: int) -> bool:
+        """ Is name a valid directory name at depth below the prefix?
+
+            Jobs of both layouts are followed, since `migrate`
+            leaves queued and active jobs in place.
+        """
+        if depth == 1:
+            return is_stamp(name) # (a flat job or YYYY shard)
+        if depth == DATE_DEPTH:
+            return is_stamp(name)
+        return is_shard(name, depth-1)
+
+    @staticmethod
+    def _is_job(path: Path, depth: int) -> bool:
+        """ Is the directory, path, at depth below the prefix
+            a job (rather than the prefix or a date shard)?
+        """
+        return depth == DATE_DEPTH or (depth == 1 and is_flat_job(path.name))
+
+def _log_stat(jobdir: Path) -> Optional[Tuple[int, int]]:
+    """ (inode, size) of the job's status log, or None if absent.
+    """
+    for name in (BIN_NAME, CSV_NAME):
+        try:
+            st = os.stat(jobdir/name)
+        except FileNotFoundError:
+            continue
+        return st.st_ino, st.st_size
+    return None
+
+async def changes(jobdirs: Set[Path],
+                  interval: float = 5.0,
+                  min_interval: float = 0.05,
+                  inotify: Optional[bool] = None
+                 ) -> AsyncGenerator[List[Path], None]:
+    """ Yield lists of job directories whose status logs changed.
+
+        The first list holds all of `jobdirs`, and is yielded once
+        watching has started, so that callers can check the current
+        state without missing any later change.
+
+        Callers may remove entries from `jobdirs` to stop
+        reporting on them.  Jobs are only stat-ed (never read) here.
+
+        With inotify, changes are reported as they happen,
+        and every log is also re-checked once per `interval`
+        (in case an event was missed).  Otherwise, the logs are polled with a delay that starts
+        at `min_interval` and doubles (up to `interval`)
+        for as long as nothing changes.
+    """
+    ino = None
+    if inotify is not False:
+        try:
+            ino = Inotify()
+        except Exception as e:
+            if inotify:
+                raise
+            _logger.info("inotify unavailable (%s), polling instead", e)
+
+    if ino is None:
+        last = await to_thread.run_sync(
+                    lambda: dict( (d, _log_stat(d)) for d in jobdirs ))
+        yield list(jobdirs)
+        delay = min_interval
+        while jobdirs:
+            await asyncio.sleep(delay)
+            def check() -> List[Path]:
+                changed = []
+                for d in list(jobdirs):
+                    st = _log_stat(d)
+                    if st != last.get(d):
+                        last[d] = st
+                        changed.append(d)
+                return changed
+            changed = await to_thread.run_sync(check)
+            if changed:
+                delay = min_interval
+                yield changed
+            else:
+                delay = min(delay*2, interval)
+        return
+
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    loop.add_reader(ino.fd, ready.set)
+    try:
+        wds : Dict[int, Path] = {}
+        stats : Dict[Path, Optional[Tuple[int, int]]] = {}
+        def add_all() -> None:
+            for d in list(jobdirs):
+                stats[d] = _log_stat(d)
+                try:
+                    wds[ino.add_watch(d, _JOB_MASK)] = d
+                except OSError as e:
+                    _logger.warning("Unable to watch %s (%s), polling it.",
+                                    d, e)
+        def update(seen: Dict[Path, None], recheck: bool) -> None:
+            # Record the logs inotify reported, and (every interval)
+            # re-stat all of them, since events can be missed
+            # (e.g. for writes from other hosts on a network filesystem).
+            for d in list(jobdirs) if recheck else list(seen):
+                st = _log_stat(d)
+                if st != stats.get(d):
+                    stats[d] = st
+                    seen[d] = None
+        await to_thread.run_sync(add_all)
+        yield list(jobdirs)
+        next_check = loop.time() + interval
+        while jobdirs:
+            try:
+                await asyncio.wait_for(ready.wait(),
+                                       max(next_check - loop.time(), 0.0))
+            except asyncio.TimeoutError:
+                pass
+            ready.clear()
+            seen : Dict[Path, None] = {}
+            for wd, mask, name in ino.read():
+                if mask & IN_Q_OVERFLOW:
+                    seen.update( (d, None) for d in jobdirs )
+                    break
+                d = wds.get(wd)
+                if d is not None and name in (CSV_NAME, BIN_NAME):
+                    seen[d] = None
+            recheck = loop.time() >= next_check
+            if recheck:
+                next_check = loop.time() + interval
+            await to_thread.run_sync(update, seen, recheck)
+            ans = [ d for d in seen if d in jobdirs ]
+            if ans:
+                yield ans
+    finally:
+        loop.remove_reader(ino.fd)
+        ino.close()
@@ -1,5 +1,10 @@
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Union
+from collections.abc import AsyncGenerator
+from functools import lru_cache
+import ssl
 import hmac
+import asyncio
+import weakref
 from urllib.parse import urlsplit, urlunsplit
 import hashlib
 import re
@@ -7,7 +12,10 @@ import logging
 _logger = logging.getLogger(__name__)
 
 import aiohttp
-from aiohttp.web import HTTPForbidden
+from aiohttp.web import HTTPForbidden, HTTPBadRequest
+from pydantic import TypeAdapter, ValidationError
+
+from .models import Callback
 
 def verify_signature(payload_body: str, secret_token: str,
                      signature_header: Optional[str]) -> None:
@@ -15,6 +23,9 @@ def verify_signature(payload_body: str, secret_token: str,
 
     Raise and return 403 if not authorized.
 
+    Batched callbacks (a JSON array of Callback-s, see psik.outbox)
+    are signed as a whole, so the payload_body is the entire array.
+
     Args:
         payload_body: original request body to verify (request.body())
         secret_token: GitHub app webhook token (WEBHOOK_SECRET)
@@ -26,6 +37,31 @@ def verify_signature(payload_body: str, secret_token: str,
     if not hmac.compare_digest(expected_signature, signature_header):
         raise HTTPForbidden(reason="Request signatures didn't match!")
 
+_callbacks : TypeAdapter[Union[Callback, List[Callback]]] \
+        = TypeAdapter(Union[Callback, List[Callback]]) # type: ignore[arg-type]
+
+def parse_callbacks(payload_body: str) -> List[Callback]:
+    """ Parse the body of a callback POST -- either one Callback,
+        or a batch (JSON array) of them.
+
+        Raise and return 400 if it is invalid.
+    """
+    try:
+        ans = _callbacks.validate_json(payload_body)
+    except ValidationError as e:
+        raise HTTPBadRequest(reason="Invalid callback.", text=str(e))
+    if isinstance(ans, Callback):
+        return [ans]
+    return ans
+
+def verify_callbacks(payload_body: str, secret_token: str,
+                     signature_header: Optional[str]) -> List[Callback]:
+    """ Verify the signature of a callback POST (as in verify_signature)
+        and return the Callback-s it contains.
+    """
+    verify_signature(payload_body, secret_token, signature_header)
+    return parse_callbacks(payload_body)
+
 def sign_message(payload_body: str, secret_token: str) -> str:
     hash_object = hmac.new(secret_token.encode("utf-8"),
                            msg=payload_body.encode("utf-8"),
@@ -51,6 +87,103 @@ async def get_json(url: str,
             #return await response.text()
 """
 
+class SessionPool:
+    """ Keep-alive HTTP sessions, one per (scheme, host).
+
+        Sessions use `certified` (when installed) for
+        client certificates, and otherwise share one default
+        SSL context.  Connections are reused between requests
+        to the same host.
+    """
+    def __init__(self) -> None:
+        self._sessions : Dict[str, aiohttp.ClientSession] = {}
+        # context managers which opened sessions (from certified)
+        self._contexts : Dict[str, Any] = {}
+        self._closer : Optional[AsyncGenerator[None, None]] = None
+        # held while opening a session, so that concurrent first
+        # requests to a host share one session
+        self._locks : Dict[str, asyncio.Lock] = {}
+
+    async def get(self, base: str) -> aiohttp.ClientSession:
+        """ The session for base (a URL with only scheme and host).
+        """
+        session = self._sessions.get(base)
+        if session is not None and not session.closed:
+            return session
+        async with self._locks.setdefault(base, asyncio.Lock()):
+            session = self._sessions.get(base)
+            if session is not None and not session.closed:
+                return session # opened while we waited
+            await self._close(base)
+            cert = _certified()
+            if cert is not None:
+                # certified's ClientSession is an async context manager.
+                ctx = cert.ClientSession(base)
+                session = await ctx.__aenter__()
+                self._contexts[base] = ctx
+            else:
+                connector = aiohttp.TCPConnector(ssl=_ssl_context())
+                session = aiohttp.ClientSession(base, connector=connector)
+            self._sessions[base] = session
+            return session
+
+    async def _close(self, base: str) -> None:
+        session = self._sessions.pop(base, None)
+        ctx = self._contexts.pop(base, None)
+        if ctx is not None:
+            await ctx.__aexit__(None, None, None)
+        elif session is not None:
+            await session.close()
+
+    async def close(self) -> None:
+        for base in list(self._sessions):
+            await self._close(base)
+
+@lru_cache(maxsize=1)
+def _certified() -> Optional[Any]:
+    try:
+        from certified import Certified # type: ignore[import-not-found]
+    except ImportError:
+        return None
+    return Certified()
+
+@lru_cache(maxsize=1)
+def _ssl_context() -> ssl.SSLContext:
+    return ssl.create_default_context()
+
+_pools : "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SessionPool]" \
+        = weakref.WeakKeyDictionary()
+
+async def _close_at_shutdown(pool: SessionPool) -> AsyncGenerator[None, None]:
+    # The event loop finalizes async generators when shutting
+    # down (e.g. at the end of asyncio.run), closing the pool.
+    try:
+        yield
+    finally:
+        await pool.close()
+
+def session_pool() -> SessionPool:
+    """ The SessionPool for the running event loop.
+
+        It is closed when the loop shuts down its async generators
+        (as asyncio.run does), or by calling close_sessions().
+    """
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = SessionPool()
+        _pools[loop] = pool
+        pool._closer = _close_at_shutdown(pool)
+        loop.create_task(pool._closer.__anext__())
+    return pool
+
+async def close_sessions() -> None:
+    """ Close the pooled sessions of the running event loop.
+    """
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
 async def post_json(url: str,
                     info: str,
                     token: Optional[str] = None,
@@ -67,19 +200,12 @@ async def post_json(url: str,
     base = urlunsplit((scheme, netloc,"","",""))
     url  = urlunsplit(("","",path,query,fragment))
 
-    cert = aiohttp
-    try:
-        from certified import Certified # type: ignore[import-not-found]
-        cert = Certified() # type: ignore[assignment]
-    except ImportError:
-        pass
-
-    async with cert.ClientSession(base) as session:
-        async with session.post(url, data=info, headers=headers) \
-                    as response:
-            if response.status != 200:
-                return None
-            #print("Content-type:", response.headers['content-type'])
-            if response.headers['content-type'] == 'application/json':
-                return await response.json()
-            return await response.text()
+    session = await session_pool().get(base)
+    async with session.post(url, data=info, headers=headers) as response:
+        if response.status != 200:
+            await response.read() # so the connection can be reused
+            return None
+        #print("Content-type:", response.headers['content-type'])
+        if response.content_type == 'application/json':
+            return await response.json()
+        return await response.text()
@@ -0,0 +1,137 @@
+from time import time as timestamp
+
+import pytest
+
+from psik.manager import JobManager
+from psik.job import ArchivedJob
+from psik.models import JobSpec, JobState
+from psik.archive import pack_name, pack_span, packs, find_pack
+from psik.exceptions import InvalidJobException
+
+from .test_config import mk_config
+
+def test_pack_name():
+    assert pack_name("1760000000.123", "day") == "2025-10-09.zip"
+    assert pack_name("1760000000.123", "month") == "2025-10.zip"
+    lo, hi = pack_span("2025-10-09.zip")
+    assert lo <= 1760000000.123 < hi
+    lo, hi = pack_span("2025-12.zip")
+    assert hi - lo == 31*86400
+    assert pack_span("index.zip") is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("layout,period", [("flat", "day"),
+                                           ("date", "month")])
+async def test_archive(tmp_path, layout, period):
+    mgr = JobManager(mk_config(tmp_path, layout=layout))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i}", script="true"))
+             for i in range(3) ]
+    await (jobs[0].base/'work'/'out.txt').write_text("hello")
+    for job in jobs[:2]:
+        await job.reached(1, JobState.completed)
+
+    stamps = await mgr.archive(timestamp()+1, period)
+    assert stamps == [jobs[0].stamp, jobs[1].stamp]
+    assert not await jobs[0].base.exists()
+    assert await jobs[2].base.is_dir()
+    assert await mgr.archive(timestamp()+1, period) == []
+
+    # archived jobs are still listed, in order
+    listed = [ job async for job in mgr.ls() ]
+    assert [j.stamp for j in listed] == [job.stamp for job in jobs]
+    assert listed[0].pack is not None and listed[2].pack is None
+    assert listed[1].state == JobState.completed
+    assert listed[1].name == "job1"
+    assert [j.stamp async for j in mgr.ls(name="job0")] == [jobs[0].stamp]
+    assert [j.stamp async for j in mgr.ls(reverse=True, limit=2)] == \
+                [jobs[2].stamp, jobs[1].stamp]
+
+    # and can be read, but not modified
+    full = await listed[0]
+    assert isinstance(full, ArchivedJob)
+    assert [t.state for t in full.history] == [JobState.new,
+                                               JobState.completed]
+    assert full.spec.name == "job0"
+    assert full.pack.read_text(full.stamp, "work/out.txt") == "hello"
+    with pytest.raises(InvalidJobException):
+        await full.reached(2, JobState.queued)
+    assert (await mgr.job(jobs[1].stamp)).spec.name == "job1"
+    with pytest.raises(InvalidJobException):
+        await mgr.job("1.000")
+
+    # indexes include archived jobs
+    assert await mgr.reindex() == 3
+    listed = [ job async for job in mgr.ls() ]
+    assert [j.stamp for j in listed] == [job.stamp for job in jobs]
+    assert isinstance(await listed[0], ArchivedJob)
+    assert listed[0].name == "job0"
+    assert (await listed[0].load_spec()).script == "true"
+    assert find_pack(tmp_path, jobs[0].stamp) == packs(tmp_path)[0]
+
+@pytest.mark.asyncio
+async def test_archive_safety(tmp_path, monkeypatch):
+    import os
+    import threading
+    import psik.archive
+    from psik.archive import _pack_jobs
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i}", script="true"))
+             for i in range(6) ]
+    for job in jobs:
+        await job.reached(1, JobState.completed)
+    path = tmp_path/".archive"/pack_name(jobs[0].stamp, "day")
+
+    # concurrent writers of one pack keep all members
+    dirs = [ tmp_path/job.stamp for job in jobs ]
+    threads = [ threading.Thread(target=_pack_jobs, args=(path, d))
+                for d in (dirs[:2], dirs[2:4]) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(packs(tmp_path)[0].stamps()) == \
+                sorted(job.stamp for job in jobs[:4])
+
+    # a failed write leaves the pack (and the jobs) intact
+    def crash(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(psik.archive, "_write_pack", crash)
+    assert await mgr.archive(timestamp()+1) == []
+    assert await jobs[4].base.is_dir()
+    assert len(packs(tmp_path)[0].stamps()) == 4
+    assert sorted(os.listdir(path.parent)) == ["."+path.name+".lock",
+                                               path.name]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("layout", ["flat", "date"])
+async def test_archive_lazy(tmp_path, layout, monkeypatch):
+    import calendar
+    import psik.manager
+    from psik.archive import Pack
+    days = [(1, 5), (1, 6), (1, 7), (2, 10)]
+    now = [0.0]
+    monkeypatch.setattr(psik.manager, "timestamp", lambda: now[0])
+    mgr = JobManager(mk_config(tmp_path, layout=layout))
+    jobs = []
+    for i, (m, d) in enumerate(days):
+        now[0] = calendar.timegm((2026, m, d, 12, 0, 0))
+        jobs.append(await mgr.create(JobSpec(name=f"job{i}", script="true")))
+    for i in (0, 1, 3):
+        await jobs[i].reached(1, JobState.completed)
+    monkeypatch.setattr(psik.manager, "timestamp", timestamp)
+    assert await mgr.archive(timestamp(), "month") == \
+                [jobs[i].stamp for i in (0, 1, 3)]
+
+    opened = []
+    stamps = Pack.stamps
+    def counted(self):
+        opened.append(self.path.name)
+        return stamps(self)
+    monkeypatch.setattr(Pack, "stamps", counted)
+    # packs are read only as the listing reaches them
+    assert [j.stamp async for j in mgr.ls(reverse=True, limit=1)] == \
+                [jobs[3].stamp]
+    assert opened == ["2026-02.zip"]
+    assert [j.stamp async for j in mgr.ls()] == [j.stamp for j in jobs]
+    assert [j.stamp async for j in mgr.ls(reverse=True)] == \
+                [j.stamp for j in reversed(jobs)]
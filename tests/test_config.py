@@ -28,6 +28,10 @@ def write_config(tmp_path):
     config.write_text(cfg % prefix, encoding='utf-8')
     return config
 
+def mk_config(tmp_path, **kws):
+    backend = BackendConfig(type = "local")
+    return Config(prefix = tmp_path, backends = {"default":backend}, **kws)
+
 def test_config():
     config = Config.model_validate_json(cfg % "/tmp")
     assert str(config.prefix) == "/tmp"
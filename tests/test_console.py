@@ -1,4 +1,10 @@
-from psik.console import run_shebang
+import os
+import time
+import asyncio
+
+import pytest
+
+from psik.console import run_shebang, run_shebang_async
 
 def test_run_shebang(tmp_path):
     # Create a script that spawns a background child process, which is a key test
@@ -45,3 +51,53 @@ def test_run_shebang(tmp_path):
     except FileNotFoundError:
         print("STDOUT file not found.")
         raise
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try: # (zombies are dead too)
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return True
+
+@pytest.mark.asyncio
+async def test_run_shebang_async(tmp_path):
+    out, err = tmp_path/"out", tmp_path/"err"
+    script = "#!/bin/sh\necho $FOO; pwd; sleep 0.5\nexit 3\n"
+
+    # the event loop keeps running alongside the script
+    ticks = 0
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.05)
+            ticks += 1
+    task = asyncio.ensure_future(tick())
+    ret = await run_shebang_async(script, out, err, env={"FOO": "bar"},
+                                  cwd=tmp_path)
+    task.cancel()
+    assert ret == 3
+    assert ticks >= 5
+    assert out.read_text().split() == ["bar", str(tmp_path)]
+
+    # timeouts (in minutes) stop the whole process group
+    script = "#!/bin/sh\nsleep 30 &\necho $!\nwait\n"
+    t0 = time.time()
+    assert await run_shebang_async(script, out, err, timeout=0.01) == 9
+    assert time.time() - t0 < 5
+    child = int(out.read_text())
+    await asyncio.sleep(0.1)
+    assert not alive(child)
+
+    # as does cancelling the task
+    task = asyncio.ensure_future(run_shebang_async(script, out, err))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    child = int(out.read_text())
+    await asyncio.sleep(0.1)
+    assert not alive(child)
@@ -0,0 +1,74 @@
+import random
+
+import pytest
+
+from psik.history import History
+from psik.models import JobState, Transition
+
+def ref_summarize(history):
+    # original, non-incremental implementation
+    jobndx = 1
+    status = dict( (s, set()) for s in JobState )
+    del status[JobState.new]
+    for t in history:
+        ndx = t.jobndx
+        if ndx >= jobndx:
+            jobndx = ndx+1
+        if t.state in status:
+            status[t.state].add(ndx)
+    done = status[JobState.canceled] \
+         | status[JobState.failed]    \
+         | status[JobState.completed]
+    status[JobState.queued] -= status[JobState.active] | done
+    status[JobState.active] -= done
+    return jobndx, status
+
+def ref_live_ids(history):
+    native_ids = {}
+    for t in history:
+        if t.state == JobState.queued:
+            native_ids[t.jobndx] = t.info
+        elif t.state in [JobState.completed, JobState.failed]:
+            native_ids.pop(t.jobndx, None)
+    return list(native_ids.values())
+
+def test_history():
+    h = History()
+    assert len(h) == 0
+    assert h.summarize()[0] == 1
+    trs = [Transition(time=1.5, jobndx=0, state=JobState.new, info="{}"),
+           Transition(time=2.5, jobndx=1, state=JobState.queued, info="x,y")]
+    h.extend(trs)
+    assert len(h) == 2
+    assert h[0] == trs[0]
+    assert h[-1] == trs[1]
+    assert h[:] == trs
+    assert list(h) == trs
+    assert isinstance(h[1], Transition)
+    with pytest.raises(IndexError):
+        h[2]
+    assert h.rows(1) == [(2.5, 1, JobState.queued, "x,y")]
+    h.truncate(1)
+    assert list(h) == trs[:1]
+    assert h.live_ids() == []
+    h.append_row(3.5, 2, JobState.queued, "z")
+    assert h[-1] == Transition(time=3.5, jobndx=2,
+                               state=JobState.queued, info="z")
+    assert h.live_ids() == ["z"]
+
+def test_incremental():
+    rng = random.Random(11)
+    states = list(JobState)
+    h = History()
+    rows = []
+    for i in range(400):
+        t = Transition(time=float(i), jobndx=rng.randrange(0, 20),
+                       state=rng.choice(states), info=str(i))
+        h.append(t)
+        rows.append(t)
+        assert h.summarize() == ref_summarize(rows)
+        assert h.live_ids() == ref_live_ids(rows)
+
+    h.truncate(150)
+    assert h.summarize() == ref_summarize(rows[:150])
+    assert h.live_ids() == ref_live_ids(rows[:150])
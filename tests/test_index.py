@@ -0,0 +1,101 @@
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from psik.config import load_config
+from psik.manager import JobManager
+from psik.index import JobIndex, INDEX_NAME
+from psik.models import JobSpec, JobState
+from psik.psik import app
+
+from .test_config import write_config, mk_config
+
+@pytest.mark.asyncio
+async def test_index(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    assert mgr.index is not None
+    assert (tmp_path / INDEX_NAME).is_file()
+
+    job1 = await mgr.create(JobSpec(name="a", script="true"))
+    job2 = await mgr.create(JobSpec(name="b", script="true"))
+    assert job1.index is not None
+    await job2.reached(1, JobState.active)
+
+    jobs = [job async for job in mgr.ls()]
+    assert [j.stamp for j in jobs] == [job1.stamp, job2.stamp]
+    assert jobs[0].name == "a"
+    assert jobs[0].last.state == JobState.new
+    assert jobs[1].last.state == JobState.active
+
+    # loading the job reads its full history
+    job = await jobs[1]
+    assert len(job.history) == 2
+
+    # drift: a status update made without the index is recovered
+    with open(job1.base / 'status.csv', 'a') as f:
+        f.write("1.0,1,failed,bad\n")
+    assert await mgr.reindex() == 2
+    rows = await mgr.index.rows()
+    assert rows[0][3].state == JobState.failed
+    assert rows[0][3].info == "bad"
+
+@pytest.mark.asyncio
+async def test_index_found(tmp_path):
+    # a manager without an index does not create one
+    mgr = JobManager(mk_config(tmp_path))
+    assert mgr.index is None
+    job = await mgr.create(JobSpec(name="a", script="true"))
+    assert await JobIndex.find(job.base) is None
+    assert await mgr.reindex() == 1
+
+    # once it exists, the index is found and updated by new jobs
+    mgr = JobManager(mk_config(tmp_path))
+    assert mgr.index is not None
+    job2 = await mgr.create(JobSpec(name="b", script="true"))
+    rows = await mgr.index.rows()
+    assert [r[0] for r in rows] == [job.stamp, job2.stamp]
+
+@pytest.mark.asyncio
+async def test_index_busy(tmp_path):
+    import sqlite3
+    import asyncio
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    job = await mgr.create(JobSpec(name="a", script="true"))
+
+    # status updates do not wait long for a busy index
+    con = sqlite3.connect(str(tmp_path / INDEX_NAME))
+    con.execute("BEGIN EXCLUSIVE")
+    try:
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        await job.reached(1, JobState.active)
+        assert loop.time() - t0 < 5.0
+    finally:
+        con.close()
+    await job.reached(1, JobState.completed)
+    rows = await mgr.index.rows()
+    assert rows[0][3].state == JobState.completed
+
+def test_reindex_cli(tmp_path):
+    runner = CliRunner()
+    cfg = str(write_config(tmp_path))
+    config = load_config(cfg)
+    spec = tmp_path/'jobspec.json'
+    spec.write_text('{ "name": "foo", "script": "true" }')
+
+    result = runner.invoke(app, ["run", "--config", cfg, "--no-submit", str(spec)])
+    assert result.exit_code == 0
+    result = runner.invoke(app, ["reindex", "--config", cfg])
+    assert result.exit_code == 0
+    assert "Indexed 1 jobs" in result.stdout
+
+    result = runner.invoke(app, ["ls", "--config", cfg])
+    assert result.exit_code == 0
+    assert "foo" in result.stdout
+
+    stamp = next(config.prefix.glob('[0-9]*')).name
+    result = runner.invoke(app, ["rm", "--config", cfg, stamp])
+    assert result.exit_code == 0
+    result = runner.invoke(app, ["ls", "--config", cfg])
+    assert "foo" not in result.stdout
@@ -0,0 +1,170 @@
+import os
+import asyncio
+
+import pytest
+
+from psik.manager import JobManager
+from psik.job import Job
+from psik.models import JobSpec, JobState, Transition
+
+from .test_config import mk_config
+
+@pytest.mark.asyncio
+async def test_refresh(tmp_path):
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    other = await Job(job.base)
+    status = job.base/'status.csv'
+
+    # rows appended elsewhere show up, and our own are not duplicated
+    await other.reached(1, JobState.queued, "11")
+    await job.reached(1, JobState.active)
+    await other.reached(1, JobState.completed)
+    await job.refresh()
+    assert [t.state for t in job.history] == [JobState.new,
+                JobState.queued, JobState.active, JobState.completed]
+    pos = job._status_pos
+    assert pos == (await status.stat()).st_size
+
+    # partial lines are left for the next refresh
+    with open(status, 'a') as f:
+        f.write("1.0,2,queued,1")
+    await job.refresh()
+    assert len(job.history) == 4
+    with open(status, 'a') as f:
+        f.write("2\n")
+    await job.refresh()
+    assert len(job.history) == 5
+    assert job.history[-1].info == "12"
+
+    # spec is only re-read when modified
+    spec = job.spec
+    await job.refresh()
+    assert job.spec is spec
+    other.spec.name = "bar"
+    text = other.spec.model_dump_json(indent=4)
+    await (job.base/'spec.json').write_text(text)
+    os.utime(job.base/'spec.json', ns=(0, 0))
+    await job.refresh()
+    assert job.spec.name == "bar"
+
+    # a replaced status file is read from the start
+    lines = (await status.read_text()).split('\n')
+    tmp = job.base/'status.tmp'
+    await tmp.write_text('\n'.join(lines[:2]) + '\n')
+    os.replace(tmp, status)
+    await job.refresh()
+    assert len(job.history) == 2
+    assert job.info.backend.type == "local"
+
+@pytest.mark.asyncio
+async def test_reached_many(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    trs = [ Transition(time=10.0+i, jobndx=1, state=s, info=str(i))
+            for i, s in enumerate([JobState.queued, JobState.active,
+                                   JobState.completed]) ]
+    await job.reached_many(trs)
+    await job.reached_many([])
+    assert job.history[1:] == trs
+
+    other = await Job(job.base)
+    assert other.history[1:] == trs
+    listed = [ j async for j in mgr.ls() ]
+    assert listed[0].last == trs[-1]
+
+@pytest.mark.asyncio
+async def test_append_mode(tmp_path):
+    from psik.statfile import StatusPolicy
+    mgr = JobManager(mk_config(tmp_path, status_writes="append"))
+    (tmp_path/"other").mkdir()
+    other_mgr = JobManager(mk_config(tmp_path/"other"))
+    assert mgr.policy == StatusPolicy("append")
+    assert other_mgr.policy == StatusPolicy()
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    # as from `psik reached`, with no config loaded
+    await Job(job.base).reached(1, JobState.queued, "11")
+    assert (await job.base.joinpath('status.csv').read_text()) \
+                .splitlines()[-1].startswith('~')
+    with open(job.base/'status.csv', 'a') as f:
+        f.write("~00000000,1.0,1,active,\n")
+    other = await Job(job.base)
+    assert [t.state for t in other.history] == [JobState.new,
+                                                JobState.queued]
+    assert other.info.backend.type == "local"
+
+@pytest.mark.asyncio
+async def test_no_flock(tmp_path, monkeypatch):
+    import errno
+    import psik.statfile, psik.archive
+    from time import time as timestamp
+    def no_flock(fd, op):
+        raise OSError(errno.ENOLCK, "No locks available")
+    monkeypatch.setattr(psik.statfile, "flock", no_flock)
+    monkeypatch.setattr(psik.archive, "flock", no_flock)
+
+    mgr = JobManager(mk_config(tmp_path, status_writes="append"))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true")
+                                  for i in range(3)])
+    await jobs[0].submit()
+    await jobs[0].reached(1, JobState.completed)
+    await Job(jobs[1].base).reached(0, JobState.canceled)
+    assert [job.stamp async for job in mgr.ls()] == \
+                [job.stamp for job in jobs]
+    done = await mgr.wait([jobs[0].stamp], timeout=5.0, interval=0.1)
+    assert done[jobs[0].stamp].state == JobState.completed
+
+    gen = mgr.watch(interval=0.05, inotify=False)
+    async def seen(stamp):
+        async for ev in gen:
+            if ev[0] == stamp:
+                return True
+    task = asyncio.ensure_future(seen(jobs[2].stamp))
+    await asyncio.sleep(0.2)
+    await jobs[2].reached(0, JobState.canceled)
+    assert await asyncio.wait_for(task, 5.0)
+    await gen.aclose()
+
+    from psik.layout import migrate
+    assert await mgr.reindex() == 3
+    assert migrate(tmp_path, "date") == 3
+    assert await mgr.archive(timestamp()) == [job.stamp for job in jobs]
+    assert [job.stamp async for job in mgr.ls()] == \
+                [job.stamp for job in jobs]
+
+@pytest.mark.asyncio
+async def test_lock_waits(tmp_path):
+    # readers waiting for a lock do not use up worker threads
+    from anyio import to_thread
+    from psik.statfile import WriteLock
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    with open(job.base/'status.csv', 'a') as f:
+        with WriteLock(f):
+            readers = [ asyncio.ensure_future(Job(job.base).read_info())
+                        for i in range(60) ]
+            await asyncio.sleep(0.1)
+            assert await asyncio.wait_for(
+                        to_thread.run_sync(lambda: 1), 1.0) == 1
+            assert not any(r.done() for r in readers)
+    for job in await asyncio.gather(*readers):
+        assert len(job.history) == 1
+
+@pytest.mark.asyncio
+async def test_wait(tmp_path):
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    with pytest.raises(asyncio.TimeoutError):
+        await job.wait(timeout=0.1)
+
+    async def finish():
+        await asyncio.sleep(0.1)
+        await job.reached(1, JobState.queued, "11")
+        await job.reached(1, JobState.failed, "1")
+    task = asyncio.ensure_future(finish())
+    waiter = await Job(job.base)
+    trs = await waiter.wait(timeout=5.0)
+    await task
+    assert trs.state == JobState.failed and trs.info == "1"
+    # already there
+    assert (await waiter.wait([JobState.failed], timeout=0)) == trs
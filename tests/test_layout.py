@@ -0,0 +1,148 @@
+from pathlib import Path
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
+from psik.layout import (
+    shard,
+    job_path,
+    find_job,
+    prefix_of,
+    shards,
+    migrate,
+)
+from psik.psik import app
+
+from .test_config import mk_config
+
+def test_paths(tmp_path):
+    assert shard("0.5") == "1970/01/01"
+    assert shard("1760000000.123") == "2025/10/09"
+    p = job_path(tmp_path, "1760000000.123", "date")
+    assert p == tmp_path/"2025"/"10"/"09"/"1760000000.123"
+    assert prefix_of(p) == tmp_path
+    assert job_path(tmp_path, "1760000000.123", "flat") == \
+                tmp_path/"1760000000.123"
+    assert prefix_of(tmp_path/"1760000000.123") == tmp_path
+
+    # fall back to the other layout when present
+    assert find_job(tmp_path, "1760000000.123", "flat") == \
+                tmp_path/"1760000000.123"
+    p.mkdir(parents=True)
+    assert find_job(tmp_path, "1760000000.123", "flat") == p
+    assert find_job(tmp_path, "test", "date") == tmp_path/"test"
+
+def test_shards(tmp_path):
+    for d in ["2024/12/31", "2025/01/01", "2025/01/02", "2025/02/01"]:
+        (tmp_path/d).mkdir(parents=True)
+    (tmp_path/"2025"/"x").mkdir()
+    days = [str(p.relative_to(tmp_path)) for p in shards(tmp_path)]
+    assert days == ["2024/12/31", "2025/01/01", "2025/01/02", "2025/02/01"]
+
+    t = 1735776000.0 # 2025-01-02T00:00:00Z
+    days = [str(p.relative_to(tmp_path)) for p in
+                    shards(tmp_path, since=t-1, until=t+1, reverse=True)]
+    assert days == ["2025/01/02", "2025/01/01"]
+
+@pytest.mark.asyncio
+async def test_date_layout(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, layout="date"))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i}", script="true"))
+             for i in range(3) ]
+    for job in jobs:
+        assert job.base == mgr.path(job.stamp)
+        assert str(job.base.parent.relative_to(mgr.prefix)) == shard(job.stamp)
+    stamps = [job.stamp for job in jobs]
+
+    assert [j.stamp async for j in mgr.ls()] == stamps
+    assert [j.stamp async for j in mgr.ls(limit=2, reverse=True)] \
+                == stamps[:0:-1]
+    assert [j.stamp async for j in mgr.ls(since=float(stamps[1]))] \
+                == stamps[1:]
+    assert mgr._jobdirs() == [Path(j.base) for j in jobs]
+
+@pytest.mark.asyncio
+async def test_migrate(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i}", script="true"))
+             for i in range(4) ]
+    await jobs[3].reached(1, JobState.active)
+    stamps = [job.stamp for job in jobs]
+
+    assert migrate(tmp_path, "date", 2) == 3
+    mgr = JobManager(mk_config(tmp_path, layout="date"))
+    ls = [job async for job in mgr.ls()]
+    assert [job.stamp for job in ls] == stamps
+    # active job is left in place
+    assert (tmp_path / stamps[3]).is_dir()
+    # spec.directory was moved along with the job
+    job = await ls[0]
+    assert job.base == mgr.path(stamps[0])
+    assert job.spec.directory == str(job.base/'work')
+
+    assert migrate(tmp_path, "flat") == 3
+    assert not (tmp_path / shard(stamps[0])).exists()
+    mgr = JobManager(mk_config(tmp_path))
+    job = await (await mgr.ls(limit=1).__anext__())
+    assert job.spec.directory == str(tmp_path/stamps[0]/'work')
+
+@pytest.mark.asyncio
+async def test_mixed_layout(tmp_path):
+    import asyncio
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i}", script="true"))
+             for i in range(3) ]
+    await jobs[1].reached(1, JobState.active)
+    stamps = [job.stamp for job in jobs]
+    assert migrate(tmp_path, "date") == 2
+
+    # jobs left in the flat layout are still listed and watched
+    mgr = JobManager(mk_config(tmp_path, layout="date"))
+    assert [job.stamp async for job in mgr.ls()] == stamps
+    assert [j.stamp async for j in mgr.ls(state=JobState.active)] \
+                == [stamps[1]]
+    job = await (await mgr.ls(state=JobState.active).__anext__())
+    assert job.base == tmp_path/stamps[1]
+    assert mgr._jobdirs() == [Path(j.base) for j in
+                              [await mgr.job(s) for s in stamps]]
+
+    for inotify in (False, True):
+        gen = mgr.watch(interval=0.05, inotify=inotify)
+        task = asyncio.ensure_future(gen.__anext__())
+        await asyncio.sleep(0.2)
+        await job.reached(1, JobState.completed)
+        stamp, trs = await asyncio.wait_for(task, 5.0)
+        await gen.aclose()
+        assert stamp == stamps[1]
+        await job.reached(2, JobState.queued)
+
+def test_migrate_cli(tmp_path):
+    runner = CliRunner()
+    cfg = tmp_path/"psik.json"
+    prefix = tmp_path/"prefix"
+    prefix.mkdir()
+    cfg.write_text(json.dumps({"prefix": str(prefix), "layout": "date"}))
+    spec = tmp_path/'jobspec.json'
+    spec.write_text('{ "name": "foo", "script": "true" }')
+
+    result = runner.invoke(app, ["run", "--config", str(cfg), "--no-submit", str(spec)])
+    assert result.exit_code == 0
+    stamp = result.stdout.split()[-1]
+    assert (prefix/shard(stamp)/stamp).is_dir()
+    result = runner.invoke(app, ["status", "--config", str(cfg), stamp])
+    assert result.exit_code == 0
+    assert str(prefix/shard(stamp)/stamp) in result.stdout
+
+    result = runner.invoke(app, ["migrate-layout", "--config", str(cfg), "--to", "flat"])
+    assert result.exit_code == 0
+    assert "Moved 1 jobs" in result.stdout
+    # still found through the fallback
+    result = runner.invoke(app, ["status", "--config", str(cfg), stamp])
+    assert result.exit_code == 0
+    assert str(prefix/stamp) in result.stdout
+
+    result = runner.invoke(app, ["migrate-layout", "--config", str(cfg), "--to", "x"])
+    assert result.exit_code == 1
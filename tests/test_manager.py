@@ -0,0 +1,209 @@
+import asyncio
+import random
+
+import pytest
+
+from psik.manager import JobManager, ordered_map
+from psik.job import JobSummary
+from psik.models import JobSpec, JobState
+
+from .test_config import mk_config
+
+@pytest.mark.asyncio
+async def test_ordered_map():
+    running = 0
+    peak = 0
+    async def work(x):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(random.random()*0.01)
+        running -= 1
+        return 2*x
+
+    ans = [y async for y in ordered_map(work, range(50), 8)]
+    assert ans == [2*x for x in range(50)]
+    assert 1 < peak <= 8
+
+    ans = [y async for y in ordered_map(work, [], 8)]
+    assert ans == []
+
+@pytest.mark.asyncio
+async def test_ls_concurrent(tmp_path):
+    mgr = JobManager(mk_config(tmp_path))
+    stamps = []
+    for i in range(10):
+        job = await mgr.create(JobSpec(name=f"job{i}", script="true"))
+        stamps.append(job.stamp)
+    (tmp_path / "junk").mkdir()
+
+    for n in [1, 3, 32]:
+        jobs = [job async for job in mgr.ls(concurrency=n)]
+        assert [job.stamp for job in jobs] == stamps
+        assert [job.name for job in jobs] == [f"job{i}" for i in range(10)]
+
+@pytest.mark.parametrize("index", [False, True])
+@pytest.mark.asyncio
+async def test_ls_filter(tmp_path, index):
+    mgr = JobManager(mk_config(tmp_path, index=index))
+    jobs = []
+    for name in ["sweep-1", "sweep-2", "other"]:
+        jobs.append( await mgr.create(JobSpec(name=name, script="true")) )
+    await jobs[1].reached(1, JobState.active)
+    await jobs[2].reached(1, JobState.failed, "1")
+
+    async def stamps(**kws):
+        return [job.stamp async for job in mgr.ls(**kws)]
+
+    assert await stamps() == [j.stamp for j in jobs]
+    assert await stamps(name="sweep-*") == [jobs[0].stamp, jobs[1].stamp]
+    assert await stamps(state=JobState.active) == [jobs[1].stamp]
+    assert await stamps(state=[JobState.new, JobState.failed]) \
+                == [jobs[0].stamp, jobs[2].stamp]
+    assert await stamps(name="sweep-*", state=JobState.failed) == []
+    assert await stamps(backend="default") == [j.stamp for j in jobs]
+    assert await stamps(backend="other") == []
+
+    t1 = float(jobs[1].stamp)
+    assert await stamps(since=t1) == [jobs[1].stamp, jobs[2].stamp]
+    assert await stamps(until=t1) == [jobs[0].stamp]
+    assert await stamps(since=t1, until=t1+1e-4) == [jobs[1].stamp]
+
+@pytest.mark.parametrize("index", [False, True])
+@pytest.mark.asyncio
+async def test_ls_pages(tmp_path, index):
+    mgr = JobManager(mk_config(tmp_path, index=index))
+    stamps = []
+    for i in range(7):
+        job = await mgr.create(JobSpec(name=f"job{i}", script="true"))
+        stamps.append(job.stamp)
+    (tmp_path / "junk").mkdir()
+    (tmp_path / "123.x").mkdir()
+
+    async def page(**kws):
+        return [job.stamp async for job in mgr.ls(**kws)]
+
+    assert await page(limit=3, reverse=True) == stamps[:-4:-1]
+    assert await page(limit=3) == stamps[:3]
+    assert await page(limit=3, after=stamps[2]) == stamps[3:6]
+    assert await page(limit=3, after=stamps[6]) == []
+    assert await page(after=stamps[3], reverse=True) == stamps[2::-1]
+    assert await page(limit=0) == []
+
+    # walk through all pages
+    seen = []
+    cursor = None
+    while True:
+        ans = await page(limit=2, after=cursor, reverse=True)
+        if len(ans) == 0:
+            break
+        seen.extend(ans)
+        cursor = ans[-1]
+    assert seen == stamps[::-1]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("index", [False, True])
+async def test_summary(tmp_path, index):
+    mgr = JobManager(mk_config(tmp_path, index=index))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    for i in range(1, 100):
+        await job.reached(i, JobState.queued, str(i))
+
+    summary = await mgr.ls().__anext__()
+    assert isinstance(summary, JobSummary)
+    assert not hasattr(summary, "__dict__")
+    assert summary.stamp == job.stamp
+    assert summary.state == JobState.queued
+    assert summary.last.info == "99"
+    assert summary.name == "foo" # (read while listing)
+    assert summary._raw is None # (but not the rest of the spec)
+    # the full spec is read on demand, with or without an index
+    assert summary.spec.script == "true"
+
+    full = await summary
+    assert full.valid
+    assert len(full.history) == 100
+
+@pytest.mark.parametrize("index", [False, True])
+@pytest.mark.asyncio
+async def test_create_many(tmp_path, index):
+    mgr = JobManager(mk_config(tmp_path, index=index))
+    # a stamp taken by another process is skipped
+    taken = mgr.path("%.3f" % (float(mgr._next_stamp()) + 0.001))
+    await taken.mkdir()
+
+    specs = [ JobSpec(name=f"job{i}", script="true") for i in range(200) ]
+    jobs = await mgr.create_many(specs)
+    stamps = [ job.stamp for job in jobs ]
+    assert len(set(stamps)) == 200
+    assert sorted(stamps, key=float) == stamps
+    assert taken.name not in stamps
+
+    for spec, job in zip(specs, jobs):
+        assert job.valid
+        assert job.spec is spec
+        assert job.spec.directory == str(job.base/'work')
+        assert len(job.history) == 1
+        assert job.info.backend.type == "local"
+
+    listed = [ job async for job in mgr.ls() ]
+    assert [job.stamp for job in listed] == stamps
+    assert listed[5].name == "job5"
+    assert (await listed[5]).history[:] == jobs[5].history[:]
+
+@pytest.mark.asyncio
+async def test_gc(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    jobs = [ await mgr.create(JobSpec(name=f"job{i%2}", script="true"))
+             for i in range(6) ]
+    for job in jobs[:5]:
+        await job.reached(1, JobState.queued, f"id{job.stamp}")
+    for job in jobs[:3]:
+        await job.reached(1, JobState.completed)
+    await jobs[3].cancel() # queued, then canceled
+
+    stamps = [job.stamp for job in jobs]
+    assert await mgr.gc(keep_last=1, dry_run=True) == stamps[:4]
+    assert await mgr.gc(keep_last=2, dry_run=True) == stamps[:2]
+    # jobs that may still be running are not deleted
+    assert await mgr.gc(state=[JobState.queued], dry_run=True) == []
+    # age is counted from the last transition
+    t = jobs[2].history[-1].time
+    assert await mgr.gc(older_than=t, dry_run=True) == stamps[:2]
+    assert await mgr.gc(older_than=float(stamps[1]), dry_run=True) == []
+    assert all([await job.base.is_dir() for job in jobs])
+
+    assert await mgr.gc(keep_last=2, workers=2) == stamps[:2]
+    assert [not await job.base.exists() for job in jobs] == \
+                [True, True, False, False, False, False]
+    assert [job.stamp async for job in mgr.ls()] == stamps[2:]
+
+@pytest.mark.asyncio
+async def test_gc_live(tmp_path):
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="job", script="true"))
+    await job.reached(1, JobState.queued, "111")
+    await job.reached(2, JobState.queued, "112")
+    await job.reached(2, JobState.completed)
+    assert job.history.live_ids() == ["111"]
+    assert await mgr.gc(keep_last=0, dry_run=True) == []
+    # canceling the job (not yet canceled by the backend) is not enough
+    await job.reached(0, JobState.canceled)
+    assert await mgr.gc(keep_last=0, dry_run=True) == []
+
+@pytest.mark.asyncio
+async def test_gc_archived(tmp_path):
+    from time import time as timestamp
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    jobs = [ await mgr.create(JobSpec(name="job", script="true"))
+             for i in range(3) ]
+    for job in jobs:
+        await job.reached(1, JobState.queued, "id")
+        await job.cancel()
+    assert await mgr.archive(float(jobs[2].stamp)) == \
+                [job.stamp for job in jobs[:2]]
+    # archived jobs are listed from the index, but not collected
+    assert await mgr.gc(dry_run=True) == [jobs[2].stamp]
+    assert await mgr.gc() == [jobs[2].stamp]
+    assert [job.stamp async for job in mgr.ls()] == \
+                [job.stamp for job in jobs[:2]]
@@ -0,0 +1,167 @@
+import json
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
+from psik.outbox import Outbox, drain
+from psik.web import sign_message, verify_signature
+
+from .test_config import mk_config
+
+received = web.AppKey("received", list) # type: ignore[var-annotated]
+control = web.AppKey("control", dict) # type: ignore[var-annotated]
+
+async def post_cb(request):
+    ctl = request.app[control]
+    await asyncio.sleep(ctl["delay"])
+    if ctl["fail"] > 0:
+        ctl["fail"] -= 1
+        return web.Response(status=503)
+    body = await request.text()
+    verify_signature(body, "secret", request.headers["x-hub-signature-256"])
+    assert request.headers["x-extra"] == "1"
+    ctl["posts"] += 1
+    data = json.loads(body)
+    if isinstance(data, list): # a batch
+        request.app[received].extend(data)
+    else:
+        request.app[received].append(data)
+    return web.json_response({})
+
+@pytest_asyncio.fixture
+async def cb_server(aiohttp_server):
+    app = web.Application()
+    app[received] = []
+    app[control] = {"fail": 0, "delay": 0.0, "posts": 0}
+    app.router.add_post('/callback', post_cb)
+    return await aiohttp_server(app)
+
+async def mk_jobs(tmp_path, cb_server, n, **kws):
+    mgr = JobManager(mk_config(tmp_path, callback_outbox=True))
+    specs = [ JobSpec(name=f"j{i}", script="true",
+                      callback=str(cb_server.make_url("/callback")),
+                      cb_headers={"x-extra": "1"}, cb_secret="secret",
+                      **kws)
+              for i in range(n) ]
+    return mgr, await mgr.create_many(specs)
+
+states = [JobState.queued, JobState.active, JobState.completed]
+
+@pytest.mark.asyncio
+async def test_outbox(tmp_path, cb_server):
+    mgr, jobs = await mk_jobs(tmp_path, cb_server, 3)
+    outbox = Outbox(tmp_path/".outbox")
+    cb_server.app[control]["delay"] = 0.5
+
+    # recording states does not wait for the callback server
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    for state in states:
+        for job in jobs:
+            assert await job.reached(1, state)
+    assert loop.time() - t0 < 0.5
+    assert cb_server.app[received] == []
+
+    cb_server.app[control]["delay"] = 0.0
+    cb_server.app[control]["fail"] = 4
+    sent, left = await outbox.flush(min_delay=0.01)
+    assert left == 0
+    await drain(5.0)
+    assert outbox.pending() == {}
+    got = {}
+    for cb in cb_server.app[received]:
+        got.setdefault(cb["jobid"], []).append(cb["state"])
+    # each callback arrived once, in order for each job
+    assert got == dict((job.stamp, [s.value for s in states])
+                       for job in jobs)
+
+@pytest.mark.asyncio
+async def test_outbox_retry(tmp_path, cb_server):
+    mgr, jobs = await mk_jobs(tmp_path, cb_server, 2)
+    outbox = Outbox(tmp_path/".outbox")
+    cb_server.app[control]["fail"] = 10**6 # server is down
+    for job in jobs:
+        await job.reached(1, JobState.queued)
+        await job.reached(1, JobState.failed)
+    await drain(0.2)
+    assert await outbox.flush(timeout=0.3, min_delay=0.01) == (0, 4)
+    assert len(outbox.pending()[jobs[0].stamp]) == 2
+
+    # concurrent flushes deliver every message once
+    cb_server.app[control]["fail"] = 0
+    results = await asyncio.gather(outbox.flush(min_delay=0.01),
+                                   outbox.flush(min_delay=0.01))
+    assert [left for sent, left in results] == [0, 0]
+    await drain(5.0)
+    got = [(cb["jobid"], cb["state"]) for cb in cb_server.app[received]]
+    assert sorted(got) == sorted((job.stamp, s) for job in jobs
+                                 for s in ("queued", "failed"))
+
+@pytest.mark.asyncio
+async def test_outbox_batch(tmp_path, cb_server):
+    mgr, jobs = await mk_jobs(tmp_path, cb_server, 20, cb_batch=True)
+    outbox = Outbox(tmp_path/".outbox")
+    cb_server.app[control]["fail"] = 1
+    for state in states:
+        for job in jobs:
+            assert await job.reached(1, state)
+    sent, left = await outbox.flush(min_delay=0.01)
+    assert left == 0
+    await drain(5.0)
+    assert outbox.pending() == {}
+
+    got = {}
+    for cb in cb_server.app[received]:
+        got.setdefault(cb["jobid"], []).append(cb["state"])
+    assert got == dict((job.stamp, [s.value for s in states])
+                       for job in jobs)
+    assert cb_server.app[control]["posts"] <= 10 # rather than 60
+
+    # queued directly (without background delivery)
+    url = str(cb_server.make_url("/callback"))
+    for i in range(60):
+        outbox.put_sync(f"{i:02d}", url, json.dumps({"jobid": str(i)}),
+                        {"x-extra": "1"}, "secret", True)
+    outbox.put_sync("99", url, json.dumps({"jobid": "99"}),
+                    {"x-extra": "1"}, "other", True) # different endpoint
+    cb_server.app[control]["posts"] = 0
+    del cb_server.app[received][:]
+    assert await outbox.flush(min_delay=0.01, max_batch=25,
+                              timeout=1.0) == (60, 1)
+    assert cb_server.app[control]["posts"] == 3
+    assert sorted(cb["jobid"] for cb in cb_server.app[received]) \
+                == sorted(str(i) for i in range(60))
+
+@pytest.mark.asyncio
+async def test_outbox_own(tmp_path, cb_server):
+    mgr, jobs = await mk_jobs(tmp_path, cb_server, 2)
+    outbox = Outbox(tmp_path/".outbox")
+    url = str(cb_server.make_url("/callback"))
+    # queued by another process
+    body = json.dumps({"jobid": "other"})
+    outbox.put_sync(jobs[1].stamp, url, body,
+                    {"x-extra": "1",
+                     "x-hub-signature-256": sign_message(body, "secret")})
+
+    # a down server is tried once, without waiting to retry
+    cb_server.app[control]["fail"] = 10**6
+    await jobs[0].reached(1, JobState.queued)
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    await drain(5.0)
+    assert loop.time() - t0 < 1.0
+    assert cb_server.app[control]["fail"] == 10**6 - 1
+
+    # only this process's messages are sent,
+    # and never ahead of another's for the same job
+    cb_server.app[control]["fail"] = 0
+    await jobs[1].reached(1, JobState.queued)
+    await jobs[0].reached(1, JobState.active)
+    await drain(5.0)
+    assert cb_server.app[received] == []
+    assert [len(v) for v in outbox.pending().values()] == [2, 2]
+    assert await outbox.flush(min_delay=0.01, timeout=3.0) == (4, 0)
@@ -1,13 +1,17 @@
 from pathlib import Path
 import os
 import re
+import time
+import asyncio
 
 import pytest
 from typer.testing import CliRunner
 
 from psik import __version__
-from psik.psik import app
+from psik.psik import app, parse_time, parse_duration
 from psik.config import load_config
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
 
 from .test_config import write_config
 
@@ -24,6 +28,87 @@ def test_ls(tmp_path):
 
     print(result.stdout)
 
+    result = runner.invoke(app, ["ls", "--config", cfg, "--state", "active",
+                                 "--name", "x*", "--since", "7d",
+                                 "--until", "2100-01-01"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(app, ["ls", "--config", cfg, "-r", "-n", "5",
+                                 "--after", "1234.5"])
+    assert result.exit_code == 0
+
+    result = runner.invoke(app, ["ls", "--config", cfg, "--since", "7q"])
+    assert result.exit_code != 0
+
+def test_gc(tmp_path):
+    cfg = write_config(tmp_path)
+
+    result = runner.invoke(app, ["gc", "--config", cfg])
+    assert result.exit_code == 1
+
+    result = runner.invoke(app, ["gc", "--config", cfg, "--dry-run",
+                                 "--older-than", "14d", "--keep-last", "3"])
+    assert result.exit_code == 0
+    assert "Would delete 0 jobs" in result.stdout
+
+def test_wait(tmp_path):
+    cfg = write_config(tmp_path)
+    mgr = JobManager(load_config(cfg))
+    jobs = asyncio.run( mgr.create_many([JobSpec(name="foo", script="true"),
+                                         JobSpec(name="bar", script="true")]) )
+    asyncio.run( jobs[0].reached(1, JobState.completed) )
+
+    result = runner.invoke(app, ["wait", "--config", cfg, jobs[0].stamp])
+    assert result.exit_code == 0
+    assert f"{jobs[0].stamp} completed" in result.stdout
+
+    result = runner.invoke(app, ["wait", "--config", cfg, "--timeout", "0.2s",
+                                 jobs[0].stamp, jobs[1].stamp])
+    assert result.exit_code == 2
+    assert f"{jobs[1].stamp} timeout" in result.stdout
+
+    asyncio.run( jobs[1].reached(1, JobState.failed) )
+    result = runner.invoke(app, ["wait", "--config", cfg,
+                                 jobs[0].stamp, jobs[1].stamp])
+    assert result.exit_code == 1
+
+    result = runner.invoke(app, ["wait", "--config", cfg, "123"])
+    assert result.exit_code == 1
+
+def test_tail(tmp_path):
+    cfg = write_config(tmp_path)
+    mgr = JobManager(load_config(cfg))
+    job = asyncio.run( mgr.create(JobSpec(name="foo", script="true")) )
+    asyncio.run( job.reached(1, JobState.completed) )
+    (Path(job.base)/'log'/'stdout.1').write_text("hello\n")
+
+    result = runner.invoke(app, ["tail", "--config", cfg, "-f", job.stamp])
+    assert result.exit_code == 0
+    assert result.stdout == "hello\n"
+
+    result = runner.invoke(app, ["tail", "--config", cfg,
+                                 "--stream", "stdin", job.stamp])
+    assert result.exit_code != 0
+
+def test_flush_callbacks(tmp_path):
+    cfg = write_config(tmp_path)
+    result = runner.invoke(app, ["flush-callbacks", "--config", cfg])
+    assert result.exit_code == 0
+    assert "No callback outbox" in result.stdout
+
+    (load_config(cfg).prefix/".outbox").mkdir()
+    result = runner.invoke(app, ["flush-callbacks", "--config", cfg])
+    assert result.exit_code == 0
+    assert "Sent 0 callbacks, 0 still queued" in result.stdout
+
+def test_parse_time():
+    assert parse_time(None) is None
+    assert parse_time("12.5") == 12.5
+    assert parse_duration("2h") == 7200
+    assert parse_duration("1.5d") == 1.5*86400
+    assert abs(parse_time("1d") - (time.time() - 86400)) < 10
+    assert parse_time("2025-10-01") > 1.7e9
+
 def test_app(tmp_path):
     cfg = write_config(tmp_path)
     config = load_config( cfg )
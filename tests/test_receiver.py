@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from psik.manager import JobManager
+from psik.job import Job
+from psik.models import JobSpec, JobState, Callback
+from psik.server import make_app
+from psik.receiver import Receiver
+from psik.web import sign_message
+
+from .test_config import mk_config
+
+def signed(cb, secret):
+    body = cb.model_dump_json()
+    return dict(data=body, headers={"content-type": "application/json",
+                       "x-hub-signature-256": sign_message(body, secret)})
+
+@pytest.mark.asyncio
+async def test_receive(tmp_path, aiohttp_client):
+    mgr = JobManager(mk_config(tmp_path, index=True))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true",
+                                          cb_secret=f"s{i}")
+                                  for i in range(20)])
+    client = await aiohttp_client(make_app(mgr, api=False))
+
+    states = [JobState.queued, JobState.active, JobState.completed]
+    async def report(i):
+        for state in states:
+            cb = Callback(jobid=jobs[i].stamp, jobndx=1, state=state,
+                          info=str(i))
+            resp = await client.post("/callback", **signed(cb, f"s{i}"))
+            assert resp.status == 200
+    await asyncio.gather(*[report(i) for i in range(len(jobs))])
+
+    for i, job in enumerate(jobs):
+        job = await Job(job.base)
+        assert [t.state for t in job.history[1:]] == states
+        assert job.history[-1].info == str(i)
+    listed = [ j async for j in mgr.ls(state=JobState.completed) ]
+    assert len(listed) == len(jobs)
+
+    # signature checks
+    cb = Callback(jobid=jobs[0].stamp, jobndx=2, state=JobState.queued)
+    resp = await client.post("/callback", **signed(cb, "s1"))
+    assert resp.status == 403
+    resp = await client.post("/callback", data=cb.model_dump_json())
+    assert resp.status == 403
+    resp = await client.post("/callback", data="{}")
+    assert resp.status == 400
+    cb = Callback(jobid="1234", jobndx=2, state=JobState.queued)
+    resp = await client.post("/callback", **signed(cb, "s1"))
+    assert resp.status == 404
+    assert len((await Job(jobs[0].base)).history) == 4
+
+@pytest.mark.asyncio
+async def test_receive_batch(tmp_path, aiohttp_client):
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true",
+                                          cb_secret="s" if i < 3 else "t")
+                                  for i in range(4)])
+    client = await aiohttp_client(make_app(mgr, api=False))
+
+    def batch(cbs, secret):
+        body = "[" + ",".join(cb.model_dump_json() for cb in cbs) + "]"
+        return dict(data=body, headers={"content-type": "application/json",
+                           "x-hub-signature-256": sign_message(body, secret)})
+    cbs = [ Callback(jobid=job.stamp, jobndx=1, state=state)
+            for job in jobs[:3]
+            for state in (JobState.queued, JobState.active) ]
+    resp = await client.post("/callback", **batch(cbs, "s"))
+    assert resp.status == 200
+    ans = await resp.json()
+    assert [a["stamp"] for a in ans] == [cb.jobid for cb in cbs]
+    for job in jobs[:3]:
+        job = await Job(job.base)
+        assert [t.state for t in job.history[1:]] == [JobState.queued,
+                                                      JobState.active]
+
+    # every job in a batch must match its signature
+    cbs = [ Callback(jobid=job.stamp, jobndx=1, state=JobState.completed)
+            for job in jobs[2:] ]
+    for secret in ("s", "t"):
+        resp = await client.post("/callback", **batch(cbs, secret))
+        assert resp.status == 403
+    assert len((await Job(jobs[3].base)).history) == 1
+
+@pytest.mark.asyncio
+async def test_secret_cache(tmp_path):
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true",
+                                          cb_secret=f"s{i}")
+                                  for i in range(5)])
+    recv = Receiver(mgr, cache_size=3)
+    for job in jobs + jobs[:1]:
+        cb = Callback(jobid=job.stamp, jobndx=1, state=JobState.queued)
+        body = cb.model_dump_json()
+        i = jobs.index(job)
+        await recv.receive(body, sign_message(body, f"s{i}"))
+    assert list(recv._secrets) == [jobs[3].stamp, jobs[4].stamp,
+                                   jobs[0].stamp]
+
+@pytest.mark.asyncio
+async def test_remote_callback(tmp_path, aiohttp_server):
+    (tmp_path/"local").mkdir()
+    (tmp_path/"remote").mkdir()
+    local = JobManager(mk_config(tmp_path/"local"))
+    unsigned = await local.create(JobSpec(name="unsigned", script="true"))
+    job = await local.create(JobSpec(name="foo", script="true",
+                                     cb_secret="xyz"))
+    server = await aiohttp_server(make_app(local, api=False))
+
+    # A copy of the job, running elsewhere, reports back to the original.
+    remote = JobManager(mk_config(tmp_path/"remote"))
+    url = str(server.make_url(f"/callback/{job.stamp}"))
+    copy = await remote.create(JobSpec(name="foo", script="true",
+                                       callback=url, cb_secret="xyz"))
+    assert await copy.reached(1, JobState.queued, "123")
+    await job.refresh()
+    assert job.history[-1].state == JobState.queued
+    assert job.history[-1].info == "123"
+
+    # jobs without a secret need allow_unsigned
+    url = str(server.make_url(f"/callback/{unsigned.stamp}"))
+    copy = await remote.create(JobSpec(name="unsigned", script="true",
+                                       callback=url))
+    assert not await copy.reached(1, JobState.queued, "123")
+    await server.close()
+
+    server = await aiohttp_server(make_app(local, api=False,
+                                           allow_unsigned=True))
+    url = str(server.make_url(f"/callback/{unsigned.stamp}"))
+    copy = await remote.create(JobSpec(name="unsigned", script="true",
+                                       callback=url))
+    assert await copy.reached(1, JobState.queued, "123")
+    await unsigned.refresh()
+    assert unsigned.history[-1].state == JobState.queued
+
+@pytest.mark.asyncio
+async def test_receive_duplicate(tmp_path, aiohttp_server):
+    mgr = JobManager(mk_config(tmp_path))
+    server = await aiohttp_server(make_app(mgr, api=False))
+    # a job reporting to the server of its own prefix
+    job = await mgr.create(JobSpec(name="foo", script="true",
+                                   callback=str(server.make_url("/callback")),
+                                   cb_secret="xyz"))
+    assert await job.reached(1, JobState.queued, "123")
+    await job.read_info()
+    assert [t.state for t in job.history] == [JobState.new, JobState.queued]
+
+    # callbacks are recorded at the sender's time, and only once
+    recv = Receiver(mgr)
+    cbs = [ Callback(jobid=job.stamp, jobndx=1, state=JobState.active,
+                     time=1.5) ] * 2
+    for cb in cbs:
+        body = cb.model_dump_json()
+        await recv.receive(body, sign_message(body, "xyz"))
+    await job.read_info()
+    assert [(t.state, t.time) for t in job.history[2:]] == \
+                [(JobState.active, 1.5)]
@@ -0,0 +1,93 @@
+import sys
+import json
+import asyncio
+
+import pytest
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
+from psik.server import make_app
+
+from .test_config import mk_config
+
+async def changed(client, path, etag):
+    """ Wait for the response to path to change from etag.
+    """
+    for i in range(100):
+        resp = await client.get(path, headers={"If-None-Match": etag})
+        if resp.status != 304:
+            return resp
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"{path} did not change")
+
+modes = [False]
+if sys.platform.startswith("linux"):
+    modes.append(True)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inotify", modes)
+async def test_server(tmp_path, aiohttp_client, inotify):
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true",
+                                          cb_secret="hidden")
+                                  for i in range(3)])
+    client = await aiohttp_client(make_app(mgr, interval=0.05,
+                                           inotify=inotify))
+
+    for i in range(100): # until the watcher has started
+        resp = await client.get("/jobs")
+        assert resp.status == 200
+        if "ETag" in resp.headers:
+            break
+        await asyncio.sleep(0.05)
+    etag = resp.headers["ETag"]
+    data = await resp.json()
+    assert [j["stamp"] for j in data] == [j.stamp for j in jobs]
+    assert data[0]["name"] == "j0" and data[0]["state"] == "new"
+
+    resp = await client.get("/jobs", headers={"If-None-Match": etag})
+    assert resp.status == 304
+    resp = await client.get("/jobs?state=queued&limit=1")
+    assert await resp.json() == []
+    for query in ("state=bogus", "after=abc", "limit=x", "limit=-1",
+                  "since=nan", "until=1d"):
+        resp = await client.get(f"/jobs?{query}")
+        assert resp.status == 400, query
+
+    stamp = jobs[1].stamp
+    resp = await client.get(f"/jobs/{stamp}")
+    assert resp.status == 200
+    job_etag = resp.headers["ETag"]
+    data = await resp.json()
+    assert data["spec"]["name"] == "j1"
+    assert "cb_secret" not in data["spec"]
+    assert [t["state"] for t in data["history"]] == ["new"]
+    resp = await client.get(f"/jobs/{stamp}",
+                            headers={"If-None-Match": job_etag})
+    assert resp.status == 304
+    assert (await client.get("/jobs/1234")).status == 404
+    assert (await client.get("/jobs/xyz")).status == 404
+
+    # SSE stream of updates
+    stream = await client.get(f"/events?stamp={stamp}")
+    assert stream.headers["Content-Type"] == "text/event-stream"
+    await jobs[0].reached(1, JobState.queued, "10")
+    await jobs[1].reached(1, JobState.queued, "11")
+
+    resp = await client.get(f"/jobs/{stamp}",
+                            headers={"If-None-Match": job_etag})
+    assert resp.status == 200
+    assert (await resp.json())["history"][-1]["info"] == "11"
+
+    resp = await changed(client, "/jobs", etag)
+    assert [j["state"] for j in await resp.json()] == ["queued", "queued",
+                                                       "new"]
+    event = None
+    while event is None:
+        line = (await asyncio.wait_for(stream.content.readline(), 5.0)
+               ).decode()
+        if line.startswith("data: "):
+            event = json.loads(line[6:])
+    assert event["stamp"] == stamp
+    assert event["state"] == "queued" and event["info"] == "11"
+    stream.close()
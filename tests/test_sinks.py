@@ -0,0 +1,90 @@
+import sys
+import json
+import asyncio
+
+import pytest
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
+from psik.exceptions import CallbackException
+from psik.sinks import close_sinks, load_function
+from psik.web import verify_callbacks
+
+from .test_config import mk_config
+
+@pytest.mark.asyncio
+async def test_unix_sink(tmp_path):
+    lines = []
+    async def handle(reader, writer):
+        async for line in reader:
+            lines.append(json.loads(line))
+        writer.close()
+    sock = tmp_path/"cb.sock"
+    server = await asyncio.start_unix_server(handle, path=str(sock))
+
+    (tmp_path/"jobs").mkdir()
+    mgr = JobManager(mk_config(tmp_path/"jobs",
+                               callback_outbox=True)) # (not used)
+    job = await mgr.create(JobSpec(script="true", callback=f"unix://{sock}",
+                                   cb_secret="xyz", cb_headers={"a": "b"}))
+    await job.reached(1, JobState.queued)
+    await job.reached(1, JobState.active)
+    for _ in range(100):
+        if len(lines) == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert len(lines) == 2
+    states = []
+    for line in lines:
+        assert line["headers"]["a"] == "b"
+        cbs = verify_callbacks(line["body"], "xyz",
+                               line["headers"]["x-hub-signature-256"])
+        assert cbs[0].jobid == job.stamp
+        states.append(cbs[0].state)
+    assert states == [JobState.queued, JobState.active]
+    assert list((tmp_path/"jobs"/".outbox").iterdir()) == []
+
+    # connections are reopened as needed
+    await close_sinks()
+    assert await job.reached(1, JobState.completed)
+    for _ in range(100):
+        if len(lines) == 3:
+            break
+        await asyncio.sleep(0.01)
+    assert len(lines) == 3
+    await close_sinks()
+    server.close()
+    await server.wait_closed()
+
+    sock.unlink()
+    with pytest.raises(CallbackException):
+        await job.reached(1, JobState.completed)
+
+@pytest.mark.asyncio
+async def test_py_sink(tmp_path, monkeypatch):
+    (tmp_path/"my_sink.py").write_text("""
+seen = []
+def record(cb):
+    seen.append(cb)
+async def arecord(cb):
+    seen.append(cb)
+    return cb.state.value != "failed"
+""")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(script="true",
+                                   callback="py://my_sink:record"))
+    ajob = await mgr.create(JobSpec(script="true",
+                                    callback="py://my_sink:arecord"))
+    assert await job.reached(1, JobState.queued)
+    assert await ajob.reached(1, JobState.queued)
+    assert not await ajob.reached(1, JobState.failed)
+
+    seen = sys.modules["my_sink"].seen
+    assert [(cb.jobid, cb.state) for cb in seen] == [
+                (job.stamp, JobState.queued), (ajob.stamp, JobState.queued),
+                (ajob.stamp, JobState.failed)]
+
+    for bad in ("my_sink", "my_sink:missing", "no_such_module:f"):
+        with pytest.raises((ValueError, AttributeError, ImportError)):
+            load_function(bad)
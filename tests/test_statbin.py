@@ -0,0 +1,79 @@
+from time import time as timestamp
+
+import pytest
+
+from psik.manager import JobManager
+from psik.job import Job, ArchivedJob
+from psik.models import JobSpec, JobState, Transition
+from psik.statbin import (
+    RECORD,
+    append_bin_sync,
+    read_bin_from,
+    read_last_bin_sync,
+    read_rows_sync,
+    convert,
+    is_binary,
+)
+
+from .test_config import mk_config
+
+def test_records(tmp_path):
+    trs = [ Transition(time=1.5+i, jobndx=i//2, state=s, info="x"*i)
+            for i, s in enumerate(JobState) ]
+    append_bin_sync(tmp_path, trs[:2])
+    append_bin_sync(tmp_path, trs[2:])
+    assert (tmp_path/"status.bin").stat().st_size == len(trs)*RECORD.size
+
+    rows, start, end, ino = read_bin_from(tmp_path)
+    assert rows == [(t.time, t.jobndx, t.state, t.info) for t in trs]
+    assert start == 0
+    assert read_last_bin_sync(tmp_path) == rows[-1]
+
+    # continue from the last offset, ignoring partial records
+    append_bin_sync(tmp_path, trs[:1])
+    with open(tmp_path/"status.bin", "ab") as f:
+        f.write(b"\0"*5)
+    more, start, end2, ino2 = read_bin_from(tmp_path, end, ino)
+    assert more == rows[:1] and start == end and ino2 == ino
+    assert end2 == end + RECORD.size
+
+@pytest.mark.asyncio
+async def test_binary_job(tmp_path):
+    mgr = JobManager(mk_config(tmp_path, status_format="binary", index=True))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    assert is_binary(job.base)
+    assert not await (job.base/"status.csv").exists()
+
+    other = await Job(job.base)
+    await job.reached(1, JobState.queued, "11")
+    await job.reached_many([
+            Transition(time=2.0, jobndx=1, state=JobState.active, info=""),
+            Transition(time=3.0, jobndx=1, state=JobState.completed, info="")])
+    await other.refresh()
+    assert [t.state for t in other.history] == [JobState.new,
+                JobState.queued, JobState.active, JobState.completed]
+    assert other.history[1].info == "11"
+    assert other.info.backend.type == "local"
+
+    listed = [ j async for j in mgr.ls(state=JobState.completed) ]
+    assert [j.stamp for j in listed] == [job.stamp]
+    assert await mgr.reindex() == 1
+    mgr.index = None # list by reading job directories
+    listed = [ j async for j in mgr.ls() ]
+    assert listed[0].last.state == JobState.completed
+
+    # convert to csv and back
+    rows = read_rows_sync(job.base)
+    assert convert(job.base, "csv")
+    assert not convert(job.base, "csv")
+    assert not is_binary(job.base)
+    assert read_rows_sync(job.base) == rows
+    assert (await Job(job.base)).history.rows() == rows
+    assert convert(job.base, "binary")
+    assert read_rows_sync(job.base) == rows
+
+    # archives hold csv
+    assert await mgr.archive(timestamp()+1) == [job.stamp]
+    archived = await mgr.job(job.stamp)
+    assert isinstance(archived, ArchivedJob)
+    assert archived.history.rows() == rows
@@ -1,10 +1,14 @@
 from pathlib import Path
+import os
+import asyncio
 
 import pytest
 from anyio import Path as aPath
 from anyio import open_file
 
-from psik.statfile import append_csv, read_csv, ReadLock, WriteLock
+import psik.statfile
+from psik.statfile import append_csv, append_csv_many, read_csv, read_last_csv, last_line, ReadLock, WriteLock, StatusPolicy, read_policy, write_policy
+from psik.exceptions import LockTimeoutException
 
 @pytest.mark.asyncio
 async def test_read_write_fd(tmp_path):
@@ -51,3 +55,107 @@ def test_non_async(tmp_path):
     for t in lines:
         assert len(t) == 3
         assert t[0][:3] == "101"
+
+@pytest.mark.asyncio
+async def test_read_last(tmp_path):
+    f = aPath(tmp_path) / 'data.csv'
+    await append_csv(f, 1010221.231, 'initial', 0)
+    assert await read_last_csv(f) == ['1010221.231', 'initial', '0']
+    for i in range(1000):
+        await append_csv(f, 1010222.131, 'queued', i, "x,y")
+    assert await read_last_csv(f) == ['1010222.131', 'queued', '999', 'x,y']
+
+    with open(f, 'rb') as fd:
+        assert last_line(fd, 7) == '1010222.131,queued,999,x,y'
+
+@pytest.mark.asyncio
+async def test_lock_contention(tmp_path):
+    f = Path(tmp_path) / 'data.csv'
+    f.write_text("")
+    with open(f, 'r') as held, open(f, 'r') as fd:
+        with WriteLock(held):
+            with pytest.raises(BlockingIOError):
+                with ReadLock(fd, blocking=False):
+                    pass
+            with pytest.raises(LockTimeoutException):
+                async with ReadLock(fd, timeout=0.05):
+                    pass
+            with pytest.raises(LockTimeoutException):
+                with ReadLock(fd, timeout=0.01):
+                    pass
+
+            # waiting on many locks does not occupy the executor
+            waiters = [ asyncio.ensure_future(append_csv(f, i))
+                        for i in range(50) ]
+            await asyncio.sleep(0.05)
+            loop = asyncio.get_running_loop()
+            assert await asyncio.wait_for(
+                        loop.run_in_executor(None, lambda: 1), 1.0) == 1
+            assert not any(w.done() for w in waiters)
+        await asyncio.gather(*waiters)
+    assert len(await read_csv(f)) == 50
+
+@pytest.mark.asyncio
+async def test_coalesce(tmp_path, monkeypatch):
+    writes = []
+    write_lines = psik.statfile.write_lines
+    async def count(f, lines, policy):
+        writes.append(len(lines))
+        await write_lines(f, lines, policy)
+    monkeypatch.setattr(psik.statfile, "write_lines", count)
+
+    f = aPath(tmp_path) / 'data.csv'
+    g = aPath(tmp_path) / 'other.csv'
+    await asyncio.gather(*[append_csv(f, i, 'x') for i in range(100)],
+                         append_csv_many(g, [(i, 'y') for i in range(10)]))
+    assert sorted(writes) == [10, 100]
+    rows = await read_csv(f)
+    assert sorted(int(r[0]) for r in rows) == list(range(100))
+    assert len(await read_csv(g)) == 10
+
+@pytest.mark.asyncio
+async def test_append_mode(tmp_path):
+    policy = StatusPolicy("append")
+    f = aPath(tmp_path) / 'data.csv'
+    await append_csv(f, 1.5, 0, 'new', 'a,b', policy=policy)
+    await append_csv_many(f, [(i, 'queued', 'x'*100) for i in range(100)],
+                          policy)
+    lines = (await f.read_text()).splitlines()
+    assert len(lines) == 101
+    assert all(l.startswith('~') for l in lines)
+
+    # torn and corrupted records are skipped
+    with open(f, 'a') as fd:
+        fd.write(lines[1][:-3] + lines[2] + '\n')
+        fd.write(lines[3].replace('queued', 'qu3ued') + '\n')
+        fd.write(lines[4][:20] + '\n')
+    rows = await read_csv(f)
+    assert len(rows) == 101
+    assert rows[0] == ['1.5', '0', 'new', 'a,b']
+    assert await read_last_csv(f) == ['99', 'queued', 'x'*100]
+
+    # plain lines are still read
+    await f.write_text('1.5,new,\n' + lines[1] + '\n')
+    assert await read_csv(f) == [['1.5', 'new', ''], ['0', 'queued', 'x'*100]]
+
+def test_policy(tmp_path):
+    assert read_policy(tmp_path) == StatusPolicy()
+    write_policy(tmp_path, StatusPolicy("append", 2.0))
+    assert read_policy(tmp_path) == StatusPolicy("append", 2.0)
+    write_policy(tmp_path, StatusPolicy())
+    assert read_policy(tmp_path) == StatusPolicy()
+
+@pytest.mark.asyncio
+async def test_create_lock(tmp_path):
+    from psik.statfile import CreateLock
+    path = tmp_path / 'held'
+    async with CreateLock(path):
+        assert path.exists()
+        with pytest.raises(LockTimeoutException):
+            async with CreateLock(path, timeout=0.05):
+                pass
+    assert not path.exists()
+    # left behind by a process that exited
+    path.write_text(f"{os.uname().nodename} 999999999")
+    with CreateLock(path, timeout=1.0):
+        pass
@@ -0,0 +1,50 @@
+import sys
+import asyncio
+from time import time as timestamp
+
+import pytest
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState
+from psik.tail import tail_log
+
+from .test_config import mk_config
+
+modes = [False]
+if sys.platform.startswith("linux"):
+    modes.append(True)
+
+async def collect(gen):
+    return b"".join([data async for data in gen])
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inotify", modes)
+async def test_follow(tmp_path, inotify):
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="foo", script="true"))
+    log = job.base/'log'
+    await job.reached(1, JobState.active)
+    await (log/'stdout.1').write_bytes(b"one\n")
+
+    task = asyncio.ensure_future(collect(
+                    tail_log(job, follow=True, interval=0.05,
+                             inotify=inotify, chunk=3)))
+    await asyncio.sleep(0.1)
+    with open(log/'stdout.1', 'ab') as f:
+        f.write(b"two\n")
+    await asyncio.sleep(0.1)
+    assert not task.done()
+
+    # the job is requeued as a new run
+    await job.reached(2, JobState.active)
+    await (log/'stdout.2').write_bytes(b"three\n")
+    await job.reached(2, JobState.completed)
+    assert await asyncio.wait_for(task, 5.0) == b"one\ntwo\nthree\n"
+
+    # without following, only the latest run is shown
+    assert await collect(tail_log(job)) == b"three\n"
+    assert await collect(tail_log(job, "stderr")) == b""
+
+    assert await mgr.archive(timestamp()+1) == [job.stamp]
+    archived = await mgr.job(job.stamp)
+    assert await collect(tail_log(archived, follow=True)) == b"three\n"
@@ -0,0 +1,147 @@
+import sys
+import asyncio
+
+import pytest
+
+from psik.manager import JobManager
+from psik.models import JobSpec, JobState, Transition
+
+from .test_config import mk_config
+
+async def collect(gen, n):
+    ans = []
+    async for ev in gen:
+        ans.append(ev)
+        if len(ans) == n:
+            break
+    return ans
+
+modes = [False]
+if sys.platform.startswith("linux"):
+    modes.append(True)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inotify", modes)
+@pytest.mark.parametrize("layout", ["flat", "date"])
+async def test_watch(tmp_path, inotify, layout):
+    mgr = JobManager(mk_config(tmp_path, layout=layout))
+    old = await mgr.create(JobSpec(name="old", script="true"))
+    await old.reached(1, JobState.queued, "11")
+
+    gen = mgr.watch(interval=0.05, inotify=inotify)
+    task = asyncio.ensure_future(collect(gen, 5))
+    await asyncio.sleep(0.2) # let the watcher start
+
+    await old.reached(1, JobState.active)
+    new = await mgr.create(JobSpec(name="new", script="true"))
+    await asyncio.sleep(0.1)
+    await new.reached_many([
+        Transition(time=1.0, jobndx=1, state=JobState.queued, info="12"),
+        Transition(time=2.0, jobndx=1, state=JobState.failed, info="1")])
+    await old.reached(1, JobState.completed)
+
+    events = await asyncio.wait_for(task, 5.0)
+    await gen.aclose()
+    # only new rows are seen, in order for each job
+    seen = {old.stamp: [], new.stamp: []}
+    for stamp, trs in events:
+        seen[stamp].append(trs.state)
+    assert seen[old.stamp] == [JobState.active, JobState.completed]
+    assert seen[new.stamp] == [JobState.new, JobState.queued,
+                               JobState.failed]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("inotify", modes)
+async def test_manager_wait(tmp_path, inotify, monkeypatch):
+    import psik.manager
+    from psik.watch import changes
+    monkeypatch.setattr(psik.manager, "changes",
+                        lambda dirs, interval: changes(dirs, interval,
+                                                       inotify=inotify))
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true")
+                                  for i in range(4)])
+    stamps = [job.stamp for job in jobs]
+    await jobs[0].reached(1, JobState.completed)
+
+    async def finish():
+        await asyncio.sleep(0.1)
+        await jobs[1].reached(1, JobState.active)
+        await jobs[1].reached(1, JobState.completed)
+        await jobs[2].reached(0, JobState.canceled)
+    task = asyncio.ensure_future(finish())
+    done = await mgr.wait(stamps, timeout=1.0, interval=0.1)
+    await task
+    assert sorted(done) == stamps[:3]
+    assert done[stamps[1]].state == JobState.completed
+    assert done[stamps[2]].state == JobState.canceled
+
+    done = await mgr.wait(stamps[3:], [JobState.new])
+    assert done[stamps[3]].state == JobState.new
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="requires inotify")
+@pytest.mark.parametrize("layout", ["flat", "date"])
+async def test_watch_limit(tmp_path, layout, monkeypatch, caplog):
+    import errno
+    from psik.watch import Inotify
+    add_watch = Inotify.add_watch
+    added = []
+    def limited(self, path, mask):
+        if len(added) >= 3:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        added.append(path)
+        return add_watch(self, path, mask)
+    monkeypatch.setattr(Inotify, "add_watch", limited)
+
+    mgr = JobManager(mk_config(tmp_path, layout=layout))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true")
+                                  for i in range(5)])
+    gen = mgr.watch(interval=0.05, inotify=True)
+    task = asyncio.ensure_future(collect(gen, 6))
+    await asyncio.sleep(0.2) # let the watcher start
+
+    for job in jobs:
+        await job.reached(1, JobState.queued, "11")
+    new = await mgr.create(JobSpec(name="new", script="true"))
+    events = await asyncio.wait_for(task, 5.0)
+    await gen.aclose()
+    assert sorted(stamp for stamp, _ in events) == \
+                sorted([job.stamp for job in jobs] + [new.stamp])
+    warnings = [r for r in caplog.records if "inotify watches" in r.message]
+    assert len(warnings) == 1
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="requires inotify")
+async def test_changes_missed(tmp_path, monkeypatch):
+    # writes inotify never reports (e.g. from another NFS client)
+    # are found by the periodic re-check
+    from psik.watch import Inotify, changes
+    monkeypatch.setattr(Inotify, "read", lambda self: [])
+    mgr = JobManager(mk_config(tmp_path))
+    jobs = await mgr.create_many([JobSpec(name=f"j{i}", script="true")
+                                  for i in range(2)])
+    gen = changes(set(job.base for job in jobs), 0.1, inotify=True)
+    assert len(await gen.__anext__()) == 2
+    await jobs[1].reached(1, JobState.queued)
+    assert await asyncio.wait_for(gen.__anext__(), 1.0) == [jobs[1].base]
+    await gen.aclose()
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not sys.platform.startswith("linux"),
+                    reason="requires inotify")
+async def test_watch_missed(tmp_path, monkeypatch):
+    from psik.watch import Inotify
+    mgr = JobManager(mk_config(tmp_path))
+    job = await mgr.create(JobSpec(name="j", script="true"))
+    gen = mgr.watch(interval=0.05, inotify=True)
+    task = asyncio.ensure_future(collect(gen, 1))
+    await asyncio.sleep(0.2) # let the watcher start
+    monkeypatch.setattr(Inotify, "read", lambda self: [])
+    await job.reached(1, JobState.queued)
+    events = await asyncio.wait_for(task, 5.0)
+    await gen.aclose()
+    assert [(stamp, trs.state) for stamp, trs in events] == \
+                [(job.stamp, JobState.queued)]
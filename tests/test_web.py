@@ -1,3 +1,4 @@
+import sys
 import asyncio
 
 import pytest
@@ -10,6 +11,8 @@ from psik.web import (
     sign_message,
     verify_signature,
     post_json,
+    session_pool,
+    close_sessions,
     #get_json,
 )
 
@@ -61,3 +64,80 @@ async def test_local_cb(cb_server): #cb_client):
                 "secret token")
     assert isinstance(cb_server.app[cb_value], dict)
     assert cb_server.app[cb_value]["name"] == "hello"
+
+peers = web.AppKey("peers", list) # type: ignore[var-annotated]
+
+async def count_peer(request):
+    request.app[peers].append(request.transport.get_extra_info("peername"))
+    return web.json_response({"ok": True})
+
+def peer_app():
+    app = web.Application()
+    app[peers] = []
+    app.router.add_post('/callback', count_peer)
+    return app
+
+@pytest.mark.asyncio
+async def test_session_pool(aiohttp_server):
+    server = await aiohttp_server(peer_app())
+    url = str(server.make_url("/callback"))
+    for i in range(3):
+        assert await post_json(url, '{}', "secret") == {"ok": True}
+    # all requests used one connection
+    assert len(set(server.app[peers])) == 1
+    pool = session_pool()
+    session = await pool.get(str(server.make_url("")).rstrip("/"))
+    assert len(pool._sessions) == 1
+
+    await close_sessions()
+    assert session.closed
+    assert await post_json(url, '{}') == {"ok": True}
+
+def test_session_shutdown():
+    async def post():
+        runner = web.AppRunner(peer_app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        base = f"http://127.0.0.1:{port}"
+        await post_json(base + "/callback", '{}')
+        session = await session_pool().get(base)
+        await runner.cleanup()
+        return session
+    session = asyncio.run(post())
+    assert session.closed
+
+@pytest.mark.asyncio
+async def test_certified_session(aiohttp_server, monkeypatch):
+    # A stand-in for certified.Certified, whose ClientSession
+    # is an async context manager.
+    import types, contextlib
+    import aiohttp
+    import psik.web
+    opened = []
+    class Certified:
+        @contextlib.asynccontextmanager
+        async def ClientSession(self, base):
+            async with aiohttp.ClientSession(base) as session:
+                opened.append(session)
+                await asyncio.sleep(0.05) # (slow to open)
+                yield session
+    mod = types.ModuleType("certified")
+    mod.Certified = Certified # type: ignore[attr-defined]
+    monkeypatch.setitem(sys.modules, "certified", mod)
+    psik.web._certified.cache_clear()
+    try:
+        await close_sessions()
+        server = await aiohttp_server(peer_app())
+        url = str(server.make_url("/callback"))
+        # concurrent first requests share one session
+        results = await asyncio.gather(*[post_json(url, '{}', "secret")
+                                         for i in range(4)])
+        assert results == [{"ok": True}]*4
+        assert await post_json(url, '{}', "secret") == {"ok": True}
+        assert len(opened) == 1
+        await close_sessions()
+        assert opened[0].closed
+    finally:
+        psik.web._certified.cache_clear()